@@ -1,3 +1,6 @@
+from array import array
+from bisect import bisect_right
+
 from .forth import *
 from .model import ImageVisitor
 
@@ -15,19 +18,52 @@ class WordMetaData(object):
         return self.start_address <= address and address <= self.end_address
 
 class CompilerMetadata(object):
+    """Symbol table of a compiled image.
+
+    Besides the list of words in the order they were added, the start
+    addresses of the words are kept sorted in a compact array, with the
+    words in the same order, to find the word an address belongs to with a
+    binary search. Words are expected not to overlap. The end address of a
+    word may be set after it is added.
+    """
     def __init__(self, start_of_user_area):
         self.words_metadata = []
         self.start_of_user_area = start_of_user_area
         self.user_address = self.start_of_user_area
+        self.sorted_start_addresses = array("q")
+        self.sorted_words_metadata = []
 
     def add_word_meta(self, word_meta):
         self.words_metadata.append(word_meta)
+        start_address = word_meta.start_address
+        if not self.sorted_start_addresses or start_address >= self.sorted_start_addresses[-1]:
+            # Words are compiled one after the other, this is the usual case.
+            self.sorted_start_addresses.append(start_address)
+            self.sorted_words_metadata.append(word_meta)
+        else:
+            index = bisect_right(self.sorted_start_addresses, start_address)
+            self.sorted_start_addresses.insert(index, start_address)
+            self.sorted_words_metadata.insert(index, word_meta)
 
     def last(self):
         return self.words_metadata[-1]
 
     def word_address_belongs_to(self, address):
-        return next(m for m in self.words_metadata if m.is_part_of_code(address))
+        """Returns the metadata of the word whose code contains address.
+
+        Raises:
+            StopIteration: When address is not part of the code of a word.
+        """
+        index = bisect_right(self.sorted_start_addresses, address) - 1
+        if index >= 0:
+            # Of the words starting at the same address, the first added wins.
+            start_address = self.sorted_start_addresses[index]
+            while index > 0 and self.sorted_start_addresses[index-1] == start_address:
+                index -= 1
+            word_meta = self.sorted_words_metadata[index]
+            if word_meta.end_address is not None and address <= word_meta.end_address:
+                return word_meta
+        raise StopIteration(address)
 
 class AbstractCompiler(MemoryManipulator):
     def compile_primitive(self, name, compile_only=False, immediate=False):
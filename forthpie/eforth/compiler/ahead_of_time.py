@@ -0,0 +1,371 @@
+"""Ahead of time compilation of Forth sources.
+
+The VM reads its sources line by line in the TIB and interprets them word by
+word. This module does the same job on the host: it splits a source into
+items (colon definitions, VARIABLE, CREATE and lines to interpret) and turns
+the items it understands into ColonWord objects, to be compiled with an
+ImageCompiler. The items it does not understand (anything that needs to run
+Forth code at compile time) are left to the VM.
+"""
+from ...compiler import WordNotInDictionary
+from ...model import WordsSet, ColonWord, WordReference, Label, LabelReference
+
+# The VM reads at most TIB_LINE_LENGTH characters per line (see QUERY).
+TIB_LINE_LENGTH = 80
+BL = 32
+LF = 10
+BACKSPACE = 8
+
+# Words parsing the rest of the source up to a delimiter, see PARSE.
+COMMENTS = {"(": ")", "\\": None, ".(": ")"}
+STRINGS = {'."': '."|', '$"': '$"|', 'ABORT"': 'abort"'}
+
+LEXICON_FLAGS = ("IMMEDIATE", "COMPILE_ONLY")
+
+class UnsupportedSource(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+
+class Token(object):
+    """A word of the source, with the text parsed after it by the parsing
+    words (comments and strings).
+    """
+    def __init__(self, text, line, start, end, argument=None):
+        self.text = text
+        self.line = line
+        self.start = start
+        self.end = end
+        self.argument = argument
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self.text})"
+
+class SourceItem(object):
+    """A part of the source the VM interprets on its own: a colon
+    definition, a VARIABLE, a CREATE or the rest of a line.
+    """
+    COLON = "colon"
+    VARIABLE = "VARIABLE"
+    CREATE = "CREATE"
+    OTHER = "other"
+
+    def __init__(self, kind, tokens, end=None):
+        self.kind = kind
+        self.tokens = tokens
+        self.start = (tokens[0].line, tokens[0].start)
+        self.end = end if end is not None else (tokens[-1].line, tokens[-1].end)
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self.kind}, {' '.join(t.text for t in self.tokens)})"
+
+def tib_lines(source):
+    """Split source in the lines the VM reads in its TIB, see accept and
+    kTAP: a line ends with LF or after TIB_LINE_LENGTH characters, backspace
+    erases the previous character and the other control characters are read
+    as blanks.
+    """
+    lines = []
+    line = []
+    for character in source:
+        code = ord(character)
+        if code == LF:
+            lines.append("".join(line))
+            line = []
+            continue
+        if code == BACKSPACE:
+            if line:
+                line.pop()
+            continue
+        line.append(character if BL <= code < 127 else " ")
+        if len(line) == TIB_LINE_LENGTH:
+            lines.append("".join(line))
+            line = []
+    if line:
+        lines.append("".join(line))
+    return lines
+
+def parse(line, start, delimiter):
+    """Returns the end of the text starting at start in line and delimited
+    by delimiter, and the index following the delimiter, see parse.
+    """
+    end = line.find(delimiter, start)
+    if end == -1:
+        return len(line), len(line)
+    return end, end+1
+
+def tokens(lines):
+    """Yields the tokens of lines, the text parsed by comments and strings
+    words is in their argument.
+    """
+    for line_index, line in enumerate(lines):
+        index = 0
+        while True:
+            while index < len(line) and ord(line[index]) <= BL:
+                index += 1
+            if index == len(line):
+                break
+            start = index
+            while index < len(line) and ord(line[index]) > BL:
+                index += 1
+            text = line[start:index]
+            # Skip the delimiter following the word, as TOKEN does.
+            argument_start = min(index+1, len(line))
+            argument = None
+            if text in COMMENTS or text in STRINGS:
+                delimiter = COMMENTS.get(text, '"')
+                if delimiter is None:
+                    argument_end, index = len(line), len(line)
+                else:
+                    argument_end, index = parse(line, argument_start, delimiter)
+                argument = line[argument_start:argument_end]
+            yield Token(text, line_index, start, index, argument)
+
+class AheadOfTimeCompiler(object):
+    """Compile Forth sources on top of the dictionary of compiler without
+    running the VM.
+
+    Args:
+        compiler (Compiler): The compiler of the image to extend.
+        base (int): The value of BASE when the sources are interpreted.
+    """
+    # Immediate words this compiler knows how to run at compile time.
+    COMPILE_TIME_WORDS = (
+        ";", "IF", "ELSE", "THEN", "AHEAD", "BEGIN", "WHILE", "REPEAT",
+        "UNTIL", "AGAIN", "FOR", "AFT", "NEXT", "[COMPILE]", "RECURSE"
+    ) + tuple(STRINGS)
+
+    def __init__(self, compiler, base=10):
+        self.compiler = compiler
+        self.base = base
+        self.builtin_tokens = dict()
+        for word_meta in compiler.compiler_metadata.words_metadata:
+            if word_meta.name not in self.builtin_tokens:
+                self.builtin_tokens[word_meta.name] = word_meta.start_address
+
+    def items(self, lines):
+        """Yields the items of the source split in lines.
+        """
+        pending = list(tokens(lines))
+        index = 0
+        while index < len(pending):
+            token = pending[index]
+            if token.text in COMMENTS and token.text != ".(":
+                index += 1
+                continue
+            if token.text == ":":
+                end = index
+                while end < len(pending) and pending[end].text != ";":
+                    end += 1
+                end += 1
+                while end < len(pending) and pending[end].text in LEXICON_FLAGS:
+                    end += 1
+                yield SourceItem(SourceItem.COLON, pending[index:end])
+                index = end
+            elif token.text in (SourceItem.VARIABLE, SourceItem.CREATE):
+                end = index+1
+                if end < len(pending) and pending[end].line == token.line:
+                    end += 1
+                yield SourceItem(token.text, pending[index:end])
+                index = end
+            else:
+                # Words run at top level may parse the rest of the line.
+                end = index
+                while end < len(pending) and pending[end].line == token.line:
+                    end += 1
+                yield SourceItem(
+                    SourceItem.OTHER,
+                    pending[index:end],
+                    end=(token.line, len(lines[token.line]))
+                )
+                index = end
+
+    def name_token(self, name):
+        try:
+            return self.compiler.name_token(WordReference(name))
+        except WordNotInDictionary:
+            return None
+
+    def is_builtin(self, name):
+        """Is the word named name the one of the bootstrapped image? The
+        semantic of the builtin words is known, the one of their
+        redefinitions is not.
+        """
+        name_token = self.name_token(name)
+        return (name_token is not None
+                and self.compiler.read_execution_token_address(name_token)
+                    == self.builtin_tokens.get(name))
+
+    def is_immediate(self, name_token):
+        return bool(self.compiler.read_metadata_byte(name_token) & self.compiler.IMMEDIATE)
+
+    def number(self, text):
+        """Returns the value of the literal text as NUMBER? reads it, or None
+        if text is not a number.
+        """
+        base = self.base
+        if text.startswith("$"):
+            base = 16
+            text = text[1:]
+        negative = text.startswith("-")
+        if negative:
+            text = text[1:]
+        if not text:
+            return None
+        value = 0
+        for character in text:
+            digit = ord(character) - ord("0")
+            if digit > 9:
+                digit -= 7
+                if digit < 10:
+                    return None
+            if not 0 <= digit < base:
+                return None
+            value = value * base + digit
+        if negative:
+            value = -value
+        # Literals are compiled as signed cells.
+        bits = 8 * self.compiler.cell_size
+        value &= (1 << bits) - 1
+        if value >= 1 << (bits-1):
+            value -= 1 << bits
+        return value
+
+    def definition_name(self, item):
+        if len(item.tokens) < 2 or item.tokens[1].line != item.tokens[0].line:
+            raise UnsupportedSource(f"{item.tokens[0].text} without a name")
+        name = item.tokens[1].text
+        if len(name) > self.compiler.MAX_NAME_LENGTH:
+            raise UnsupportedSource(f"{name} is too long")
+        if self.name_token(name) is not None:
+            # The VM warns about the redefinition.
+            raise UnsupportedSource(f"{name} is redefined")
+        if not self.is_builtin(item.tokens[0].text):
+            raise UnsupportedSource(f"{item.tokens[0].text} is redefined")
+        return name
+
+    def words_set(self, item):
+        """Returns the WordsSet defined by item.
+
+        Raises:
+            UnsupportedSource: When item needs the VM to be interpreted.
+        """
+        if item.kind == SourceItem.OTHER:
+            raise UnsupportedSource(f"{item.tokens[0].text} is interpreted")
+        name = self.definition_name(item)
+        if item.kind == SourceItem.VARIABLE:
+            word = ColonWord(name, [WordReference("doVAR"), 0])
+        elif item.kind == SourceItem.CREATE:
+            word = ColonWord(name, [WordReference("doVAR")])
+        else:
+            word = self.colon_word(name, item.tokens[2:])
+        return WordsSet(name, word)
+
+    def colon_word(self, name, body):
+        tokens = []
+        # Stack of the (kind, label name) pairs IF, BEGIN, ... leave to the
+        # words resolving them, kind is "orig" for a branch to resolve and
+        # "dest" for a branch target.
+        control_stack = []
+        labels_count = 0
+
+        def new_label():
+            nonlocal labels_count
+            labels_count += 1
+            return f"AOT{labels_count}"
+
+        def orig(branch):
+            label = new_label()
+            tokens.extend([WordReference(branch), LabelReference(label)])
+            control_stack.append(("orig", label))
+
+        def dest():
+            label = new_label()
+            tokens.append(Label(label))
+            control_stack.append(("dest", label))
+
+        def pop(kind):
+            if not control_stack or control_stack[-1][0] != kind:
+                raise UnsupportedSource(f"unbalanced control structure in {name}")
+            return control_stack.pop()[1]
+
+        def swap():
+            if len(control_stack) < 2:
+                raise UnsupportedSource(f"unbalanced control structure in {name}")
+            control_stack[-2:] = control_stack[-1:-3:-1]
+
+        index = 0
+        while index < len(body):
+            token = body[index]
+            text = token.text
+            index += 1
+            if text in COMMENTS and text != ".(":
+                continue
+            name_token = self.name_token(text)
+            if name_token is None:
+                value = self.number(text)
+                if value is None:
+                    raise UnsupportedSource(f"{text} is undefined")
+                tokens.extend([WordReference("doLIT"), value])
+                continue
+            if not self.is_immediate(name_token):
+                tokens.append(WordReference(text))
+                continue
+            if text not in self.COMPILE_TIME_WORDS or not self.is_builtin(text):
+                raise UnsupportedSource(f"{text} runs at compile time")
+
+            if text == ";":
+                break
+            elif text in STRINGS:
+                tokens.extend([WordReference(STRINGS[text]), token.argument])
+            elif text == "IF":
+                orig("?branch")
+            elif text == "AHEAD":
+                orig("branch")
+            elif text == "THEN":
+                tokens.append(Label(pop("orig")))
+            elif text == "ELSE":
+                orig("branch")
+                swap()
+                tokens.append(Label(pop("orig")))
+            elif text in ("BEGIN", "FOR"):
+                if text == "FOR":
+                    tokens.append(WordReference(">R"))
+                dest()
+            elif text in ("UNTIL", "AGAIN", "NEXT"):
+                branch = {"UNTIL": "?branch", "AGAIN": "branch", "NEXT": "next"}[text]
+                tokens.extend([WordReference(branch), LabelReference(pop("dest"))])
+            elif text == "WHILE":
+                orig("?branch")
+                swap()
+            elif text == "REPEAT":
+                tokens.extend([WordReference("branch"), LabelReference(pop("dest"))])
+                tokens.append(Label(pop("orig")))
+            elif text == "AFT":
+                pop("dest")
+                orig("branch")
+                dest()
+                swap()
+            elif text == "[COMPILE]":
+                if (index == len(body) or body[index].line != token.line
+                        or self.name_token(body[index].text) is None):
+                    raise UnsupportedSource(f"[COMPILE] without a word in {name}")
+                tokens.append(WordReference(body[index].text))
+                index += 1
+            elif text == "RECURSE":
+                # The header of the word is compiled before its body.
+                tokens.append(WordReference(name))
+        else:
+            raise UnsupportedSource(f"{name} does not end with ;")
+
+        if control_stack:
+            raise UnsupportedSource(f"unbalanced control structure in {name}")
+        tokens.append(WordReference("EXIT"))
+
+        immediate = False
+        compile_only = False
+        for token in body[index:]:
+            if self.name_token(token.text) is None:
+                raise UnsupportedSource(f"{token.text} is undefined")
+            immediate = immediate or token.text == "IMMEDIATE"
+            compile_only = compile_only or token.text == "COMPILE_ONLY"
+        return ColonWord(name, tokens, compile_only=compile_only, immediate=immediate)
@@ -1,5 +1,6 @@
 from ...compiler import AbstractCompiler, CompilerMetadata, WordMetaData, WordNotInDictionary
 from ...model import WordReference, Label, LabelReference, Byte, Align
+from ...superinstructions import fuse_at, reads_inline_cell
 
 class Compiler(AbstractCompiler):
     """Compiler for the EForth dictionary format.
@@ -16,14 +17,23 @@ class Compiler(AbstractCompiler):
                  initial_name_address,
                  initial_user_address,
                  memory,
-                 primitives_provider):
+                 primitives_provider,
+                 superinstructions=()):
         self.cell_size = cell_size
         self.code_address = initial_code_address
         self.name_address = initial_name_address
         self.user_address = initial_user_address
         self.memory = memory
         self.primitives_provider = primitives_provider
+        self.superinstructions = superinstructions
+        self.superinstructions_tokens = dict()
         self._compiler_metadata = CompilerMetadata(initial_user_address)
+        # Maps names to the latest entry with this name, as the walk of the
+        # name dictionary from name_index_head in name_index_memory finds
+        # them.
+        self.name_index = dict()
+        self.name_index_memory = None
+        self.name_index_head = None
 
     @property
     def compiler_metadata(self):
@@ -33,6 +43,9 @@ class Compiler(AbstractCompiler):
     def get_primitive_by_name(self, name):
         return self.primitives_provider.get_primitive_by_name(name)
 
+    def get_primitive_by_address(self, address):
+        return self.primitives_provider.get_primitive_by_address(address)
+
     def read_metadata_byte(self, entry_address):
         return self.memory[entry_address+2*self.cell_size]
 
@@ -95,11 +108,28 @@ class Compiler(AbstractCompiler):
         current_address = self.name_address
         while current_address != 0:
             yield current_address
+            # The first entry links to an empty entry which link is 0.
+            if self.read_cell_at_address(current_address+self.cell_size) == 0:
+                return
             current_address = self.read_previous_entry_address(current_address)
 
+    def rebuild_name_index(self):
+        """Rebuild the map from names to name dictionary entries from the
+        entries in memory, for instance after the VM changed the name
+        dictionary. Entries shadow the older ones with the same name.
+        """
+        self.name_index = dict()
+        for name_token in self.name_tokens_iterator():
+            self.name_index.setdefault(self.read_word_name(name_token), name_token)
+        self.name_index_memory = self.memory
+        self.name_index_head = self.name_address
+
     def name_token(self, word_reference):
         """Retrieve the name token from a word_reference object and returns it.
 
+        The name index is rebuilt first if the memory or the head of the name
+        dictionary changed since it was last updated.
+
         Args:
             word_reference (WordReference): The word reference to retrieve the
             name token from.
@@ -111,11 +141,12 @@ class Compiler(AbstractCompiler):
         Returns:
             int: The address of the name token found.
         """
-        for name_token in self.name_tokens_iterator():
-            if self.read_word_name(name_token) == word_reference.name:
-                return name_token
-
-        raise WordNotInDictionary(word_reference.name)
+        if self.name_index_memory is not self.memory or self.name_index_head != self.name_address:
+            self.rebuild_name_index()
+        try:
+            return self.name_index[word_reference.name]
+        except KeyError:
+            raise WordNotInDictionary(word_reference.name)
 
     def lookup_word(self, word_reference):
         """Lookup a word execution token from a word_reference object and
@@ -184,7 +215,9 @@ class Compiler(AbstractCompiler):
         if name_length > self.MAX_NAME_LENGTH:
             raise Exception("Name too long, can not be compiled.")
 
-        self.name_address -= name_length + 3 * self.cell_size
+        # Same size as the entries $,n compiles, so that the entries stay
+        # aligned.
+        self.name_address -= (3 + name_length // self.cell_size) * self.cell_size
 
         # Encoding execution token.
         self.write_cell_at_address(self.name_address, code_address)
@@ -207,6 +240,15 @@ class Compiler(AbstractCompiler):
                                    name):
             self.memory[address] = ord(letter)
 
+        # Clear the filler, the VM compares names cell by cell and may have
+        # parsed words in this area already.
+        for address in range(name_stop_address, previous_name_address):
+            self.memory[address] = 0
+
+        if self.name_index_memory is self.memory and self.name_index_head == previous_name_address:
+            self.name_index[name] = self.name_address
+            self.name_index_head = self.name_address
+
     def compile_code_header(self, compile_only, immediate, name, primitive_name):
         """Compile a colon definition header.
 
@@ -285,10 +327,44 @@ class Compiler(AbstractCompiler):
 
         return label_addresses
 
+    def superinstructions_candidates(self):
+        """Returns the (superinstruction, execution token) pairs for the
+        superinstructions already compiled in the dictionary.
+        """
+        candidates = []
+        for superinstruction in self.superinstructions:
+            if superinstruction.name not in self.superinstructions_tokens:
+                try:
+                    self.superinstructions_tokens[superinstruction.name] = \
+                        self.lookup_word(WordReference(superinstruction.name))
+                except WordNotInDictionary:
+                    continue
+            candidates.append(
+                (superinstruction, self.superinstructions_tokens[superinstruction.name])
+            )
+        return candidates
+
+    def fuse_superinstructions(self, tokens_addresses):
+        """Replace the sequences of tokens starting at tokens_addresses by
+        superinstructions when possible.
+        """
+        candidates = self.superinstructions_candidates()
+        if not candidates:
+            return
+        for address in tokens_addresses:
+            fuse_at(self, self, address, candidates)
+
     def compile_word_body(self, tokens):
         label_addresses = self.resolve_labels_addresses(tokens)
+        # Addresses of the cells holding word references that are run by the
+        # inner interpreter, as opposed to the ones used as inline data.
+        tokens_addresses = []
+        inline_cell_expected = False
 
         for token in tokens:
+            is_inline_cell = inline_cell_expected
+            inline_cell_expected = False
+
             if isinstance(token, str):
                 self.memory[self.code_address] = len(token)
                 self.code_address += 1
@@ -307,6 +383,9 @@ class Compiler(AbstractCompiler):
 
             elif isinstance(token, WordReference):
                 address = self.lookup_word(token)
+                if self.superinstructions and not is_inline_cell:
+                    tokens_addresses.append(self.code_address)
+                    inline_cell_expected = reads_inline_cell(self, self, address)
                 self.write_cell_at_address(self.code_address, address)
                 self.code_address += self.cell_size
 
@@ -330,6 +409,8 @@ class Compiler(AbstractCompiler):
             else:
                 raise Exception(f"Unknown token: {token}")
 
+        self.fuse_superinstructions(tokens_addresses)
+
     def compile_colon(self, name, tokens, compile_only=False, immediate=False):
         self.compile_colon_header(compile_only, immediate, name)
         self.compile_word_body(tokens)
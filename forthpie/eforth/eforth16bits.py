@@ -1,13 +1,31 @@
+import io
+import os
 import sys
+import hashlib
 import logging
+from pathlib import Path
 
-from ..forth import Memory
+from ..forth import Memory, CheckedMemory
 from .. import forth as interpreters
-from ..compiler import ImageCompiler
+from ..compiler import ImageCompiler, WordMetaData
+from ..image_file import ImageFile, ImageFormat, is_image_file
+from ..module_file import ModuleFile, NotRelocatable, IncompatibleModule
+from ..image_cache import ImageCache
+from .. import model, compiler as abstract_compiler, primitives, superinstructions
+from .images import forthpie as forthpie_image
+from .compiler import by_the_book as by_the_book_compiler
+from .compiler import ahead_of_time as ahead_of_time_compiler
+from .primitives import by_the_book as by_the_book_primitives
+from .primitives import superinstructions as superinstructions_primitives
+from .primitives import forthpie as forthpie_primitives
+from .primitives import file_access as file_access_primitives
+from .primitives import blocks as blocks_primitives
+from .primitives import memory_allocation as memory_allocation_primitives
 from ..model import WR
 # from .images.by_the_book import by_the_book_eforth_image as image_builder
 from .images.forthpie import forthpie_eforth_image as image_builder
-from .primitives.by_the_book import primitives_store as by_the_book_primitives_store
+from .primitives.forthpie import primitives_store as forthpie_primitives_store
+from .primitives.superinstructions import SUPERINSTRUCTIONS
 from .compiler.by_the_book import Compiler
 
 CELL_SIZE = 2
@@ -23,10 +41,64 @@ SPP = TIBB-8*CELL_SIZE # 0x3E7F # start of data stack (SP0)
 UPP = EM-256*CELL_SIZE # 0x3F80 # start of user area (UP0)
 NAMEE = UPP-8*CELL_SIZE # 0x3BFF # name dictionary
 CODEE = COLDD+US # 0x180 # code dictionary
+# Offset of the CP and NP user variables from the start of the user area,
+# after the 4 boot cells, the 19 cells of SP0..HANDLER, CONTEXT and CURRENT.
+CP_OFFSET = (4+19+VOCSS+2)*CELL_SIZE
+NP_OFFSET = CP_OFFSET+CELL_SIZE
+LAST_OFFSET = NP_OFFSET+CELL_SIZE
+CURRENT_OFFSET = CP_OFFSET-2*CELL_SIZE
+BASE_OFFSET = (4+8)*CELL_SIZE
+# Cells of the user area interpreting a source changes without any lasting
+# effect: boot cells, tmp, SPAN, >IN, #TIB, CSP, 'EVAL, HLD, HANDLER, and
+# the dictionary pointers CP, NP and LAST.
+TRANSIENT_USER_CELLS = (0, 1, 2, 3, 13, 14, 15, 16, 17, 18, 19, 21, 22, 33, 34, 35)
+USER_CELLS = 36
+# Shift of the code of a module compiled a second time to find its
+# relocations.
+RELOCATION_SHIFT = 16*CELL_SIZE
 
-primitives_store = by_the_book_primitives_store()
+LAYOUT = {
+    "CELL_SIZE": CELL_SIZE, "VOCSS": VOCSS, "EM": EM, "COLDD": COLDD,
+    "US": US, "RTS": RTS, "RPP": RPP, "TIBB": TIBB, "SPP": SPP, "UPP": UPP,
+    "NAMEE": NAMEE, "CODEE": CODEE
+}
 
-def generate_compiler_and_image():
+def user_area(manipulator):
+    """Returns the address of the user area, or of the boot data before COLD
+    copied them there.
+    """
+    if manipulator.read_cell_at_address(UPP+CP_OFFSET) == 0:
+        return COLDD
+    return UPP
+
+def image_sections(manipulator):
+    """Split the memory in the sections of an image file: boot data, code
+    dictionary, free space, name dictionary, user area with the stacks and
+    TIB, and heap.
+
+    CP and NP are read from the user area, see user_area.
+    """
+    user_area_address = user_area(manipulator)
+    code_pointer = manipulator.read_cell_at_address(user_area_address+CP_OFFSET)
+    name_pointer = manipulator.read_cell_at_address(user_area_address+NP_OFFSET)
+    return [
+        ("boot", 0, CODEE),
+        ("code", CODEE, code_pointer),
+        ("free", code_pointer, name_pointer),
+        ("names", name_pointer, NAMEE),
+        ("user area", NAMEE, EM),
+        ("heap", EM, len(manipulator.memory))
+    ]
+
+IMAGE_FORMAT = ImageFormat(LAYOUT, image_sections)
+
+primitives_store = forthpie_primitives_store()
+
+def generate_compiler_and_image(superinstructions=False):
+    if superinstructions:
+        superinstructions = SUPERINSTRUCTIONS
+    else:
+        superinstructions = ()
     compiler = Compiler(
         cell_size=CELL_SIZE,
         initial_code_address=CODEE,
@@ -34,7 +106,8 @@ def generate_compiler_and_image():
         initial_user_address=4*CELL_SIZE,
         # memory=Memory(EM),
         memory=Memory(0x8000), #More memory for the heap!
-        primitives_provider=primitives_store)
+        primitives_provider=primitives_store,
+        superinstructions=superinstructions)
 
     image = image_builder(
         start_of_data_stack_address=SPP,
@@ -49,19 +122,391 @@ def generate_compiler_and_image():
         version_number=0,
         terminal_input_buffer_address=TIBB,
         cold_boot_address=COLDD,
-        include_tools_wordset=True
+        include_tools_wordset=True,
+        superinstructions_names=[s.name for s in superinstructions]
     )
 
     return compiler, image
 
-def bootstrap_16bits_eforth():
-    compiler, image = generate_compiler_and_image()
+# Bootstrapped images, the modules building them are part of their key.
+# They are kept on disk only in the directory named by FORTHPIE_CACHE_DIR or
+# given to the build command.
+BOOTSTRAP_CACHE = ImageCache(
+    [interpreters, model, abstract_compiler, primitives, superinstructions, forthpie_image,
+     by_the_book_compiler, ahead_of_time_compiler, by_the_book_primitives, superinstructions_primitives,
+     forthpie_primitives, file_access_primitives, blocks_primitives,
+     memory_allocation_primitives, sys.modules[__name__]],
+    directory=os.environ.get("FORTHPIE_CACHE_DIR")
+)
+
+def bootstrap_16bits_eforth(superinstructions=False, cache=BOOTSTRAP_CACHE):
+    """Compile the eForth image and return its compiler.
+
+    The compiled image is looked up in cache first, pass cache=None to
+    always compile it.
+    """
+    if cache is not None:
+        key = cache.key(superinstructions=bool(superinstructions))
+        image = cache.get(key)
+        if image is not None:
+            return compiler_of_image_file(image, superinstructions)
+
+    compiler, image = generate_compiler_and_image(superinstructions)
 
     ImageCompiler(compiler).visit_Image(image)
 
+    if cache is not None:
+        cache.put(key, image_file(compiler))
+    return compiler
+
+def compiler_of_image_file(image, superinstructions=False):
+    """Returns a compiler going on compiling the image of an image file.
+    """
+    compiler, _ = generate_compiler_and_image(superinstructions)
+    compiler.memory = image.memory
+    user_area_address = user_area(compiler)
+    compiler.code_address = compiler.read_cell_at_address(user_area_address+CP_OFFSET)
+    compiler.name_address = compiler.read_cell_at_address(user_area_address+NP_OFFSET)
+    compiler.user_address = image.compiler_metadata.user_address
+    compiler._compiler_metadata = image.compiler_metadata
     return compiler
 
-def run(interpreter_class, memory, cell_size, compiler_metadata=None, log_level=logging.WARNING):
+def image_file(compiler):
+    """Returns the image file of a bootstrapped image, it starts from its
+    cold boot.
+    """
+    return ImageFile(
+        compiler.memory,
+        compiler.cell_size,
+        image_sections(compiler),
+        layout=LAYOUT,
+        compiler_metadata=compiler.compiler_metadata
+    )
+
+def restore_registers(interpreter, registers=None):
+    """Set the registers of interpreter from the registers saved in an image
+    file, or from the cold boot data if there are none.
+    """
+    cell_size = interpreter.cell_size
+    if registers is not None:
+        interpreter.interpreter_pointer = registers["ip"]
+        interpreter.data_stack_pointer = registers["sp"]
+        interpreter.return_stack_pointer = registers["rp"]
+    else:
+        interpreter.interpreter_pointer = interpreter.read_cell_at_address(COLDD)
+        # print(interpreter.read_cell_at_address(COLDD))
+        if interpreter.read_cell_at_address(COLDD+2*cell_size) != 0:
+            interpreter.data_stack_pointer = interpreter.read_cell_at_address(COLDD+2*cell_size)
+        # print(interpreter.data_stack_pointer)
+        if interpreter.read_cell_at_address(COLDD+3*cell_size) != 0:
+            interpreter.return_stack_pointer = interpreter.read_cell_at_address(COLDD+3*cell_size)
+        # print(interpreter.return_stack_pointer)
+
+def run_layer(interpreter_class, image, source, output_stream=None):
+    """Interpret source on top of image and return the image file of the
+    result. The VM stops with BYE after source, the image resumes from
+    there.
+    """
+    interpreter = interpreter_class(
+        cell_size=image.cell_size,
+        primitives=primitives_store,
+        data_stack_pointer=SPP,
+        return_stack_pointer=RPP,
+        input_stream=io.StringIO(source + "\nBYE\n"),
+        output_stream=output_stream,
+        compiler_metadata=image.compiler_metadata,
+        image_format=IMAGE_FORMAT
+    )
+    interpreter.memory = image.memory
+    restore_registers(interpreter, image.registers)
+    interpreter.start()
+    return IMAGE_FORMAT.image_file(interpreter)
+
+def update_dictionary_pointers(compiler):
+    """Write the code and name dictionary pointers of compiler in the user
+    area, for the VM to go on compiling after it.
+    """
+    user_area_address = user_area(compiler)
+    last = compiler.name_address+2*compiler.cell_size
+    compiler.write_cell_at_address(user_area_address+CP_OFFSET, compiler.code_address)
+    compiler.write_cell_at_address(user_area_address+NP_OFFSET, compiler.name_address)
+    compiler.write_cell_at_address(user_area_address+LAST_OFFSET, last)
+    if user_area_address == UPP:
+        # COLD did OVERT already, do it again.
+        vocabulary = compiler.read_cell_at_address(UPP+CURRENT_OFFSET)
+        compiler.write_cell_at_address(vocabulary, last)
+
+def compile_layer(interpreter_class, image, source, superinstructions=False, output_stream=None):
+    """Compile source on top of image ahead of time and return the image
+    file of the result. The parts of source that need to run Forth code at
+    compile time are interpreted by the VM, see run_layer.
+    """
+    lines = ahead_of_time_compiler.tib_lines(source)
+    compiler = compiler_of_image_file(image, superinstructions)
+    front_end = ahead_of_time_compiler.AheadOfTimeCompiler(
+        compiler,
+        compiler.read_cell_at_address(user_area(compiler)+BASE_OFFSET)
+    )
+    # (start, end) of the part of the source left to the VM.
+    interpreted = None
+
+    def interpret():
+        nonlocal image, compiler, front_end, interpreted
+        (start_line, start), (end_line, end) = interpreted
+        interpreted = None
+        chunk = [line for line in lines[start_line:end_line+1]]
+        chunk[-1] = chunk[-1][:end]
+        chunk[0] = chunk[0][start:]
+        image = run_layer(interpreter_class, image, "\n".join(chunk), output_stream)
+        compiler = compiler_of_image_file(image, superinstructions)
+        front_end.compiler = compiler
+        front_end.base = compiler.read_cell_at_address(user_area(compiler)+BASE_OFFSET)
+
+    for item in front_end.items(lines):
+        words_set = None
+        if item.kind != ahead_of_time_compiler.SourceItem.OTHER:
+            if interpreted is not None:
+                # The VM may define the words item uses.
+                interpret()
+            try:
+                words_set = front_end.words_set(item)
+            except ahead_of_time_compiler.UnsupportedSource:
+                pass
+        if words_set is None:
+            if interpreted is None:
+                interpreted = (item.start, item.end)
+            else:
+                interpreted = (interpreted[0], item.end)
+            continue
+        ImageCompiler(compiler).visit_WordsSet(words_set)
+        update_dictionary_pointers(compiler)
+
+    if interpreted is not None:
+        interpret()
+    return ImageFile(
+        compiler.memory,
+        compiler.cell_size,
+        image_sections(compiler),
+        registers=image.registers,
+        layout=LAYOUT,
+        compiler_metadata=compiler.compiler_metadata
+    )
+
+def build_layered_image(sources, superinstructions=False, cache=BOOTSTRAP_CACHE,
+                        interpreter_class=interpreters.OptimizedInterpreter, output_stream=None,
+                        ahead_of_time=True):
+    """Build the image resulting from interpreting sources one after the
+    other on top of the bootstrapped image.
+
+    Each source is a layer whose image is cached under a key made of its
+    content and the key of the layer below it. The build resumes from the
+    deepest layer found in cache.
+
+    Args:
+        sources (list): The Forth sources of the layers, as strings.
+        ahead_of_time (bool): Should the sources be compiled ahead of time
+                              (see compile_layer) instead of interpreted by
+                              the VM?
+
+    Returns:
+        ImageFile: The image of the last layer.
+    """
+    keys = []
+    if cache is not None:
+        key = cache.key(superinstructions=bool(superinstructions))
+        for source in sources:
+            key = cache.key(
+                previous=key,
+                source=hashlib.sha256(source.encode("utf-8")).hexdigest(),
+                ahead_of_time=bool(ahead_of_time)
+            )
+            keys.append(key)
+
+    image = None
+    built_layers = 0
+    for built_layers in range(len(keys), 0, -1):
+        image = cache.get(keys[built_layers-1])
+        if image is not None:
+            break
+    else:
+        built_layers = 0
+        image = image_file(bootstrap_16bits_eforth(superinstructions, cache))
+
+    for index in range(built_layers, len(sources)):
+        if ahead_of_time:
+            image = compile_layer(interpreter_class, image, sources[index], superinstructions, output_stream)
+        else:
+            image = run_layer(interpreter_class, image, sources[index], output_stream)
+        if cache is not None:
+            cache.put(keys[index], image)
+    return image
+
+def compile_module(interpreter_class, image, source, superinstructions=False, output_stream=None,
+                   ahead_of_time=True):
+    """Compile source on top of image in a relocatable module.
+
+    The source is compiled twice, the second time with the code dictionary
+    pointer shifted by RELOCATION_SHIFT: the cells that differ by the shift
+    are code addresses. Links of the name entries are found by walking
+    them. The cells the source changed in the image outside of its code and
+    names are recorded as patches.
+
+    Raises:
+        NotRelocatable: When a cell of the module depends on its address in
+                        another way.
+
+    Returns:
+        ModuleFile: The module.
+    """
+    base = image.copy()
+    if base.registers is None:
+        # Boot the image, for the changes of its user area to be meaningful.
+        base = run_layer(interpreter_class, base, "", output_stream)
+    base_compiler = compiler_of_image_file(base, superinstructions)
+    code_pointer = base_compiler.code_address
+    name_pointer = base_compiler.name_address
+    last = name_pointer+2*CELL_SIZE
+
+    def build(shift):
+        built = base.copy()
+        compiler = compiler_of_image_file(built, superinstructions)
+        compiler.code_address += shift
+        update_dictionary_pointers(compiler)
+        if ahead_of_time:
+            built = compile_layer(interpreter_class, built, source, superinstructions, output_stream)
+        else:
+            built = run_layer(interpreter_class, built, source, output_stream)
+        return compiler_of_image_file(built, superinstructions)
+
+    compiler = build(0)
+    shifted = build(RELOCATION_SHIFT)
+    if (shifted.code_address != compiler.code_address+RELOCATION_SHIFT
+            or shifted.name_address != compiler.name_address):
+        raise NotRelocatable(code_pointer)
+
+    module_names = set()
+    entry = compiler.name_address
+    while entry != name_pointer:
+        module_names.add(entry+2*CELL_SIZE)
+        entry = compiler.read_previous_entry_address(entry)
+
+    def kind(address, shifted_address):
+        value = compiler.read_cell_at_address(address)
+        shifted_value = shifted.read_cell_at_address(shifted_address)
+        if (shifted_value-value) & 0xFFFF == RELOCATION_SHIFT:
+            return "code"
+        if shifted_value != value:
+            raise NotRelocatable(address)
+        if value in module_names:
+            return "names"
+        return None
+
+    relocations = []
+    for section, start, end, shift in (("code", code_pointer, compiler.code_address, RELOCATION_SHIFT),
+                                       ("names", compiler.name_address, name_pointer, 0)):
+        for address in range(start, end - end % CELL_SIZE, CELL_SIZE):
+            relocation = kind(address, address+shift)
+            if relocation is not None:
+                relocations.append((section, address-start, relocation))
+        for address in range(end - end % CELL_SIZE, end):
+            if compiler.memory[address] != shifted.memory[address+shift]:
+                raise NotRelocatable(address)
+    # The first entry links to the last one of the image it is linked in.
+    if module_names:
+        first_entry = max(module_names)-2*CELL_SIZE
+        relocations.append(("names", first_entry+CELL_SIZE-compiler.name_address, "last"))
+
+    patches = []
+    for start, end in ((CODEE, code_pointer), (name_pointer, NAMEE), (EM, len(compiler.memory))):
+        for address in range(start, end, CELL_SIZE):
+            value = compiler.read_cell_at_address(address)
+            if value != base_compiler.read_cell_at_address(address):
+                patches.append(("memory", address, value, kind(address, address)))
+    for cell in range(USER_CELLS):
+        address = UPP+cell*CELL_SIZE
+        value = compiler.read_cell_at_address(address)
+        if cell not in TRANSIENT_USER_CELLS and value != base_compiler.read_cell_at_address(address):
+            patches.append(("user", cell*CELL_SIZE, value, kind(address, address)))
+
+    return ModuleFile(
+        CELL_SIZE,
+        {
+            "code_pointer": code_pointer,
+            "name_pointer": name_pointer,
+            "names_digest": hashlib.sha256(base.memory[name_pointer:NAMEE]).hexdigest()
+        },
+        bytes(compiler.memory[code_pointer:compiler.code_address]),
+        bytes(compiler.memory[compiler.name_address:name_pointer]),
+        relocations,
+        patches,
+        [
+            (word_meta.name, word_meta.start_address-code_pointer, word_meta.end_address-code_pointer)
+            for word_meta in compiler.compiler_metadata.words_metadata
+            if word_meta.start_address >= code_pointer
+        ]
+    )
+
+def link_modules(image, modules, superinstructions=False):
+    """Returns a copy of image with modules linked in it, one after the
+    other, without running the VM.
+
+    Raises:
+        IncompatibleModule: When a module was not compiled on top of the
+                            name dictionary of the image.
+    """
+    image = image.copy()
+    compiler = compiler_of_image_file(image, superinstructions)
+    for module in modules:
+        base = module.base
+        if module.cell_size != CELL_SIZE:
+            raise IncompatibleModule(f"cells of {module.cell_size} bytes")
+        if (base["name_pointer"] < compiler.name_address
+                or hashlib.sha256(image.memory[base["name_pointer"]:NAMEE]).hexdigest() != base["names_digest"]):
+            raise IncompatibleModule("the names of the image differ")
+        code_start = compiler.code_address
+        names_start = compiler.name_address-len(module.names)
+        if code_start+len(module.code) > names_start:
+            raise IncompatibleModule("not enough memory")
+        relocated = {
+            "code": code_start-base["code_pointer"],
+            "names": names_start+len(module.names)-base["name_pointer"],
+            "last": compiler.name_address+2*CELL_SIZE
+        }
+
+        def relocate(value, kind):
+            if kind is None:
+                return value
+            if kind == "last":
+                return relocated["last"]
+            return (value+relocated[kind]) & 0xFFFF
+
+        image.memory.bytes_array[code_start:code_start+len(module.code)] = module.code
+        image.memory.bytes_array[names_start:names_start+len(module.names)] = module.names
+        for section, offset, kind in module.relocations:
+            address = offset+(code_start if section == "code" else names_start)
+            compiler.write_cell_at_address(address, relocate(compiler.read_cell_at_address(address), kind))
+        user_area_address = user_area(compiler)
+        for location, address, value, kind in module.patches:
+            if location == "user":
+                address += user_area_address
+            compiler.write_cell_at_address(address, relocate(value, kind))
+        for name, start, end in module.symbols:
+            compiler.compiler_metadata.add_word_meta(WordMetaData(name, code_start+start, code_start+end))
+
+        compiler.code_address = code_start+len(module.code)
+        compiler.name_address = names_start
+        update_dictionary_pointers(compiler)
+
+    return ImageFile(
+        compiler.memory,
+        compiler.cell_size,
+        image_sections(compiler),
+        registers=image.registers,
+        layout=LAYOUT,
+        compiler_metadata=compiler.compiler_metadata
+    )
+
+def run(interpreter_class, memory, cell_size, compiler_metadata=None, log_level=logging.WARNING, registers=None):
     logging.root.setLevel(log_level)
     interpreter = interpreter_class(
                     cell_size=cell_size,
@@ -71,23 +516,17 @@ def run(interpreter_class, memory, cell_size, compiler_metadata=None, log_level=
                     input_stream=sys.stdin,
                     output_stream=sys.stdout,
                     logger=logging,
-                    compiler_metadata=compiler_metadata
+                    compiler_metadata=compiler_metadata,
+                    image_format=IMAGE_FORMAT
                 )
     interpreter.memory = memory
-    interpreter.interpreter_pointer = interpreter.read_cell_at_address(COLDD)
-    # print(interpreter.read_cell_at_address(COLDD))
-    if interpreter.read_cell_at_address(COLDD+2*cell_size) != 0:
-        interpreter.data_stack_pointer = interpreter.read_cell_at_address(COLDD+2*cell_size)
-    # print(interpreter.data_stack_pointer)
-    if interpreter.read_cell_at_address(COLDD+3*cell_size) != 0:
-        interpreter.return_stack_pointer = interpreter.read_cell_at_address(COLDD+3*cell_size)
-    # print(interpreter.return_stack_pointer)
+    restore_registers(interpreter, registers)
 
     try:
         interpreter.start()
         # print(interpreter.execution_statistics.word_names_to_count(compiler.compiler_metadata))
     finally:
-        pass
+        interpreter.output_channel.flush()
         # interpreter.print_data_stack()
 
         # interpreter.print_return_stack()
@@ -100,7 +539,7 @@ def run(interpreter_class, memory, cell_size, compiler_metadata=None, log_level=
         # for address in range(TIBB, TIBB+10):
         #     print(f"\t{hex(interpreter.memory[address])} ({chr(interpreter.memory[address])})")
 
-def boostrap_run(interpreter_class, log_level=logging.WARNING):
+def boostrap_run(interpreter_class, log_level=logging.WARNING, superinstructions=False):
     # print(f"CELL_SIZE = {hex(CELL_SIZE)}")
     # print(f"VOCSS = {hex(VOCSS)}")
     # print(f"EM = {hex(EM)}")
@@ -114,7 +553,7 @@ def boostrap_run(interpreter_class, log_level=logging.WARNING):
     # print(f"NAMEE = {hex(NAMEE)}")
     # print(f"CODEE = {hex(CODEE)}")
 
-    compiler = bootstrap_16bits_eforth()
+    compiler = bootstrap_16bits_eforth(superinstructions)
     run(
         interpreter_class,
         compiler.memory,
@@ -129,29 +568,91 @@ if __name__ == "__main__":
 """EForth with 16bits cell-size.
 
 Usage:
-  eforth16bits.py run [--log=<level>] [--interpreter=<name>] <file_path>
-  eforth16bits.py bootstrap-run [--log=<level>] [--interpreter=<name>]
-  eforth16bits.py bootstrap <file_path>
+  eforth16bits.py run [--log=<level>] [--interpreter=<name>] [--checked-memory] [--mmap] <file_path>
+  eforth16bits.py bootstrap-run [--log=<level>] [--interpreter=<name>] [--superinstructions]
+  eforth16bits.py bootstrap [--raw] [--superinstructions] <file_path>
+  eforth16bits.py build [--interpreter=<name>] [--superinstructions] [--no-cache] [--cache-dir=<path>] [--no-aot] <file_path> <source_path>...
+  eforth16bits.py compile-module [--interpreter=<name>] [--superinstructions] [--no-aot] <image_path> <source_path> <module_path>
+  eforth16bits.py link [--superinstructions] <image_path> <file_path> <module_path>...
 
 Options:
   --log=<level>         Log level for the VM [default: WARNING].
   --interpreter=<name>  Specify which interpreter to use [default: OptimizedInterpreter].
+  --checked-memory      Raise NotAByte when a value that is not a byte is stored.
+  --mmap                Map a raw image in memory instead of reading it.
+  --raw                 Save the memory only instead of an image file.
+  --superinstructions   Fuse frequent sequences of tokens in superinstructions.
+  --no-cache            Interpret all the sources instead of starting from
+                        the deepest layer in cache.
+  --cache-dir=<path>    Keep the images of the layers in this directory
+                        too, instead of in process only, defaults to the
+                        FORTHPIE_CACHE_DIR environment variable.
+  --no-aot              Interpret the sources with the VM instead of
+                        compiling them ahead of time when possible.
 
 """)
     logging.basicConfig()
     if arguments["run"]:
-        memory = Memory.from_file(arguments["<file_path>"])
-        run(
-            getattr(interpreters, arguments["--interpreter"]),
-            memory,
-            cell_size=2,
-            log_level=getattr(logging, arguments["--log"].upper())
-        )
+        memory_class = CheckedMemory if arguments["--checked-memory"] else Memory
+        if is_image_file(arguments["<file_path>"]):
+            if arguments["--mmap"]:
+                sys.exit("--mmap only applies to raw images, save them with bootstrap --raw.")
+            image = ImageFile.from_file(arguments["<file_path>"], memory_class)
+            run(
+                getattr(interpreters, arguments["--interpreter"]),
+                image.memory,
+                cell_size=image.cell_size,
+                compiler_metadata=image.compiler_metadata,
+                log_level=getattr(logging, arguments["--log"].upper()),
+                registers=image.registers
+            )
+        else:
+            if arguments["--mmap"]:
+                memory = memory_class.map_file(arguments["<file_path>"])
+            else:
+                memory = memory_class.from_file(arguments["<file_path>"])
+            run(
+                getattr(interpreters, arguments["--interpreter"]),
+                memory,
+                cell_size=2,
+                log_level=getattr(logging, arguments["--log"].upper())
+            )
     elif arguments["bootstrap-run"]:
         boostrap_run(
             getattr(interpreters, arguments["--interpreter"]),
-            log_level=getattr(logging, arguments["--log"].upper())
+            log_level=getattr(logging, arguments["--log"].upper()),
+            superinstructions=arguments["--superinstructions"]
         )
+    elif arguments["build"]:
+        if arguments["--cache-dir"]:
+            BOOTSTRAP_CACHE.directory = Path(arguments["--cache-dir"])
+        sources = [Path(path).read_text() for path in arguments["<source_path>"]]
+        build_layered_image(
+            sources,
+            superinstructions=arguments["--superinstructions"],
+            cache=None if arguments["--no-cache"] else BOOTSTRAP_CACHE,
+            interpreter_class=getattr(interpreters, arguments["--interpreter"]),
+            output_stream=sys.stdout,
+            ahead_of_time=not arguments["--no-aot"]
+        ).save(arguments["<file_path>"])
+    elif arguments["compile-module"]:
+        compile_module(
+            getattr(interpreters, arguments["--interpreter"]),
+            ImageFile.from_file(arguments["<image_path>"]),
+            Path(arguments["<source_path>"]).read_text(),
+            superinstructions=arguments["--superinstructions"],
+            output_stream=sys.stdout,
+            ahead_of_time=not arguments["--no-aot"]
+        ).save(arguments["<module_path>"])
+    elif arguments["link"]:
+        link_modules(
+            ImageFile.from_file(arguments["<image_path>"]),
+            [ModuleFile.from_file(path) for path in arguments["<module_path>"]],
+            superinstructions=arguments["--superinstructions"]
+        ).save(arguments["<file_path>"])
     elif arguments["bootstrap"]:
-        compiler = bootstrap_16bits_eforth()
-        compiler.memory.save(arguments["<file_path>"])
+        compiler = bootstrap_16bits_eforth(arguments["--superinstructions"])
+        if arguments["--raw"]:
+            compiler.memory.save(arguments["<file_path>"])
+        else:
+            image_file(compiler).save(arguments["<file_path>"])
@@ -1,3 +1,4 @@
+from ..primitives.file_access import READ_ONLY, WRITE_ONLY, READ_WRITE
 from ...model import Image, WordsSet, Primitive, ColonWord, UserVariable, WR, code, L, LR, Byte, Align
 
 def forthpie_primitives():
@@ -41,6 +42,17 @@ def forthpie_primitives():
         Primitive("SNAPSHOT")
     )
 
+def forthpie_superinstructions(superinstructions_names):
+    """ Builds and returns a WordsSet that contains the superinstructions
+    primitives. They must be compiled before any colon definition so that
+    their bodies can be fused.
+    """
+    return WordsSet("superinstructions",
+        *[Primitive(name, compile_only=True) for name in superinstructions_names],
+        Primitive("fuse", compile_only=True),
+        requirements=["primitives"]
+    )
+
 def forthpie_system_and_user_variables(start_of_user_area_address, number_of_vocabularies):
     """ Builds and returns a WordsSet that contains EForth words allowing to
     define system and user variables as well as the variables required by
@@ -339,41 +351,17 @@ def forthpie_memory_access_words(cell_size):
             WR("EXECUTE"),
         L("EXE1"), WR("EXIT")]
         ),
-        ColonWord("CMOVE",
-            [WR(">R"),
-            WR("branch"), LR("CMOV2"),
-        L("CMOV1"), WR(">R"), WR("DUP"), WR("C@"),
-            WR("R@"), WR("C!"),
-            WR("doLIT"), 1, WR("+"),
-            WR("R>"), WR("doLIT"), 1, WR("+"),
-        L("CMOV2"), WR("next"), LR("CMOV1"),
-            WR("2DROP"), WR("EXIT")]
-        ),
-        ColonWord("FILL",
-            [WR("SWAP"), WR(">R"), WR("SWAP"),
-            WR("branch"), LR("FILL2"),
-        L("FILL1"), WR("2DUP"), WR("C!"), WR("doLIT"), 1, WR("+"),
-        L("FILL2"), WR("next"), LR("FILL1"),
-            WR("2DROP"), WR("EXIT")]
-        ),
-        ColonWord("-TRAILING",
-            [WR(">R"),
-            WR("branch"), LR("DTRA2"),
-        L("DTRA1"), WR("BL"), WR("OVER"), WR("R@"), WR("+"), WR("C@"), WR("<"),
-            WR("?branch"), LR("DTRA2"),
-            WR("R>"), WR("doLIT"), 1, WR("+"), WR("EXIT"),
-        L("DTRA2"), WR("next"), LR("DTRA1"),
-            WR("doLIT"), 0, WR("EXIT")]
-        ),
-        ColonWord("PACK$",
-            [WR("ALIGNED"), WR("DUP"), WR(">R"),
-            WR("OVER"), WR("DUP"), WR("doLIT"), 0,
-            WR("doLIT"), cell_size, WR("UM/MOD"), WR("DROP"),
-            WR("-"), WR("OVER"), WR("+"),
-            WR("doLIT"), 0, WR("SWAP"), WR("!"),
-            WR("2DUP"), WR("C!"), WR("doLIT"), 1, WR("+"),
-            WR("SWAP"), WR("CMOVE"), WR("R>"), WR("EXIT")]
-        )
+        Primitive("CMOVE"),
+        Primitive("CMOVE>"),
+        Primitive("MOVE"),
+        Primitive("FILL"),
+        Primitive("ERASE"),
+        Primitive("-TRAILING"),
+        Primitive("COMPARE"),
+        Primitive("SEARCH"),
+        Primitive("SCAN"),
+        Primitive("SKIP"),
+        Primitive("PACK$")
     )
 
 def forthpie_numeric_output_single_precision_words():
@@ -397,11 +385,9 @@ def forthpie_numeric_output_single_precision_words():
         ColonWord("#",
             code("BASE @ EXTRACT HOLD EXIT")
         ),
+        Primitive("(#S)"),
         ColonWord("#S",
-        [L("DIGS1"), WR("#"), WR("DUP"),
-            WR("?branch"), LR("DIGS2"),
-            WR("branch"), LR("DIGS1"),
-        L("DIGS2"), WR("EXIT")]
+            code("BASE @ HLD (#S) EXIT")
         ),
         ColonWord("SIGN",
             [WR("0<"),
@@ -428,38 +414,10 @@ def forthpie_numeric_output_single_precision_words():
 
 def forthpie_numeric_input_single_precision_words():
     return WordsSet("numeric_input_single_precision",
-        ColonWord("DIGIT?",
-            [WR(">R"), WR("doLIT"), ord('0'), WR("-"),
-            WR("doLIT"), 9, WR("OVER"), WR("<"),
-            WR("?branch"), LR("DGTQ1"),
-            WR("doLIT"), 7, WR("-"),
-            WR("DUP"), WR("doLIT"), 10, WR("<"), WR("OR"),
-        L("DGTQ1"), WR("DUP"), WR("R>"), WR("U<"), WR("EXIT")]
-        ),
+        Primitive("DIGIT?"),
+        Primitive("(number?)"),
         ColonWord("NUMBER?",
-            [WR("BASE"), WR("@"), WR(">R"), WR("doLIT"), 0, WR("OVER"), WR("COUNT"),
-            WR("OVER"), WR("C@"), WR("doLIT"), ord('$'), WR("="),
-            WR("?branch"), LR("NUMQ1"),
-            WR("HEX"), WR("SWAP"), WR("doLIT"), 1, WR("+"),
-            WR("SWAP"), WR("doLIT"), 1, WR("-"),
-        L("NUMQ1"), WR("OVER"), WR("C@"), WR("doLIT"), ord('-'), WR("="), WR(">R"),
-            WR("SWAP"), WR("R@"), WR("-"), WR("SWAP"), WR("R@"), WR("+"), WR("?DUP"),
-            WR("?branch"), LR("NUMQ6"),
-            WR("doLIT"), 1, WR("-"), WR(">R"),
-        L("NUMQ2"), WR("DUP"), WR(">R"), WR("C@"), WR("BASE"), WR("@"), WR("DIGIT?"),
-            WR("?branch"), LR("NUMQ4"),
-            WR("SWAP"), WR("BASE"), WR("@"), WR("*"), WR("+"), WR("R>"),
-            WR("doLIT"), 1, WR("+"),
-            WR("next"), LR("NUMQ2"),
-            WR("R@"), WR("SWAP"), WR("DROP"),
-            WR("?branch"), LR("NUMQ3"),
-            WR("NEGATE"),
-        L("NUMQ3"), WR("SWAP"),
-            WR("branch"), LR("NUMQ5"),
-        L("NUMQ4"), WR("R>"), WR("R>"), WR("2DROP"), WR("2DROP"), WR("doLIT"), 0,
-        L("NUMQ5"), WR("DUP"),
-        L("NUMQ6"), WR("R>"), WR("2DROP"),
-            WR("R>"), WR("BASE"), WR("!"), WR("EXIT")]
+            code("BASE (number?) EXIT")
         )
     )
 
@@ -551,40 +509,10 @@ def forthpie_parsing_words():
     """
     """
     return WordsSet("parsing",
-        ColonWord("parse",
-            [WR("tmp"), WR("!"), WR("OVER"), WR(">R"), WR("DUP"),
-            WR("?branch"), LR("PARS8"),
-            WR("doLIT"), 1, WR("-"), WR("tmp"), WR("@"), WR("BL"), WR("="),
-            WR("?branch"), LR("PARS3"),
-            WR(">R"),
-        L("PARS1"), WR("BL"), WR("OVER"), WR("C@"),
-            WR("-"), WR("0<"), WR("NOT"),
-            WR("?branch"), LR("PARS2"),
-            WR("doLIT"), 1, WR("+"),
-            WR("next"), LR("PARS1"),
-            WR("R>"), WR("DROP"), WR("doLIT"), 0, WR("DUP"), WR("EXIT"),
-        L("PARS2"), WR("R>"),
-        L("PARS3"), WR("OVER"), WR("SWAP"),
-            WR(">R"),
-        L("PARS4"), WR("tmp"), WR("@"), WR("OVER"), WR("C@"), WR("-"),
-            WR("tmp"), WR("@"), WR("BL"), WR("="),
-            WR("?branch"), LR("PARS5"),
-            WR("0<"),
-        L("PARS5"), WR("?branch"), LR("PARS6"),
-            WR("doLIT"), 1, WR("+"),
-            WR("next"), LR("PARS4"),
-            WR("DUP"), WR(">R"),
-            WR("branch"), LR("PARS7"),
-        L("PARS6"), WR("R>"), WR("DROP"), WR("DUP"),
-            WR("doLIT"), 1, WR("+"), WR(">R"),
-        L("PARS7"), WR("OVER"), WR("-"),
-            WR("R>"), WR("R>"), WR("-"), WR("EXIT"),
-        L("PARS8"), WR("OVER"), WR("R>"), WR("-"), WR("EXIT")]
-        ),
+        Primitive("parse"),
+        Primitive("(PARSE)"),
         ColonWord("PARSE",
-            [WR(">R"), WR("TIB"), WR(">IN"), WR("@"), WR("+"),
-            WR("#TIB"), WR("@"), WR(">IN"), WR("@"), WR("-"),
-            WR("R>"), WR("parse"), WR(">IN"), WR("+!"), WR("EXIT")]
+            code("#TIB >IN (PARSE) EXIT")
         ),
         ColonWord(".(",
             [WR("doLIT"), ord('('), WR("PARSE"), WR("TYPE"), WR("EXIT")],
@@ -616,6 +544,8 @@ def forthpie_dictionary_search_words(lexicon_mask, cell_size):
     """
     # NOTE: This words set highly relies on how words are encoded in memory
     return WordsSet("dictionary_search",
+        Primitive("(find)"),
+        Primitive("(>NAME)"),
         # NOTE: this word is not in EForth but is useful to avoid hardcode lexicon bit mask
         ColonWord("LEXICON_MASK",
             [WR("doLIT"), lexicon_mask, WR("EXIT")]
@@ -624,38 +554,16 @@ def forthpie_dictionary_search_words(lexicon_mask, cell_size):
             [WR("CELL-"), WR("CELL-"), WR("@"), WR("EXIT")]
         ),
         ColonWord("SAME?",
-            [WR(">R"),
-            WR("branch"), LR("SAME2"),
-        L("SAME1"), WR("OVER"), WR("R@"), WR("CELLS"), WR("+"), WR("@"),
-            WR("OVER"), WR("R@"), WR("CELLS"), WR("+"), WR("@"),
-            WR("-"), WR("?DUP"),
-            WR("?branch"), LR("SAME2"),
-            WR("R>"), WR("DROP"), WR("EXIT"),
-        L("SAME2"), WR("next"), LR("SAME1"),
-            WR("doLIT"), 0, WR("EXIT")]
+            [WR("CELLS"), WR(">R"), WR("OVER"), WR("R@"),
+            WR("doLIT"), 2, WR("PICK"), WR("R>"), WR("COMPARE"), WR("EXIT")]
         ),
+        # The search is done by a primitive through an index of the name
+        # dictionary, see forthpie.eforth.primitives.forthpie.
         ColonWord("find",
-            [WR("SWAP"), WR("DUP"), WR("C@"),
-            WR("doLIT"), cell_size, WR("/"), WR("tmp"), WR("!"),
-            WR("DUP"), WR("@"), WR(">R"),
-            WR("CELL+"), WR("SWAP"),
-        L("FIND1"), WR("@"), WR("DUP"),
-            WR("?branch"), LR("FIND6"),
-            WR("DUP"), WR("@"),
-            WR("LEXICON_MASK"), WR("AND"), WR("R@"), WR("XOR"),
-            WR("?branch"), LR("FIND2"),
-            WR("CELL+"), WR("TRUE"),
-            WR("branch"), LR("FIND3"),
-        L("FIND2"), WR("CELL+"), WR("tmp"), WR("@"), WR("SAME?"),
-        L("FIND3"), WR("branch"), LR("FIND4"),
-        L("FIND6"), WR("R>"), WR("DROP"),
-            WR("SWAP"), WR("CELL-"), WR("SWAP"), WR("EXIT"),
-        L("FIND4"), WR("?branch"), LR("FIND5"),
-            WR("CELL-"), WR("CELL-"),
-            WR("branch"), LR("FIND1"),
-        L("FIND5"), WR("R>"), WR("DROP"), WR("SWAP"), WR("DROP"),
-            WR("CELL-"),
-            WR("DUP"), WR("NAME>"), WR("SWAP"), WR("EXIT")]
+            [WR("LEXICON_MASK"), WR("(find)"), WR("EXIT")]
+        ),
+        ColonWord(">NAME",
+            [WR("CURRENT"), WR("LEXICON_MASK"), WR("(>NAME)"), WR("EXIT")]
         ),
         ColonWord("NAME?",
             [WR("CONTEXT"), WR("DUP"), WR("2@"), WR("XOR"),
@@ -678,6 +586,7 @@ def forthpie_terminal_response_words():
     """
     # TODO:probably needs host's line ending convention as input
     return WordsSet('terminal_response',
+        Primitive("(accept)"),
         ColonWord("^H",
             [WR(">R"), WR("OVER"), WR("R>"), WR("SWAP"), WR("OVER"), WR("XOR"),
             WR("?branch"), LR("BACK1"),
@@ -699,8 +608,13 @@ def forthpie_terminal_response_words():
         L("KTAP1"), WR("^H"), WR("EXIT"),
         L("KTAP2"), WR("DROP"), WR("SWAP"), WR("DROP"), WR("DUP"), WR("EXIT")]
         ),
+        # With the default '?KEY and 'TAP, lines are read by a primitive,
+        # see forthpie.eforth.primitives.forthpie.
         ColonWord("accept",
-            [WR("OVER"), WR("+"), WR("OVER"),
+            [WR("'?KEY"), WR("@"), WR("doLIT"), WR("?RX"), WR("XOR"),
+            WR("'TAP"), WR("@"), WR("doLIT"), WR("kTAP"), WR("XOR"), WR("OR"),
+            WR("?branch"), LR("ACCP5"),
+        L("ACCP0"), WR("OVER"), WR("+"), WR("OVER"),
         L("ACCP1"), WR("2DUP"), WR("XOR"),
             WR("?branch"), LR("ACCP4"),
             WR("KEY"), WR("DUP"),
@@ -711,7 +625,14 @@ def forthpie_terminal_response_words():
             WR("branch"), LR("ACCP3"),
         L("ACCP2"), WR("'TAP"), WR("@EXECUTE"),
         L("ACCP3"), WR("branch"), LR("ACCP1"),
-        L("ACCP4"), WR("DROP"), WR("OVER"), WR("-"), WR("EXIT")]
+        L("ACCP4"), WR("DROP"), WR("OVER"), WR("-"), WR("EXIT"),
+        # EMIT, the echo of HAND, is the echo 'EMIT holds.
+        L("ACCP5"), WR("'ECHO"), WR("@"), WR("DUP"), WR("doLIT"), WR("EMIT"), WR("="),
+            WR("?branch"), LR("ACCP6"),
+            WR("DROP"), WR("'EMIT"), WR("@"),
+        L("ACCP6"), WR("(accept)"),
+            WR("?branch"), LR("ACCP0"),
+            WR("EXIT")]
         ),
         ColonWord("EXPECT",
             code("'EXPECT @EXECUTE SPAN ! DROP EXIT")
@@ -837,6 +758,168 @@ def forthpie_shell_words(terminal_input_buffer_address):
         )
     )
 
+def forthpie_file_access_words(read_only, write_only, read_write):
+    """ Builds and returns a WordsSet that contains the words of the ANS
+    File-Access word set the primitives do not provide, and INCLUDED which
+    interprets a file line by line in the TIB.
+    """
+    return WordsSet("file_access",
+        Primitive("OPEN-FILE"),
+        Primitive("CREATE-FILE"),
+        Primitive("CLOSE-FILE"),
+        Primitive("READ-FILE"),
+        Primitive("READ-LINE"),
+        Primitive("WRITE-FILE"),
+        Primitive("SOURCE-ID"),
+        Primitive("(push-source)"),
+        Primitive("(pop-source)"),
+        Primitive("(refill)"),
+        ColonWord("R/O",
+            [WR("doLIT"), read_only, WR("EXIT")]
+        ),
+        ColonWord("W/O",
+            [WR("doLIT"), write_only, WR("EXIT")]
+        ),
+        ColonWord("R/W",
+            [WR("doLIT"), read_write, WR("EXIT")]
+        ),
+        # Files are always opened in binary mode.
+        ColonWord("BIN",
+            [WR("EXIT")]
+        ),
+        ColonWord("REFILL",
+            [WR("#TIB"), WR(">IN"), WR("(refill)"), WR("EXIT")]
+        ),
+        # Same as EVAL without the prompt.
+        ColonWord("(interpret)",
+        [L("INTP1"), WR("TOKEN"), WR("DUP"), WR("C@"),
+            WR("?branch"), LR("INTP2"),
+            WR("'EVAL"), WR("@EXECUTE"), WR("?STACK"),
+            WR("branch"), LR("INTP1"),
+        L("INTP2"), WR("DROP"), WR("EXIT")]
+        ),
+        ColonWord("(include)",
+        [L("INCL1"), WR("REFILL"),
+            WR("?branch"), LR("INCL2"),
+            WR("(interpret)"),
+            WR("branch"), LR("INCL1"),
+        L("INCL2"), WR("EXIT")]
+        ),
+        ColonWord("INCLUDE-FILE",
+            [WR("#TIB"), WR(">IN"), WR("(push-source)"),
+            WR("doLIT"), WR("(include)"), WR("CATCH"),
+            WR("#TIB"), WR(">IN"), WR("(pop-source)"),
+            WR("?DUP"),
+            WR("?branch"), LR("INCF1"),
+            WR("THROW"),
+        L("INCF1"), WR("EXIT")]
+        ),
+        ColonWord("INCLUDED",
+            [WR("R/O"), WR("OPEN-FILE"),
+            WR('abort"'), ' cannot open',
+            WR("INCLUDE-FILE"), WR("EXIT")]
+        ),
+        requirements=["primitives", "text_interpreter", "error_handling"]
+    )
+
+def forthpie_block_words():
+    """ Builds and returns a WordsSet that contains the words of the ANS
+    Block word set. Blocks are read from the block file opened by
+    OPEN-BLOCKS in the block buffers whose address and count are stored in
+    BLOCK-BUFFERS, LOAD interprets the block buffer as the TIB.
+    """
+    return WordsSet("blocks",
+        Primitive("OPEN-BLOCKS"),
+        Primitive("(block)"),
+        Primitive("UPDATE"),
+        Primitive("SAVE-BUFFERS"),
+        Primitive("EMPTY-BUFFERS"),
+        Primitive("(push-block)"),
+        Primitive("(pop-block)"),
+        ColonWord("BLK",
+            [WR("doVAR"), 0]
+        ),
+        # No block buffers until the program gives some.
+        ColonWord("BLOCK-BUFFERS",
+            [WR("doVAR"), 0, 0]
+        ),
+        # abort" is off the path of the blocks found.
+        ColonWord("?block",
+            [WR("DUP"),
+            WR("?branch"), LR("QBLK1"),
+            WR("EXIT"),
+        L("QBLK1"), WR("NOT"),
+            WR('abort"'), ' no block', WR("EXIT")]
+        ),
+        ColonWord("BLOCK",
+            [WR("TRUE"), WR("BLOCK-BUFFERS"), WR("2@"), WR("(block)"),
+            WR("?block"), WR("EXIT")]
+        ),
+        ColonWord("BUFFER",
+            [WR("FALSE"), WR("BLOCK-BUFFERS"), WR("2@"), WR("(block)"),
+            WR("?block"), WR("EXIT")]
+        ),
+        ColonWord("FLUSH",
+            [WR("SAVE-BUFFERS"), WR("EMPTY-BUFFERS"), WR("EXIT")]
+        ),
+        ColonWord("LOAD",
+            [WR("BLK"), WR("@"), WR(">R"),
+            WR("DUP"), WR("BLK"), WR("!"), WR("DUP"), WR("BLOCK"),
+            WR("#TIB"), WR(">IN"), WR("(push-block)"),
+            WR("doLIT"), WR("(interpret)"), WR("CATCH"),
+            WR("#TIB"), WR(">IN"), WR("(pop-block)"),
+            WR("R>"), WR("BLK"), WR("!"),
+            WR("?DUP"),
+            WR("?branch"), LR("LOAD1"),
+            WR("THROW"),
+        L("LOAD1"), WR("EXIT")]
+        ),
+        requirements=["primitives", "file_access", "error_handling"]
+    )
+
+def forthpie_memory_allocation_words():
+    """ Builds and returns a WordsSet that contains the words of the ANS
+    Memory-Allocation word set, allocating in the heap made by INIT-HEAP,
+    and words telling how the heap is used.
+    """
+    return WordsSet("memory_allocation",
+        Primitive("(init-heap)"),
+        Primitive("(allocate)"),
+        Primitive("(free)"),
+        Primitive("(resize)"),
+        Primitive("(heap-statistics)"),
+        # No heap until the program makes one.
+        ColonWord("(heap)",
+            [WR("doVAR"), 0]
+        ),
+        ColonWord("INIT-HEAP",
+            [WR("(init-heap)"), WR("DUP"), WR("(heap)"), WR("!"),
+            WR("doLIT"), 0, WR("="),
+            WR('abort"'), ' heap too small', WR("EXIT")]
+        ),
+        ColonWord("ALLOCATE",
+            [WR("(heap)"), WR("@"), WR("(allocate)"), WR("EXIT")]
+        ),
+        ColonWord("FREE",
+            [WR("(heap)"), WR("@"), WR("(free)"), WR("EXIT")]
+        ),
+        ColonWord("RESIZE",
+            [WR("(heap)"), WR("@"), WR("(resize)"), WR("EXIT")]
+        ),
+        ColonWord("HEAP-LIVE",
+            [WR("(heap)"), WR("@"), WR("(heap-statistics)"), WR("2DROP"), WR("EXIT")]
+        ),
+        ColonWord("HEAP-PEAK",
+            [WR("(heap)"), WR("@"), WR("(heap-statistics)"), WR("DROP"),
+            WR("SWAP"), WR("DROP"), WR("EXIT")]
+        ),
+        ColonWord("HEAP-FRAGMENTATION",
+            [WR("(heap)"), WR("@"), WR("(heap-statistics)"), WR(">R"),
+            WR("2DROP"), WR("R>"), WR("EXIT")]
+        ),
+        requirements=["primitives", "error_handling"]
+    )
+
 def forthpie_compiler_words():
     """
     """
@@ -967,10 +1050,21 @@ def forthpie_name_compiler_words():
         )
     )
 
-def forthpie_forth_compiler_words(immediate_bit, doLISTCode):
+def forthpie_forth_compiler_words(immediate_bit, doLISTCode, superinstructions_names=()):
+    # Fuse the tokens compiled so far before compiling the next one.
+    fuse = []
+    superinstructions_table = []
+    if superinstructions_names:
+        fuse = [WR("HERE"), WR("superinstructions"), WR("fuse")]
+        superinstructions_table = [
+            ColonWord("superinstructions",
+                [WR("doVAR")] + [WR(name) for name in superinstructions_names] + [0]
+            )
+        ]
     return WordsSet("forth_compiler",
+        *superinstructions_table,
         ColonWord("$COMPILE",
-            [WR("NAME?"), WR("?DUP"),
+            fuse + [WR("NAME?"), WR("?DUP"),
             WR("?branch"), LR("SCOM2"),
             WR("@"), WR("doLIT"), immediate_bit, WR("AND"),
             WR("?branch"), LR("SCOM1"),
@@ -985,7 +1079,7 @@ def forthpie_forth_compiler_words(immediate_bit, doLISTCode):
             [WR("LAST"), WR("@"), WR("CURRENT"), WR("@"), WR("!"), WR("EXIT")]
         ),
         ColonWord(";",
-            [WR("COMPILE"), WR("EXIT"),
+            [WR("COMPILE"), WR("EXIT")] + fuse + [
             WR("["), WR("OVERT"),
             WR("EXIT")],
             compile_only=True,
@@ -1112,9 +1206,14 @@ def forthpie_eforth_image(start_of_data_stack_address,
                              version_number,
                              terminal_input_buffer_address,
                              cold_boot_address,
-                             include_tools_wordset=False):
+                             include_tools_wordset=False,
+                             superinstructions_names=()):
+    superinstructions_words_sets = []
+    if superinstructions_names:
+        superinstructions_words_sets.append(forthpie_superinstructions(superinstructions_names))
     image = Image(
         forthpie_primitives(),
+        *superinstructions_words_sets,
         forthpie_system_and_user_variables(start_of_user_area_address, number_of_vocabularies),
         forthpie_booleans(),
         forthpie_common_words(),
@@ -1132,10 +1231,13 @@ def forthpie_eforth_image(start_of_data_stack_address,
         forthpie_error_handling_words(),
         forthpie_text_interpreter_words(compile_only_bit),
         forthpie_shell_words(terminal_input_buffer_address),
+        forthpie_file_access_words(READ_ONLY, WRITE_ONLY, READ_WRITE),
+        forthpie_block_words(),
+        forthpie_memory_allocation_words(),
         forthpie_compiler_words(),
         forthpie_structure_words(),
         forthpie_name_compiler_words(),
-        forthpie_forth_compiler_words(immediate_bit, doLISTCode),
+        forthpie_forth_compiler_words(immediate_bit, doLISTCode, superinstructions_names),
         forthpie_defining_words(doLISTCode),
         memory_initializer=forthpie_memory_initialization(
             start_of_data_stack_address,
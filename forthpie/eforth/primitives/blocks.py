@@ -0,0 +1,318 @@
+"""Block primitives, after the optional Block word set of ANS Forth.
+
+Blocks are the 1 KB pages of a host block file, memory-mapped. Forth code
+reaches them through a pool of block buffers in the memory of the VM: a block
+is copied in a buffer when it is accessed, the least recently used buffer is
+reassigned when the pool is full, after writing its block back to the file
+if it was updated.
+"""
+from collections import OrderedDict
+import mmap
+
+from ...primitives import primitive
+from .file_access import IOR_SUCCESS, IOR_FILE_IO_EXCEPTION, string_at
+
+BLOCK_SIZE = 1024
+# The block file used when none was opened, as in Gforth.
+DEFAULT_BLOCK_FILE = "blocks.fb"
+
+class BlockStorage(object):
+    """Block file and block buffers of a VM.
+
+    Args:
+        block_size (int): The size of a block in bytes.
+    """
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.file = None
+        self.mapping = None
+        # (address, count) of the block buffers.
+        self.pool = (0, 0)
+        # Addresses of the buffers not assigned to a block.
+        self.free_buffers = []
+        # Buffer address of the assigned blocks, least recently used first.
+        self.buffers = OrderedDict()
+        self.updated = set()
+        # (block number, #TIB, TIB address, >IN, block number of the TIB or
+        # None) of the input sources to restore after LOAD.
+        self.sources = []
+        self.current = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def open(self, memory, path):
+        """Use the file at path as block file, created if it does not exist.
+        The updated blocks are written back to the previous file and the
+        buffers are emptied.
+        """
+        self.save_buffers(memory)
+        self.empty_buffers()
+        self.close()
+        try:
+            self.file = open(path, "r+b")
+        except FileNotFoundError:
+            self.file = open(path, "w+b")
+        self.map()
+
+    def map(self):
+        size = self.file.seek(0, 2)
+        self.mapping = mmap.mmap(self.file.fileno(), size) if size else None
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def use_buffers(self, memory, address, count):
+        """Use the count buffers starting at address as block buffers. The
+        updated blocks of the previous buffers, still in memory, are written
+        back and the previous buffers are emptied.
+        """
+        self.save_buffers(memory)
+        self.empty_buffers()
+        self.pool = (address, count)
+        self.free_buffers = [address+index*self.block_size for index in reversed(range(count))]
+
+    def read(self, number):
+        """Returns the content of the block number of the file, blank beyond
+        the end of the file.
+        """
+        start = number*self.block_size
+        data = b""
+        if self.mapping is not None:
+            data = self.mapping[start:start+self.block_size]
+        return data.ljust(self.block_size, b" ")
+
+    def write(self, number, data):
+        """Write data as the content of the block number of the file,
+        growing the file if needed.
+        """
+        end = (number+1)*self.block_size
+        if self.mapping is None or len(self.mapping) < end:
+            if self.mapping is not None:
+                self.mapping.close()
+            size = self.file.seek(0, 2)
+            if size < end:
+                # The blocks between the old end and this one are blank.
+                self.file.write(b" "*(end-size))
+                self.file.flush()
+            self.map()
+        self.mapping[end-self.block_size:end] = data
+        self.writes += 1
+
+    def write_back(self, memory, number):
+        address = self.buffers[number]
+        self.write(number, bytes(memory[address:address+self.block_size]))
+        self.updated.discard(number)
+
+    def buffer(self, memory, number, pool, read=True):
+        """Returns the address of the buffer assigned to the block number,
+        assigning one to it if needed, and read the block in it if read.
+        pool is the (address, count) of the block buffers, the buffers are
+        emptied when it changes. The default block file is opened if no
+        block file is. Returns 0 without block buffers or block file.
+        """
+        if pool != self.pool:
+            self.use_buffers(memory, *pool)
+        if not self.buffers and not self.free_buffers:
+            return 0
+        if self.file is None:
+            try:
+                self.open(memory, DEFAULT_BLOCK_FILE)
+            except OSError:
+                return 0
+        address = self.buffers.get(number)
+        if address is not None:
+            self.buffers.move_to_end(number)
+            self.hits += 1
+            self.current = number
+            return address
+        if self.free_buffers:
+            address = self.free_buffers.pop()
+        else:
+            # The least recently used block, unless it is being loaded:
+            # the blocks being loaded are read again when their LOAD goes
+            # on, see restore_source.
+            loaded = set(source[0] for source in self.sources)
+            victim = next(
+                (n for n in self.buffers if n not in loaded),
+                next(iter(self.buffers))
+            )
+            if victim in self.updated:
+                self.write_back(memory, victim)
+            address = self.buffers.pop(victim)
+        self.misses += 1
+        self.buffers[number] = address
+        if read:
+            memory.write_bytes(address, self.read(number))
+        self.current = number
+        return address
+
+    def save_source(self, number, length, buffer_address, in_value):
+        """Save the input source described by length, buffer_address and
+        in_value before loading the block number.
+        """
+        # The block being loaded, if it is the input source: its buffer may
+        # already be reassigned to the block number.
+        outer_block = None
+        pool_address, count = self.pool
+        if self.sources and pool_address <= buffer_address < pool_address + count*self.block_size:
+            outer_block = self.sources[-1][0]
+        self.sources.append((number, length, buffer_address, in_value, outer_block))
+
+    def restore_source(self, memory):
+        """Returns the (#TIB, TIB address, >IN) of the input source saved by
+        the last LOAD. When it is a block being loaded, the TIB address is
+        the buffer of this block, read again if the inner LOAD reassigned
+        its buffer.
+        """
+        number, length, buffer_address, in_value, outer_block = self.sources.pop()
+        if outer_block is not None:
+            address = self.buffer(memory, outer_block, self.pool)
+            if address != 0:
+                buffer_address = address
+        return length, buffer_address, in_value
+
+    def update(self):
+        """Mark the block of the current block buffer as updated.
+        """
+        if self.current in self.buffers:
+            self.updated.add(self.current)
+
+    def save_buffers(self, memory):
+        """Write the updated blocks back to the file.
+        """
+        for number in sorted(self.updated):
+            self.write_back(memory, number)
+        if self.mapping is not None:
+            self.mapping.flush()
+
+    def empty_buffers(self):
+        """Unassign all the block buffers, without writing back the updated
+        blocks.
+        """
+        self.free_buffers.extend(reversed(self.buffers.values()))
+        self.buffers.clear()
+        self.updated.clear()
+        self.current = None
+
+def block_storage(vm):
+    """Returns the block storage of vm, created on first use.
+    """
+    storage = getattr(vm, "block_storage", None)
+    if storage is None:
+        storage = BlockStorage()
+        vm.block_storage = storage
+    return storage
+
+@primitive(59, "OPEN-BLOCKS", returns_next_ip=True)
+def OPEN_BLOCKS(vm):
+    """Use the file named by the string c-addr u as block file, create it
+    if it does not exist. The block buffers are emptied.
+
+    ( c-addr u -- ior )
+    """
+    length = vm.pop_from_data_stack()
+    path = string_at(vm, vm.pop_from_data_stack(), length)
+    try:
+        block_storage(vm).open(vm.memory, path)
+    except (OSError, ValueError):
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+    else:
+        vm.push_on_data_stack(IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(60, "(block)", returns_next_ip=True)
+def block(vm):
+    """Assign one of the n block buffers of 1 KB starting at a-addr1 to the
+    block u, and read the block in it if flag is true. a-addr2 is the
+    address of the buffer, 0 without block buffers or block file.
+
+    ( u flag a-addr1 n -- a-addr2 | 0 )
+    """
+    count = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    read = vm.pop_from_data_stack() != 0
+    number = vm.pop_from_data_stack()
+    vm.push_on_data_stack(block_storage(vm).buffer(vm.memory, number, (address, count), read))
+    return vm.interpreter_pointer
+
+@primitive(61, "UPDATE", returns_next_ip=True)
+def UPDATE(vm):
+    """Mark the current block buffer as updated.
+
+    ( -- )
+    """
+    block_storage(vm).update()
+    return vm.interpreter_pointer
+
+@primitive(62, "SAVE-BUFFERS", returns_next_ip=True)
+def SAVE_BUFFERS(vm):
+    """Write the updated block buffers to the block file.
+
+    ( -- )
+    """
+    block_storage(vm).save_buffers(vm.memory)
+    return vm.interpreter_pointer
+
+@primitive(63, "EMPTY-BUFFERS", returns_next_ip=True)
+def EMPTY_BUFFERS(vm):
+    """Unassign all the block buffers, updated or not.
+
+    ( -- )
+    """
+    block_storage(vm).empty_buffers()
+    return vm.interpreter_pointer
+
+@primitive(64, "(push-block)", returns_next_ip=True)
+def push_block(vm):
+    """Save the input source described by the #TIB and >IN variables at
+    tib and in, and make the block buffer at a-addr of the block u the
+    input source. The block is kept in its buffer until (pop-block).
+
+    ( u a-addr tib in -- )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    number = vm.pop_from_data_stack()
+    storage = block_storage(vm)
+    storage.save_source(
+        number,
+        vm.read_cell_at_address(tib_address),
+        vm.read_cell_at_address(tib_address+vm.cell_size),
+        vm.read_cell_at_address(in_address)
+    )
+    vm.write_cell_at_address(tib_address, storage.block_size)
+    vm.write_cell_at_address(tib_address+vm.cell_size, address)
+    vm.write_cell_at_address(in_address, 0)
+    return vm.interpreter_pointer
+
+@primitive(65, "(pop-block)", returns_next_ip=True)
+def pop_block(vm):
+    """Restore the input source saved by (push-block), reading again the
+    block it interprets if its buffer was reassigned.
+
+    ( tib in -- )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    length, buffer_address, in_value = block_storage(vm).restore_source(vm.memory)
+    vm.write_cell_at_address(tib_address, length)
+    vm.write_cell_at_address(tib_address+vm.cell_size, buffer_address)
+    vm.write_cell_at_address(in_address, in_value)
+    return vm.interpreter_pointer
+
+PRIMITIVES = (
+    OPEN_BLOCKS,
+    block,
+    UPDATE,
+    SAVE_BUFFERS,
+    EMPTY_BUFFERS,
+    push_block,
+    pop_block
+)
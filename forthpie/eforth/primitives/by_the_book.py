@@ -1,60 +1,60 @@
-from ...primitives import primitive, PrimitiveStore
+from ...primitives import primitive, PrimitiveStore, HALT
 from ...primitives import debug
 
 ## System interface
-@primitive(0, "BYE")
+@primitive(0, "BYE", returns_next_ip=True)
 def bye(vm):
     """( -- , exit Forth )
     """
     vm.log_info("Exiting the VM.")
-    # Does nothing and, most importantly, do not call next() thus stopping the vm.
+    vm.output_channel.flush()
+    return HALT
 
-@primitive(1, "?RX")
+@primitive(1, "?RX", returns_next_ip=True)
 def imrx(vm):
     """Return input character and true, or a false if no input.
 
     ( -- c T | F )
     """
+    vm.output_channel.before_input(vm.input_stream)
     c = vm.input_stream.read(1)
     if c != "":
         vm.push_on_data_stack(ord(c))
         vm.push_on_data_stack(vm.cell_all_bit_at_one())
     else:
         vm.push_on_data_stack(0)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(2, "TX!")
+@primitive(2, "TX!", returns_next_ip=True)
 def txem(vm):
     """Send character c to output device.
 
     ( c -- )
     """
     c = vm.pop_from_data_stack()
-    vm.output_stream.write(chr(c))
-    vm.output_stream.flush()
-    vm.next()
+    vm.output_channel.write(c & 0xFF)
+    return vm.interpreter_pointer
 
-@primitive(3, "!IO")
+@primitive(3, "!IO", returns_next_ip=True)
 def emio(vm):
     """Initialize the serial I/O devices.
 
     ( -- )
     """
-    vm.next() # Nothing to do here.
+    return vm.interpreter_pointer # Nothing to do here.
 
 ## Inner vm
-@primitive(4, "doLIT")
+@primitive(4, "doLIT", returns_next_ip=True)
 def doLIT(vm):
     """Push inline literal on data stack.
 
     ( -- w )
     """
     literal_value = vm.read_cell_at_address(vm.interpreter_pointer)
-    vm.interpreter_pointer += vm.cell_size
     vm.push_on_data_stack(literal_value)
-    vm.next()
+    return vm.interpreter_pointer + vm.cell_size
 
-@primitive(5, "doLIST")
+@primitive(5, "doLIST", returns_next_ip=True)
 def doLIST(vm):
     """Run address list in a colon word.
 
@@ -62,11 +62,10 @@ def doLIST(vm):
     """
     # Push intepreter pointer on return stack
     vm.push_on_return_stack(vm.interpreter_pointer)
-    # Update IP to address of cell after W
-    vm.interpreter_pointer = vm.word_pointer + vm.cell_size
-    vm.next()
+    # Continue at the address of the cell after W
+    return vm.word_pointer + vm.cell_size
 
-@primitive(6, "EXECUTE")
+@primitive(6, "EXECUTE", returns_next_ip=True)
 def EXECUTE(vm):
     """Execute the word at ca.
 
@@ -74,16 +73,15 @@ def EXECUTE(vm):
     """
     ca = vm.pop_from_data_stack()
     vm.word_pointer = ca
-    vm.step(vm.read_cell_at_address(ca))
+    return vm.get_primitive_by_address(vm.read_cell_at_address(ca)).dispatch(vm)
 
-@primitive(7, "EXIT")
+@primitive(7, "EXIT", returns_next_ip=True)
 def EXIT(vm):
     """Terminate a colon definition.
     """
-    vm.interpreter_pointer = vm.pop_from_return_stack()
-    vm.next()
+    return vm.pop_from_return_stack()
 
-@primitive(8, "next")
+@primitive(8, "next", returns_next_ip=True)
 def next_primitive(vm):
     """Run time code for the single index loop.
 
@@ -96,13 +94,11 @@ def next_primitive(vm):
     index = vm.pop_from_return_stack()
     index -= 1
     if index < 0:
-        vm.interpreter_pointer += vm.cell_size
-    else:
-        vm.push_on_return_stack(index)
-        vm.interpreter_pointer = vm.read_cell_at_address(vm.interpreter_pointer)
-    vm.next()
+        return vm.interpreter_pointer + vm.cell_size
+    vm.push_on_return_stack(index)
+    return vm.read_cell_at_address(vm.interpreter_pointer)
 
-@primitive(9, "?branch")
+@primitive(9, "?branch", returns_next_ip=True)
 def imbranch(vm):
     """Branch if flag is zero.
 
@@ -110,22 +106,19 @@ def imbranch(vm):
     """
     flag = vm.pop_from_data_stack()
     if flag == 0:
-        vm.interpreter_pointer = vm.read_cell_at_address(vm.interpreter_pointer)
-    else:
-        vm.interpreter_pointer += vm.cell_size
-    vm.next()
+        return vm.read_cell_at_address(vm.interpreter_pointer)
+    return vm.interpreter_pointer + vm.cell_size
 
-@primitive(10, "branch")
+@primitive(10, "branch", returns_next_ip=True)
 def branch(vm):
     """Branch to an inline address.
 
     ( -- )
     """
-    vm.interpreter_pointer = vm.read_cell_at_address(vm.interpreter_pointer)
-    vm.next()
+    return vm.read_cell_at_address(vm.interpreter_pointer)
 
 ## Memory access
-@primitive(11, "!")
+@primitive(11, "!", returns_next_ip=True)
 def em(vm):
     """Pop the data stack to memory.
 
@@ -134,9 +127,9 @@ def em(vm):
     a = vm.pop_from_data_stack()
     w = vm.pop_from_data_stack()
     vm.write_cell_at_address(a, w)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(12, "@")
+@primitive(12, "@", returns_next_ip=True)
 def at(vm):
     """Push memory location to data stack.
 
@@ -145,9 +138,9 @@ def at(vm):
     a = vm.pop_from_data_stack()
     w = vm.read_cell_at_address(a)
     vm.push_on_data_stack(w)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(13, "C!")
+@primitive(13, "C!", returns_next_ip=True)
 def Cem(vm):
     """Pop data stack to byte memory.
 
@@ -156,9 +149,9 @@ def Cem(vm):
     b = vm.pop_from_data_stack()
     c = vm.pop_from_data_stack()
     vm.memory[b] = c
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(14, "C@")
+@primitive(14, "C@", returns_next_ip=True)
 def Cat(vm):
     """Push byte memory content on data stack.
 
@@ -166,29 +159,29 @@ def Cat(vm):
     """
     b = vm.pop_from_data_stack()
     vm.push_on_data_stack(vm.memory[b])
-    vm.next()
+    return vm.interpreter_pointer
 
 ## Return stack
 
-@primitive(15, "RP@")
+@primitive(15, "RP@", returns_next_ip=True)
 def RPat(vm):
     """Push current RP to data stack.
 
     ( -- a )
     """
     vm.push_on_data_stack(vm.return_stack_pointer)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(16, "RP!")
+@primitive(16, "RP!", returns_next_ip=True)
 def RPem(vm):
     """Set the return stack pointer.
 
     ( a -- )
     """
     vm.return_stack_pointer = vm.pop_from_data_stack()
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(17, "R>")
+@primitive(17, "R>", returns_next_ip=True)
 def Rgt(vm):
     """Pop return stack to data stack.
 
@@ -196,9 +189,9 @@ def Rgt(vm):
     """
     w = vm.pop_from_return_stack()
     vm.push_on_data_stack(w)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(18, "R@")
+@primitive(18, "R@", returns_next_ip=True)
 def Rat(vm):
     """Copy top of return stack to data stack.
 
@@ -206,9 +199,9 @@ def Rat(vm):
     """
     w = vm.top_of_return_stack()
     vm.push_on_data_stack(w)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(19, ">R")
+@primitive(19, ">R", returns_next_ip=True)
 def gtR(vm):
     """Pop from data stack and push on return stack.
 
@@ -216,28 +209,28 @@ def gtR(vm):
     """
     w = vm.pop_from_data_stack()
     vm.push_on_return_stack(w)
-    vm.next()
+    return vm.interpreter_pointer
 
 ## Data stack
-@primitive(20, "DROP")
+@primitive(20, "DROP", returns_next_ip=True)
 def DROP(vm):
     """Discard top stack item.
 
     ( w -- )
     """
     vm.deallocate_data_stack()
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(21, "DUP")
+@primitive(21, "DUP", returns_next_ip=True)
 def DUP(vm):
     """Duplicate the top stack item.
 
     ( w -- w w )
     """
     vm.push_on_data_stack(vm.top_of_data_stack())
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(22, "SWAP")
+@primitive(22, "SWAP", returns_next_ip=True)
 def SWAP(vm):
     """Exchange top two stack items.
 
@@ -247,9 +240,9 @@ def SWAP(vm):
     w1 = vm.pop_from_data_stack()
     vm.push_on_data_stack(w2)
     vm.push_on_data_stack(w1)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(23, "OVER")
+@primitive(23, "OVER", returns_next_ip=True)
 def OVER(vm):
     """Copy second stack item to top.
 
@@ -257,28 +250,28 @@ def OVER(vm):
     """
     w1 = vm.tops_of_data_stack(2)[0]
     vm.push_on_data_stack(w1)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(24, "SP@")
+@primitive(24, "SP@", returns_next_ip=True)
 def SPat(vm):
     """Push the current data stack pointer.
 
     ( -- a )
     """
     vm.push_on_data_stack(vm.data_stack_pointer)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(25, "SP!")
+@primitive(25, "SP!", returns_next_ip=True)
 def SPem(vm):
     """Set the data stack pointer.
 
     ( a -- )
     """
     vm.data_stack_pointer = vm.pop_from_data_stack()
-    vm.next()
+    return vm.interpreter_pointer
 
 ## Logic
-@primitive(26, "0<")
+@primitive(26, "0<", returns_next_ip=True)
 def zeroSt(vm):
     """Return true if n is negative.
 
@@ -289,9 +282,9 @@ def zeroSt(vm):
         vm.push_on_data_stack(0)
     else:
         vm.push_on_data_stack(vm.cell_all_bit_at_one())
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(27, "AND")
+@primitive(27, "AND", returns_next_ip=True)
 def AND(vm):
     """Bitwise AND.
 
@@ -300,9 +293,9 @@ def AND(vm):
     vm.push_on_data_stack(
         vm.pop_from_data_stack() & vm.pop_from_data_stack()
     )
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(28, "OR")
+@primitive(28, "OR", returns_next_ip=True)
 def OR(vm):
     """Bitwise inclusive OR.
 
@@ -311,9 +304,9 @@ def OR(vm):
     vm.push_on_data_stack(
         vm.pop_from_data_stack() | vm.pop_from_data_stack()
     )
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(29, "XOR")
+@primitive(29, "XOR", returns_next_ip=True)
 def XOR(vm):
     """Bitwise exclusive OR.
 
@@ -322,10 +315,10 @@ def XOR(vm):
     vm.push_on_data_stack(
         vm.pop_from_data_stack() ^ vm.pop_from_data_stack()
     )
-    vm.next()
+    return vm.interpreter_pointer
 
 ## Arithmetic
-@primitive(30, "UM+")
+@primitive(30, "UM+", returns_next_ip=True)
 def UMplus(vm):
     """Add two numbers, return the sum and carry flag.
 
@@ -339,9 +332,9 @@ def UMplus(vm):
         vm.push_on_data_stack(vm.cell_all_bit_at_one())
     else:
         vm.push_on_data_stack(0)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(31, "UM/MOD")
+@primitive(31, "UM/MOD", returns_next_ip=True)
 def UMMOD(vm):
     u = vm.pop_from_data_stack()
     d = vm.pop_from_data_stack() << (vm.cell_size*8)
@@ -349,14 +342,14 @@ def UMMOD(vm):
 
     vm.push_on_data_stack(d % u)
     vm.push_on_data_stack(d // u)
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(32, "DEBUG")
+@primitive(32, "DEBUG", returns_next_ip=True)
 def DEBUG(vm):
     breakpoint()
-    vm.next()
+    return vm.interpreter_pointer
 
-@primitive(33, "SNAPSHOT")
+@primitive(33, "SNAPSHOT", returns_next_ip=True)
 def SNAPSHOT(vm):
     """Make a snapshot of the current state of the memory and save it in a binary file.
 
@@ -367,25 +360,26 @@ def SNAPSHOT(vm):
     string_address = vm.pop_from_data_stack()
     file_path = bytes(vm.memory[string_address:string_address+string_length]).decode("ascii")
 
-    COLDD = 0x100  # cold boot data address... TODO: should not be hardcoded here
-    vm.write_cell_at_address(
-        COLDD,
-        vm.interpreter_pointer
-    )
-    vm.write_cell_at_address(
-        COLDD+2*vm.cell_size,
-        vm.data_stack_pointer
-    )
-    vm.write_cell_at_address(
-        COLDD+3*vm.cell_size,
-        vm.return_stack_pointer
-    )
-    vm.memory.save(file_path)
+    if vm.image_format is None:
+        # Raw images keep the registers in the cold boot data.
+        COLDD = 0x100  # cold boot data address... TODO: should not be hardcoded here
+        vm.write_cell_at_address(
+            COLDD,
+            vm.interpreter_pointer
+        )
+        vm.write_cell_at_address(
+            COLDD+2*vm.cell_size,
+            vm.data_stack_pointer
+        )
+        vm.write_cell_at_address(
+            COLDD+3*vm.cell_size,
+            vm.return_stack_pointer
+        )
+    vm.save_image(file_path)
 
     if should_quit:
-        bye.execute(vm)
-    else:
-        vm.next()
+        return bye.function(vm)
+    return vm.interpreter_pointer
 
 def primitives_store():
     return PrimitiveStore(
@@ -0,0 +1,296 @@
+"""File access primitives, after the optional File-Access word set of ANS
+Forth.
+
+Files are host files opened in binary mode with large read buffers, known
+to Forth code by the file identifiers of the FileTable of the VM. The
+FileTable also keeps the stack of the input sources saved by INCLUDE-FILE,
+so that included files are read line by line straight into the TIB.
+"""
+from ...primitives import primitive
+
+# File access methods, see R/O, W/O and R/W.
+READ_ONLY = 0
+WRITE_ONLY = 1
+READ_WRITE = 2
+OPEN_MODES = {READ_ONLY: "rb", WRITE_ONLY: "r+b", READ_WRITE: "r+b"}
+CREATE_MODES = {READ_ONLY: "w+b", WRITE_ONLY: "wb", READ_WRITE: "w+b"}
+
+# I/O results, the THROW codes of ANS Forth.
+IOR_SUCCESS = 0
+IOR_FILE_IO_EXCEPTION = -37
+IOR_NON_EXISTENT_FILE = -38
+
+BUFFER_SIZE = 64*1024
+TIB_LINE_LENGTH = 80
+BL = 32
+
+class FileTable(object):
+    """Open files of a VM and input sources saved by INCLUDE-FILE.
+
+    Args:
+        buffer_size (int): The size of the host buffer of each file.
+    """
+    def __init__(self, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.files = dict()
+        self.next_file_id = 1
+        # (file id, TIB bytes, #TIB, >IN) of the input sources to restore.
+        self.sources = []
+
+    def open(self, path, mode):
+        file = open(path, mode, buffering=self.buffer_size)
+        file_id = self.next_file_id
+        self.next_file_id += 1
+        self.files[file_id] = file
+        return file_id
+
+    def close(self, file_id):
+        self.files.pop(file_id).close()
+
+    def read_line(self, file_id, size):
+        """Returns the next line of the file, without its line terminator
+        and cut after size bytes, or None at the end of the file.
+        """
+        file = self.files[file_id]
+        line = file.readline(size)
+        if line == b"":
+            return None
+        if line.endswith(b"\n"):
+            line = line[:-1]
+        elif len(line) == size and file.peek(1)[:1] == b"\n":
+            # The line terminator of a line of size bytes.
+            file.read(1)
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        return line
+
+    @property
+    def source_id(self):
+        return self.sources[-1][0] if self.sources else 0
+
+def file_table(vm):
+    """Returns the file table of vm, created on first use.
+    """
+    table = getattr(vm, "file_table", None)
+    if table is None:
+        table = FileTable()
+        vm.file_table = table
+    return table
+
+def file_io(vm, operation, *args):
+    """Run operation(*args) and push its ior, returns the result of
+    operation or None if it failed.
+    """
+    try:
+        result = operation(*args)
+    except FileNotFoundError:
+        vm.push_on_data_stack(IOR_NON_EXISTENT_FILE)
+        return None
+    except (OSError, KeyError, ValueError):
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+        return None
+    vm.push_on_data_stack(IOR_SUCCESS)
+    return result
+
+def string_at(vm, address, length):
+    return bytes(vm.memory[address:address+length]).decode("latin-1")
+
+def open_or_create(vm, modes):
+    access_method = vm.pop_from_data_stack()
+    length = vm.pop_from_data_stack()
+    path = string_at(vm, vm.pop_from_data_stack(), length)
+    if access_method not in modes:
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+        return vm.interpreter_pointer
+    table = file_table(vm)
+    try:
+        file_id = table.open(path, modes[access_method])
+    except FileNotFoundError:
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(IOR_NON_EXISTENT_FILE)
+    except OSError:
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+    else:
+        vm.push_on_data_stack(file_id)
+        vm.push_on_data_stack(IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(49, "OPEN-FILE", returns_next_ip=True)
+def OPEN_FILE(vm):
+    """Open the file named by the string c-addr u with access method fam.
+
+    ( c-addr u fam -- fileid ior )
+    """
+    return open_or_create(vm, OPEN_MODES)
+
+@primitive(50, "CREATE-FILE", returns_next_ip=True)
+def CREATE_FILE(vm):
+    """Create the file named by the string c-addr u, or empty it if it
+    exists, and open it with access method fam.
+
+    ( c-addr u fam -- fileid ior )
+    """
+    return open_or_create(vm, CREATE_MODES)
+
+@primitive(51, "CLOSE-FILE", returns_next_ip=True)
+def CLOSE_FILE(vm):
+    """Close the file fileid.
+
+    ( fileid -- ior )
+    """
+    file_io(vm, file_table(vm).close, vm.pop_from_data_stack())
+    return vm.interpreter_pointer
+
+@primitive(52, "READ-FILE", returns_next_ip=True)
+def READ_FILE(vm):
+    """Read at most u1 bytes of the file fileid in the buffer at c-addr, u2
+    is the number of bytes read, 0 at the end of the file.
+
+    ( c-addr u1 fileid -- u2 ior )
+    """
+    file_id = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    files = file_table(vm).files
+    try:
+        data = files[file_id].read(size)
+    except (OSError, KeyError, ValueError):
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+        return vm.interpreter_pointer
+    vm.memory.write_bytes(address, data)
+    vm.push_on_data_stack(len(data))
+    vm.push_on_data_stack(IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(53, "READ-LINE", returns_next_ip=True)
+def READ_LINE(vm):
+    """Read the next line of the file fileid in the buffer at c-addr, at most
+    u1 bytes of it. u2 is the length of the line read, without its line
+    terminator, flag is false at the end of the file.
+
+    ( c-addr u1 fileid -- u2 flag ior )
+    """
+    file_id = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    try:
+        line = file_table(vm).read_line(file_id, size)
+    except (OSError, KeyError, ValueError):
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(IOR_FILE_IO_EXCEPTION)
+        return vm.interpreter_pointer
+    if line is None:
+        vm.push_on_data_stack(0)
+        vm.push_on_data_stack(0)
+    else:
+        vm.memory.write_bytes(address, line)
+        vm.push_on_data_stack(len(line))
+        vm.push_on_data_stack(vm.cell_all_bit_at_one())
+    vm.push_on_data_stack(IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(54, "WRITE-FILE", returns_next_ip=True)
+def WRITE_FILE(vm):
+    """Write the u bytes at c-addr in the file fileid.
+
+    ( c-addr u fileid -- ior )
+    """
+    file_id = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    files = file_table(vm).files
+    file_io(vm, lambda: files[file_id].write(bytes(vm.memory[address:address+size])))
+    return vm.interpreter_pointer
+
+@primitive(55, "SOURCE-ID", returns_next_ip=True)
+def SOURCE_ID(vm):
+    """Identifier of the file being included, 0 for the input stream.
+
+    ( -- 0 | fileid )
+    """
+    vm.push_on_data_stack(file_table(vm).source_id)
+    return vm.interpreter_pointer
+
+@primitive(56, "(push-source)", returns_next_ip=True)
+def push_source(vm):
+    """Save the input source described by the #TIB and >IN variables at
+    tib and in, with the content of the TIB, and make the file fileid the
+    input source.
+
+    ( fileid tib in -- )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    file_id = vm.pop_from_data_stack()
+    length = vm.read_cell_at_address(tib_address)
+    buffer_address = vm.read_cell_at_address(tib_address+vm.cell_size)
+    file_table(vm).sources.append((
+        file_id,
+        bytes(vm.memory[buffer_address:buffer_address+length]),
+        length,
+        vm.read_cell_at_address(in_address)
+    ))
+    return vm.interpreter_pointer
+
+@primitive(57, "(pop-source)", returns_next_ip=True)
+def pop_source(vm):
+    """Close the file of the current input source and restore the input
+    source saved by (push-source).
+
+    ( tib in -- )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    table = file_table(vm)
+    file_id, content, length, in_value = table.sources.pop()
+    if file_id in table.files:
+        table.close(file_id)
+    vm.memory.write_bytes(vm.read_cell_at_address(tib_address+vm.cell_size), content)
+    vm.write_cell_at_address(tib_address, length)
+    vm.write_cell_at_address(in_address, in_value)
+    return vm.interpreter_pointer
+
+@primitive(58, "(refill)", returns_next_ip=True)
+def refill(vm):
+    """Read the next line of the file being included in the TIB, and set the
+    #TIB and >IN variables at tib and in. Lines longer than the TIB go on
+    in the next line and control characters are read as blanks, as accept
+    does. flag is false at the end of the file or if no file is included.
+
+    ( tib in -- flag )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    table = file_table(vm)
+    line = None
+    if table.sources:
+        try:
+            line = table.read_line(table.source_id, TIB_LINE_LENGTH)
+        except (OSError, KeyError, ValueError):
+            line = None
+    if line is None:
+        vm.push_on_data_stack(0)
+        return vm.interpreter_pointer
+    line = bytes(code if BL <= code < 127 else BL for code in line)
+    vm.memory.write_bytes(vm.read_cell_at_address(tib_address+vm.cell_size), line)
+    vm.write_cell_at_address(tib_address, len(line))
+    vm.write_cell_at_address(in_address, 0)
+    vm.push_on_data_stack(vm.cell_all_bit_at_one())
+    return vm.interpreter_pointer
+
+PRIMITIVES = (
+    OPEN_FILE,
+    CREATE_FILE,
+    CLOSE_FILE,
+    READ_FILE,
+    READ_LINE,
+    WRITE_FILE,
+    SOURCE_ID,
+    push_source,
+    pop_source,
+    refill
+)
@@ -0,0 +1,575 @@
+"""Primitives of the forthpie image doing natively the job of some of the
+colon definitions of the book.
+"""
+import re
+
+from ...primitives import primitive, PrimitiveStore
+from . import superinstructions, file_access, blocks, memory_allocation
+from .by_the_book import txem, DROP
+
+BL = 32
+LF = 10
+BACKSPACE = 8
+# The characters -TRAILING removes, as the book's -TRAILING does.
+BLANKS = bytes(range(BL+1))
+# The blanks before a word delimited by BL and the word, the parse of the
+# book takes all the characters up to BL as blanks.
+BLANK_DELIMITED = re.compile(rb"[\x00-\x20]*([^\x00-\x20]*)")
+
+class DictionaryIndex(object):
+    """Hash index of the vocabularies of the name dictionary of a VM.
+
+    Each vocabulary maps the names of its entries to the latest entry with
+    this name, and the code addresses of its entries to the latest entry
+    with this code address. Names are keyed on the bytes find compares: the
+    first cell masked with lexicon_mask and the following cells up to the
+    end of the name.
+
+    The head of a vocabulary is read from memory on every search, so that
+    OVERT and changes of CONTEXT or CURRENT are seen at once: the entries
+    linked in front of the indexed ones are added to the index, any other
+    change of head rebuilds it. A write barrier on the bytes of the indexed
+    entries drops the whole index when one of them is written.
+
+    Args:
+        manipulator (MemoryManipulator): The VM whose memory is indexed.
+        lexicon_mask (int): The mask removing the flags of the first cell
+                            of a name.
+    """
+    def __init__(self, manipulator, lexicon_mask):
+        self.manipulator = manipulator
+        self.memory = manipulator.memory
+        self.lexicon_mask = lexicon_mask
+        # (head, names, code addresses) of the vocabularies, by address.
+        self.vocabularies = dict()
+
+    def name_key(self, address, first_cell):
+        cell_size = self.manipulator.cell_size
+        count = first_cell & 0xFF
+        return (first_cell, bytes(self.memory[address+cell_size:address+cell_size*(count//cell_size+1)]))
+
+    def entry_written(self, address):
+        """Write barrier dropping the index when an indexed entry changes.
+        """
+        self.memory.unwatch_all(self.entry_written)
+        self.vocabularies.clear()
+
+    def vocabulary(self, vocabulary_address):
+        """Returns the (head, names, code addresses) index of the vocabulary
+        at vocabulary_address, up to date with its head.
+        """
+        read_cell_at_address = self.manipulator.read_cell_at_address
+        cell_size = self.manipulator.cell_size
+        head = read_cell_at_address(vocabulary_address)
+        indexed = self.vocabularies.get(vocabulary_address)
+        if indexed is not None and indexed[0] == head:
+            return indexed
+
+        new_entries = []
+        old_head = indexed[0] if indexed is not None else None
+        name_address = head
+        while name_address != 0 and name_address != old_head:
+            new_entries.append(name_address)
+            name_address = read_cell_at_address(name_address-cell_size)
+        if indexed is not None and name_address == old_head:
+            names, code_addresses = indexed[1], indexed[2]
+        else:
+            names, code_addresses = dict(), dict()
+
+        for name_address in reversed(new_entries):
+            first_cell = read_cell_at_address(name_address) & self.lexicon_mask
+            names[self.name_key(name_address, first_cell)] = name_address
+            code_addresses[read_cell_at_address(name_address-2*cell_size)] = name_address
+            end = name_address + cell_size*((first_cell & 0xFF)//cell_size+1)
+            for address in range(name_address-2*cell_size, end):
+                self.memory.watch(address, self.entry_written)
+
+        indexed = (head, names, code_addresses)
+        self.vocabularies[vocabulary_address] = indexed
+        return indexed
+
+    def find(self, address, vocabulary_address):
+        """Returns the name address of the latest entry of the vocabulary
+        named by the packed string at address, or 0.
+        """
+        names = self.vocabulary(vocabulary_address)[1]
+        return names.get(self.name_key(address, self.manipulator.read_cell_at_address(address)), 0)
+
+    def name_of(self, code_address, vocabulary_address):
+        """Returns the name address of the latest entry of the vocabulary
+        with code_address, or 0.
+        """
+        return self.vocabulary(vocabulary_address)[2].get(code_address, 0)
+
+def dictionary_index(vm, lexicon_mask):
+    """Returns the dictionary index of vm, a new one if its memory or the
+    lexicon mask changed.
+    """
+    index = getattr(vm, "dictionary_index", None)
+    if index is None or index.memory is not vm.memory or index.lexicon_mask != lexicon_mask:
+        if index is not None:
+            index.memory.unwatch_all(index.entry_written)
+        index = DictionaryIndex(vm, lexicon_mask)
+        vm.dictionary_index = index
+    return index
+
+@primitive(46, "(find)", returns_next_ip=True)
+def find(vm):
+    """Search vocabulary va for the packed string at a, with lexicon mask
+    mask. Same results as the find of the book, through the dictionary index
+    of the VM.
+
+    ( a va mask -- ca na | a F )
+    """
+    lexicon_mask = vm.pop_from_data_stack()
+    vocabulary_address = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    name_address = dictionary_index(vm, lexicon_mask).find(address, vocabulary_address)
+    if name_address == 0:
+        vm.push_on_data_stack(address)
+    else:
+        vm.push_on_data_stack(vm.read_cell_at_address(name_address-2*vm.cell_size))
+    vm.push_on_data_stack(name_address)
+    return vm.interpreter_pointer
+
+@primitive(47, "(>NAME)", returns_next_ip=True)
+def toNAME(vm):
+    """Search the vocabularies linked from the cell after a for the entry of
+    the code address ca, with lexicon mask mask. Vocabularies are linked by
+    the cell following their head, the search stops at a null link.
+
+    ( ca a mask -- na | F )
+    """
+    lexicon_mask = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    code_address = vm.pop_from_data_stack()
+    index = dictionary_index(vm, lexicon_mask)
+    vocabulary_address = vm.read_cell_at_address(address+vm.cell_size)
+    name_address = 0
+    while vocabulary_address != 0 and name_address == 0:
+        name_address = index.name_of(code_address, vocabulary_address)
+        vocabulary_address = vm.read_cell_at_address(vocabulary_address+vm.cell_size)
+    vm.push_on_data_stack(name_address)
+    return vm.interpreter_pointer
+
+@primitive(48, "(accept)", returns_next_ip=True)
+def accept(vm):
+    """Read a line of at most u characters from the input stream in the
+    buffer at b, as accept does with ?RX as '?KEY and kTAP as 'TAP: the line
+    ends with LF, backspace erases the previous character and the other
+    control characters are read as blanks. Characters are echoed with the
+    execution token echo, which must be TX! or DROP. The line is read from
+    the text input stream, which ?RX reads too.
+
+    Returns false without reading anything for any other echo or if the
+    input stream has no more characters.
+
+    ( b u echo -- b u' T | b u F )
+    """
+    echo = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    buffer_address = vm.top_of_data_stack()
+    echo_code = vm.read_cell_at_address(echo)
+    if echo_code not in (txem.code, DROP.code):
+        vm.push_on_data_stack(size)
+        vm.push_on_data_stack(0)
+        return vm.interpreter_pointer
+    echo_byte = vm.output_channel.write if echo_code == txem.code else lambda byte: None
+
+    vm.output_channel.before_input(vm.input_stream)
+    line = []
+    end_of_input = False
+    while len(line) < size:
+        characters = vm.input_stream.readline(size-len(line))
+        if characters == "":
+            end_of_input = True
+            break
+        for character in characters:
+            code = ord(character)
+            if code == LF:
+                break
+            if code == BACKSPACE:
+                if line:
+                    line.pop()
+                    echo_byte(BACKSPACE)
+                    echo_byte(BL)
+                    echo_byte(BACKSPACE)
+                continue
+            if not BL <= code < 127:
+                code = BL
+            line.append(code)
+            echo_byte(code)
+        else:
+            continue
+        break
+
+    if end_of_input and not line:
+        vm.push_on_data_stack(size)
+        vm.push_on_data_stack(0)
+        return vm.interpreter_pointer
+    for address, code in enumerate(line, buffer_address):
+        vm.memory[address] = code
+    vm.push_on_data_stack(len(line))
+    vm.push_on_data_stack(vm.cell_all_bit_at_one())
+    return vm.interpreter_pointer
+
+def copy_lowest_first(memory, source, destination, size):
+    """Copy size bytes from source to destination as a byte by byte copy
+    starting with the lowest address does.
+    """
+    if source < destination < source+size:
+        pattern = bytes(memory[source:destination])
+        data = (pattern * (size//len(pattern)+1))[:size]
+    else:
+        data = bytes(memory[source:source+size])
+    memory.write_bytes(destination, data)
+
+@primitive(71, "CMOVE", returns_next_ip=True)
+def CMOVE(vm):
+    """Copy u bytes from b1 to b2, lowest address first: when b2 is in the
+    bytes copied, the bytes between b1 and b2 are repeated, as with a byte
+    by byte copy.
+
+    ( b1 b2 u -- )
+    """
+    size = vm.pop_from_data_stack()
+    destination = vm.pop_from_data_stack()
+    source = vm.pop_from_data_stack()
+    copy_lowest_first(vm.memory, source, destination, size)
+    return vm.interpreter_pointer
+
+@primitive(72, "CMOVE>", returns_next_ip=True)
+def CMOVEup(vm):
+    """Copy u bytes from b1 to b2, highest address first: when b1 is in the
+    bytes copied, the bytes between b2+u and b1+u are repeated, as with a
+    byte by byte copy.
+
+    ( b1 b2 u -- )
+    """
+    size = vm.pop_from_data_stack()
+    destination = vm.pop_from_data_stack()
+    source = vm.pop_from_data_stack()
+    memory = vm.memory
+    if destination < source < destination+size:
+        pattern = bytes(memory[destination+size:source+size])
+        data = (pattern * (size//len(pattern)+1))[-size:]
+    else:
+        data = bytes(memory[source:source+size])
+    memory.write_bytes(destination, data)
+    return vm.interpreter_pointer
+
+@primitive(73, "MOVE", returns_next_ip=True)
+def MOVE(vm):
+    """Copy u bytes from b1 to b2, as if they were copied in a temporary
+    buffer first.
+
+    ( b1 b2 u -- )
+    """
+    size = vm.pop_from_data_stack()
+    destination = vm.pop_from_data_stack()
+    source = vm.pop_from_data_stack()
+    vm.memory.write_bytes(destination, bytes(vm.memory[source:source+size]))
+    return vm.interpreter_pointer
+
+@primitive(74, "FILL", returns_next_ip=True)
+def FILL(vm):
+    """Store the lowest byte of c in the u bytes from b.
+
+    ( b u c -- )
+    """
+    byte = vm.pop_from_data_stack() & 0xFF
+    size = vm.pop_from_data_stack()
+    vm.memory.write_bytes(vm.pop_from_data_stack(), bytes([byte])*size)
+    return vm.interpreter_pointer
+
+@primitive(75, "ERASE", returns_next_ip=True)
+def ERASE(vm):
+    """Store 0 in the u bytes from b.
+
+    ( b u -- )
+    """
+    size = vm.pop_from_data_stack()
+    vm.memory.write_bytes(vm.pop_from_data_stack(), bytes(size))
+    return vm.interpreter_pointer
+
+@primitive(76, "COMPARE", returns_next_ip=True)
+def COMPARE(vm):
+    """Compare the strings c-addr1 u1 and c-addr2 u2 byte by byte, n is 0
+    when they are the same, -1 when the first one comes first and 1
+    otherwise. A string comes after the strings it starts with.
+
+    ( c-addr1 u1 c-addr2 u2 -- n )
+    """
+    length2 = vm.pop_from_data_stack()
+    address2 = vm.pop_from_data_stack()
+    length1 = vm.pop_from_data_stack()
+    address1 = vm.pop_from_data_stack()
+    with vm.memory.view(address1, length1) as first, vm.memory.view(address2, length2) as second:
+        if first == second:
+            vm.push_on_data_stack(0)
+        elif first.tobytes() < second.tobytes():
+            vm.push_on_data_stack(vm.cell_all_bit_at_one())
+        else:
+            vm.push_on_data_stack(1)
+    return vm.interpreter_pointer
+
+@primitive(77, "SEARCH", returns_next_ip=True)
+def SEARCH(vm):
+    """Search the string c-addr1 u1 for the string c-addr2 u2. When it is
+    found, c-addr3 u3 is the rest of the first string from the match and
+    flag is true, otherwise c-addr3 u3 is c-addr1 u1 and flag is false.
+
+    ( c-addr1 u1 c-addr2 u2 -- c-addr3 u3 flag )
+    """
+    length2 = vm.pop_from_data_stack()
+    address2 = vm.pop_from_data_stack()
+    length1 = vm.pop_from_data_stack()
+    address1 = vm.top_of_data_stack()
+    memory = vm.memory
+    with memory.view(address2, length2) as searched:
+        index = memory.bytes_array.find(searched, address1, address1+length1)
+    if index == -1:
+        vm.push_on_data_stack(length1)
+        vm.push_on_data_stack(0)
+    else:
+        vm.pop_from_data_stack()
+        vm.push_on_data_stack(index)
+        vm.push_on_data_stack(address1+length1-index)
+        vm.push_on_data_stack(vm.cell_all_bit_at_one())
+    return vm.interpreter_pointer
+
+@primitive(78, "SCAN", returns_next_ip=True)
+def SCAN(vm):
+    """Find the first character c in the string c-addr1 u1, c-addr2 u2 is
+    the rest of the string from it, empty if c is not in the string.
+
+    ( c-addr1 u1 c -- c-addr2 u2 )
+    """
+    character = vm.pop_from_data_stack() & 0xFF
+    length = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    index = vm.memory.bytes_array.find(bytes([character]), address, address+length)
+    if index == -1:
+        index = address+length
+    vm.push_on_data_stack(index)
+    vm.push_on_data_stack(address+length-index)
+    return vm.interpreter_pointer
+
+@primitive(79, "SKIP", returns_next_ip=True)
+def SKIP(vm):
+    """Skip the characters c starting the string c-addr1 u1, c-addr2 u2 is
+    the rest of the string.
+
+    ( c-addr1 u1 c -- c-addr2 u2 )
+    """
+    character = vm.pop_from_data_stack() & 0xFF
+    length = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    with vm.memory.view(address, length) as string:
+        rest = len(string.tobytes().lstrip(bytes([character])))
+    vm.push_on_data_stack(address+length-rest)
+    vm.push_on_data_stack(rest)
+    return vm.interpreter_pointer
+
+@primitive(80, "-TRAILING", returns_next_ip=True)
+def dash_TRAILING(vm):
+    """Remove the blanks and control characters ending the string b u.
+
+    ( b u -- b u' )
+    """
+    length = vm.pop_from_data_stack()
+    with vm.memory.view(vm.top_of_data_stack(), length) as string:
+        vm.push_on_data_stack(len(string.tobytes().rstrip(BLANKS)))
+    return vm.interpreter_pointer
+
+def digit_value(character, base, mask):
+    """Returns the value of the digit character in base and whether it is a
+    digit of base, as the DIGIT? of the book computes them: the letters
+    after 9 are digits from 10 on, other characters have values of base or
+    more.
+    """
+    value = (character - ord('0')) & mask
+    if 9 < value <= mask >> 1:
+        value -= 7
+        if value < 10:
+            value = mask
+    return value, value < base
+
+@primitive(81, "DIGIT?", returns_next_ip=True)
+def DIGITim(vm):
+    """Convert the character c to its value u in base, flag is true when c
+    is a digit of base.
+
+    ( c base -- u flag )
+    """
+    base = vm.pop_from_data_stack()
+    value, is_digit = digit_value(vm.pop_from_data_stack(), base, vm.cell_all_bit_at_one())
+    vm.push_on_data_stack(value)
+    vm.push_on_data_stack(vm.cell_all_bit_at_one() if is_digit else 0)
+    return vm.interpreter_pointer
+
+@primitive(82, "(number?)", returns_next_ip=True)
+def NUMBERim(vm):
+    """Convert the packed string at a to the number n in the base of the
+    BASE variable at base, with the sign and $ hexadecimal prefix the
+    NUMBER? of the book reads. Its flag is a on success, as in the book.
+
+    ( a base -- n a | a F )
+    """
+    base_address = vm.pop_from_data_stack()
+    address = vm.top_of_data_stack()
+    memory = vm.memory
+    mask = vm.cell_all_bit_at_one()
+    base = vm.read_cell_at_address(base_address)
+    start = (address+1) & mask
+    length = memory[address]
+    if memory[start] == ord('$'):
+        base = 16
+        start = (start+1) & mask
+        length = (length-1) & mask
+    negative = memory[start] == ord('-')
+    if negative:
+        start = (start+1) & mask
+        length = (length-1) & mask
+    if length == 0:
+        vm.push_on_data_stack(0)
+        return vm.interpreter_pointer
+    value = 0
+    for index in range(length):
+        digit, is_digit = digit_value(memory[(start+index) & mask], base, mask)
+        if not is_digit:
+            vm.push_on_data_stack(0)
+            return vm.interpreter_pointer
+        value = (value*base + digit) & mask
+    if negative:
+        value = -value & mask
+    vm.pop_from_data_stack()
+    vm.push_on_data_stack(value)
+    vm.push_on_data_stack(address)
+    return vm.interpreter_pointer
+
+@primitive(83, "(#S)", returns_next_ip=True)
+def digits(vm):
+    """Hold the digits of u in base, as # does until the rest is 0, the
+    HLD variable at hld points to the last digit held.
+
+    ( u base hld -- 0 )
+    """
+    hld_address = vm.pop_from_data_stack()
+    base = vm.pop_from_data_stack()
+    value = vm.pop_from_data_stack()
+    memory = vm.memory
+    mask = vm.cell_all_bit_at_one()
+    hld = vm.read_cell_at_address(hld_address)
+    while True:
+        value, digit = divmod(value, base)
+        hld = (hld-1) & mask
+        memory[hld] = (digit + (ord('7') if 9 < digit <= mask >> 1 else ord('0'))) & mask
+        if value == 0:
+            break
+    vm.write_cell_at_address(hld_address, hld)
+    vm.push_on_data_stack(0)
+    return vm.interpreter_pointer
+
+def parse_string(memory, address, length, delimiter):
+    """Returns the string delimited by delimiter in the length bytes at
+    address, its length and the number of bytes parsed, up to and including
+    the delimiter, as the parse of the book does. With BL as delimiter, the
+    leading blanks are skipped and any blank or control character ends the
+    string.
+    """
+    end = address+length
+    if length == 0:
+        return address, 0, 0
+    if delimiter == BL:
+        match = BLANK_DELIMITED.match(memory.bytes_array, address, end)
+        start, stop = match.span(1)
+        if start == end:
+            return end, 0, 0
+    else:
+        start = address
+        stop = -1
+        if delimiter <= 0xFF:
+            stop = memory.bytes_array.find(bytes([delimiter]), start, end)
+    if stop == -1 or stop == end:
+        return start, end-start, end-address
+    return start, stop-start, stop+1-address
+
+@primitive(84, "parse", returns_next_ip=True)
+def parse(vm):
+    """Scan the string b u for the string delimited by c, b1 u1 is this
+    string and delta the number of bytes parsed.
+
+    ( b u c -- b1 u1 delta )
+    """
+    delimiter = vm.pop_from_data_stack()
+    length = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    for value in parse_string(vm.memory, address, length, delimiter):
+        vm.push_on_data_stack(value)
+    return vm.interpreter_pointer
+
+@primitive(85, "(PARSE)", returns_next_ip=True)
+def PARSE(vm):
+    """Parse the string delimited by c from the input buffer described by
+    the #TIB and >IN variables at tib and in, moving >IN past it.
+
+    ( c tib in -- b u )
+    """
+    in_address = vm.pop_from_data_stack()
+    tib_address = vm.pop_from_data_stack()
+    delimiter = vm.pop_from_data_stack()
+    mask = vm.cell_all_bit_at_one()
+    parsed = vm.read_cell_at_address(in_address)
+    address = (vm.read_cell_at_address(tib_address+vm.cell_size) + parsed) & mask
+    length = (vm.read_cell_at_address(tib_address) - parsed) & mask
+    start, length, delta = parse_string(vm.memory, address, length, delimiter)
+    vm.write_cell_at_address(in_address, (parsed+delta) & mask)
+    vm.push_on_data_stack(start)
+    vm.push_on_data_stack(length)
+    return vm.interpreter_pointer
+
+@primitive(86, "PACK$", returns_next_ip=True)
+def PACKS(vm):
+    """Pack the string b u at the aligned address a, as a count byte and the
+    bytes of the string, its last cell padded with nulls.
+
+    ( b u a -- a )
+    """
+    address = vm.pop_from_data_stack()
+    length = vm.pop_from_data_stack()
+    source = vm.pop_from_data_stack()
+    cell_size = vm.cell_size
+    address = (address + (-address % cell_size)) & vm.cell_all_bit_at_one()
+    vm.write_cell_at_address(address + length - length % cell_size, 0)
+    vm.memory[address] = length
+    copy_lowest_first(vm.memory, source, address+1, length)
+    vm.push_on_data_stack(address)
+    return vm.interpreter_pointer
+
+def primitives_store():
+    return PrimitiveStore(
+        *superinstructions.primitives_store().primitives,
+        find,
+        toNAME,
+        accept,
+        CMOVE,
+        CMOVEup,
+        MOVE,
+        FILL,
+        ERASE,
+        COMPARE,
+        SEARCH,
+        SCAN,
+        SKIP,
+        dash_TRAILING,
+        DIGITim,
+        NUMBERim,
+        digits,
+        parse,
+        PARSE,
+        PACKS,
+        *file_access.PRIMITIVES,
+        *blocks.PRIMITIVES,
+        *memory_allocation.PRIMITIVES
+    )
@@ -0,0 +1,351 @@
+"""Memory allocation primitives, after the optional Memory-Allocation word
+set of ANS Forth.
+
+The heap is a region of the memory of the VM, all of its bookkeeping is in
+the region itself so that images keep their heap. The region starts with a
+header: the address of the end of the heap, the bytes allocated, their peak
+and the heads of the free lists of each size class. Blocks follow it up to
+an empty block marking the end.
+
+The first cell of a block holds its size, a multiple of two cells, with the
+USED bit set for an allocated block and the PREVIOUS_USED bit set when the
+block before it is allocated. Allocated blocks hold their data after this
+cell. Free blocks hold the next and previous free blocks of their size
+class after it, and their size again in their last cell, so that a freed
+block is merged at once with the free blocks around it.
+
+The small size classes hold blocks of a single size and the other ones
+blocks of sizes between two powers of two: most allocations take the first
+block of a free list and most frees put the block in front of one.
+"""
+from ...primitives import primitive
+
+# I/O results, the THROW codes of ANS Forth.
+IOR_SUCCESS = 0
+IOR_ALLOCATE = -59
+IOR_FREE = -60
+IOR_RESIZE = -61
+
+USED = 1
+PREVIOUS_USED = 2
+FLAGS = USED | PREVIOUS_USED
+
+# Header cells before the heads of the free lists.
+END, LIVE, PEAK = range(3)
+HEADER_CELLS = 3
+# Size classes of blocks of 2 to 17 units of two cells, one per size...
+EXACT_CLASSES = 16
+# ... then one for each power of two.
+NUMBER_OF_CLASSES = 24
+# Header, next, previous and size of a free block.
+MINIMUM_BLOCK_CELLS = 4
+
+class Heap(object):
+    """The heap of a VM starting at address.
+
+    Args:
+        manipulator (MemoryManipulator): The VM whose memory holds the heap.
+        address (int): The address of the heap header.
+    """
+    def __init__(self, manipulator, address):
+        self.manipulator = manipulator
+        self.address = address
+        self.cell_size = manipulator.cell_size
+        self.unit = 2*self.cell_size
+        self.minimum_block_size = MINIMUM_BLOCK_CELLS*self.cell_size
+        self.first_block = self.address + (HEADER_CELLS+NUMBER_OF_CLASSES)*self.cell_size
+        self.read = manipulator.read_cell_at_address
+        self.write = manipulator.write_cell_at_address
+
+    @classmethod
+    def format(cls, manipulator, address, size):
+        """Make a heap of the size bytes at address, returns it or None if
+        size is too small.
+        """
+        cell_size = manipulator.cell_size
+        end_of_region = (address+size) // cell_size * cell_size
+        address = -(-address // cell_size) * cell_size
+        heap = cls(manipulator, address)
+        block_size = (end_of_region - cell_size - heap.first_block) // heap.unit * heap.unit
+        if block_size < heap.minimum_block_size:
+            return None
+        end = heap.first_block + block_size
+        heap.write(address + END*cell_size, end)
+        heap.write(address + LIVE*cell_size, 0)
+        heap.write(address + PEAK*cell_size, 0)
+        for size_class in range(NUMBER_OF_CLASSES):
+            heap.write(heap.head_address(size_class), 0)
+        heap.write(end, USED)
+        heap.write(heap.first_block, PREVIOUS_USED)
+        heap.insert(heap.first_block, block_size)
+        return heap
+
+    @property
+    def end(self):
+        return self.read(self.address + END*self.cell_size)
+
+    def head_address(self, size_class):
+        return self.address + (HEADER_CELLS+size_class)*self.cell_size
+
+    def size_class(self, size):
+        units = size // self.unit
+        if units < EXACT_CLASSES+2:
+            return units-2
+        return min(EXACT_CLASSES + units.bit_length() - 5, NUMBER_OF_CLASSES-1)
+
+    def block_size(self, size):
+        """Returns the size of the block holding size bytes of data.
+        """
+        return max(self.minimum_block_size, -(-(size+self.cell_size) // self.unit) * self.unit)
+
+    def account(self, delta):
+        live_address = self.address + LIVE*self.cell_size
+        live = self.read(live_address) + delta
+        self.write(live_address, live)
+        peak_address = self.address + PEAK*self.cell_size
+        if live > self.read(peak_address):
+            self.write(peak_address, live)
+
+    def insert(self, block, size):
+        """Make the block of size bytes free and put it in front of the
+        free list of its size class. The block after it is told.
+        """
+        cell_size = self.cell_size
+        head_address = self.head_address(self.size_class(size))
+        head = self.read(head_address)
+        self.write(block, size | (self.read(block) & PREVIOUS_USED))
+        self.write(block+cell_size, head)
+        self.write(block+2*cell_size, 0)
+        self.write(block+size-cell_size, size)
+        if head != 0:
+            self.write(head+2*cell_size, block)
+        self.write(head_address, block)
+        self.write(block+size, self.read(block+size) & ~PREVIOUS_USED)
+
+    def unlink(self, block):
+        """Remove the free block from its free list.
+        """
+        cell_size = self.cell_size
+        next_block = self.read(block+cell_size)
+        previous_block = self.read(block+2*cell_size)
+        if previous_block == 0:
+            self.write(self.head_address(self.size_class(self.read(block) & ~FLAGS)), next_block)
+        else:
+            self.write(previous_block+cell_size, next_block)
+        if next_block != 0:
+            self.write(next_block+2*cell_size, previous_block)
+
+    def release(self, block, size):
+        """Free the block of size bytes, merged with the free blocks around
+        it.
+        """
+        following = block + size
+        following_header = self.read(following)
+        if not following_header & USED:
+            self.unlink(following)
+            size += following_header & ~FLAGS
+        if not self.read(block) & PREVIOUS_USED:
+            previous_size = self.read(block-self.cell_size)
+            block -= previous_size
+            self.unlink(block)
+            size += previous_size
+        self.insert(block, size)
+
+    def use(self, block, size, needed):
+        """Allocate needed bytes of the free block of size bytes, unlinked
+        from its free list, and free the rest of it.
+        """
+        flags = (self.read(block) & PREVIOUS_USED) | USED
+        if size - needed >= self.minimum_block_size:
+            self.write(block, needed | flags)
+            self.write(block+needed, PREVIOUS_USED)
+            self.release(block+needed, size-needed)
+            size = needed
+        else:
+            self.write(block, size | flags)
+            self.write(block+size, self.read(block+size) | PREVIOUS_USED)
+        self.account(size)
+
+    def find(self, needed):
+        """Returns a free block of needed bytes or more, or 0.
+        """
+        size_class = self.size_class(needed)
+        block = self.read(self.head_address(size_class))
+        if size_class >= EXACT_CLASSES:
+            # First fit, the blocks of this class may be too small.
+            while block != 0 and self.read(block) & ~FLAGS < needed:
+                block = self.read(block+self.cell_size)
+        while block == 0 and size_class < NUMBER_OF_CLASSES-1:
+            size_class += 1
+            block = self.read(self.head_address(size_class))
+        return block
+
+    def allocate(self, size):
+        """Returns the address of size bytes of data, or 0.
+        """
+        needed = self.block_size(size)
+        if needed > self.end - self.first_block:
+            return 0
+        block = self.find(needed)
+        if block == 0:
+            return 0
+        self.unlink(block)
+        self.use(block, self.read(block) & ~FLAGS, needed)
+        return block + self.cell_size
+
+    def allocated_block(self, address):
+        """Returns the block of the data at address and its size, or None if
+        address was not returned by allocate.
+        """
+        block = address - self.cell_size
+        if block < self.first_block or block >= self.end or block % self.cell_size:
+            return None
+        header = self.read(block)
+        size = header & ~FLAGS
+        if not header & USED or size < self.minimum_block_size or block+size > self.end:
+            return None
+        return block, size
+
+    def free(self, address):
+        """Free the data at address, returns False if address was not
+        returned by allocate.
+        """
+        allocated = self.allocated_block(address)
+        if allocated is None:
+            return False
+        block, size = allocated
+        self.account(-size)
+        self.release(block, size)
+        return True
+
+    def resize(self, address, size):
+        """Returns the address of the data at address resized to size bytes,
+        moved if it does not fit in place, or 0 if address was not returned
+        by allocate or there is no room.
+        """
+        allocated = self.allocated_block(address)
+        if allocated is None:
+            return 0
+        block, block_size = allocated
+        needed = self.block_size(size)
+        following = block + block_size
+        following_header = self.read(following)
+        if needed <= block_size:
+            if block_size - needed >= self.minimum_block_size:
+                self.write(block, needed | (self.read(block) & FLAGS))
+                self.write(block+needed, PREVIOUS_USED)
+                self.release(block+needed, block_size-needed)
+                self.account(needed-block_size)
+            return address
+        if not following_header & USED and block_size + (following_header & ~FLAGS) >= needed:
+            self.unlink(following)
+            self.account(-block_size)
+            self.use(block, block_size + (following_header & ~FLAGS), needed)
+            return address
+        new_address = self.allocate(size)
+        if new_address == 0:
+            return 0
+        memory = self.manipulator.memory
+        memory.write_bytes(new_address, bytes(memory[address:address+block_size-self.cell_size]))
+        self.free(address)
+        return new_address
+
+    def statistics(self):
+        """Returns the bytes of the allocated blocks, their peak and the
+        fragmentation of the free bytes: the percentage of them outside the
+        largest free block.
+        """
+        free = 0
+        largest = 0
+        for size_class in range(NUMBER_OF_CLASSES):
+            block = self.read(self.head_address(size_class))
+            while block != 0:
+                size = self.read(block) & ~FLAGS
+                free += size
+                largest = max(largest, size)
+                block = self.read(block+self.cell_size)
+        fragmentation = 0 if free == 0 else 100 - largest*100//free
+        return (
+            self.read(self.address + LIVE*self.cell_size),
+            self.read(self.address + PEAK*self.cell_size),
+            fragmentation
+        )
+
+@primitive(66, "(init-heap)", returns_next_ip=True)
+def init_heap(vm):
+    """Make a heap of the u bytes at a-addr1, a-addr2 is the address of the
+    heap or 0 if u is too small.
+
+    ( a-addr1 u -- a-addr2 | 0 )
+    """
+    size = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    heap = Heap.format(vm, address, size)
+    vm.push_on_data_stack(0 if heap is None else heap.address)
+    return vm.interpreter_pointer
+
+@primitive(67, "(allocate)", returns_next_ip=True)
+def allocate(vm):
+    """Allocate u bytes in the heap at heap.
+
+    ( u heap -- a-addr ior )
+    """
+    heap_address = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    address = 0 if heap_address == 0 else Heap(vm, heap_address).allocate(size)
+    vm.push_on_data_stack(address)
+    vm.push_on_data_stack(IOR_ALLOCATE if address == 0 else IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(68, "(free)", returns_next_ip=True)
+def free(vm):
+    """Free the bytes at a-addr allocated in the heap at heap.
+
+    ( a-addr heap -- ior )
+    """
+    heap_address = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    freed = heap_address != 0 and Heap(vm, heap_address).free(address)
+    vm.push_on_data_stack(IOR_SUCCESS if freed else IOR_FREE)
+    return vm.interpreter_pointer
+
+@primitive(69, "(resize)", returns_next_ip=True)
+def resize(vm):
+    """Resize to u bytes the bytes at a-addr1 allocated in the heap at heap,
+    a-addr2 is their new address. a-addr2 is a-addr1 if it fails.
+
+    ( a-addr1 u heap -- a-addr2 ior )
+    """
+    heap_address = vm.pop_from_data_stack()
+    size = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    new_address = 0 if heap_address == 0 else Heap(vm, heap_address).resize(address, size)
+    if new_address == 0:
+        vm.push_on_data_stack(address)
+        vm.push_on_data_stack(IOR_RESIZE)
+    else:
+        vm.push_on_data_stack(new_address)
+        vm.push_on_data_stack(IOR_SUCCESS)
+    return vm.interpreter_pointer
+
+@primitive(70, "(heap-statistics)", returns_next_ip=True)
+def heap_statistics(vm):
+    """Bytes of the blocks allocated in the heap at heap, with their headers,
+    their peak and the percentage of the free bytes outside of the largest
+    free block.
+
+    ( heap -- live peak fragmentation )
+    """
+    heap_address = vm.pop_from_data_stack()
+    statistics = (0, 0, 0) if heap_address == 0 else Heap(vm, heap_address).statistics()
+    for value in statistics:
+        vm.push_on_data_stack(value)
+    return vm.interpreter_pointer
+
+PRIMITIVES = (
+    init_heap,
+    allocate,
+    free,
+    resize,
+    heap_statistics
+)
@@ -0,0 +1,52 @@
+from ...primitives import primitive, PrimitiveStore
+from ...superinstructions import superinstruction, fuse_before
+from . import by_the_book
+from .by_the_book import doLIT, EXIT, imbranch, Cat, at, Rgt, DROP, DUP, OVER, XOR, UMplus
+
+# The most frequent sequences measured with SequenceStatisticsInterpreter on
+# the bootstrap image loading forthsrc/ and running forthtests/ (see
+# scripts/benchmark_superinstructions.py). Longest sequences come first so they are
+# preferred when several superinstructions match.
+SUPERINSTRUCTIONS = (
+    superinstruction(34, "doLIT + EXIT", doLIT, (UMplus, DROP), EXIT),
+    superinstruction(35, "UM+ DROP EXIT", UMplus, DROP, EXIT),
+    superinstruction(36, "doLIT +", doLIT, (UMplus, DROP)),
+    superinstruction(37, "DUP ?branch", DUP, imbranch),
+    superinstruction(38, "XOR ?branch", XOR, imbranch),
+    superinstruction(39, "doLIT EXIT", doLIT, EXIT),
+    superinstruction(40, "R> EXIT", Rgt, EXIT),
+    superinstruction(41, "DUP @", DUP, at),
+    superinstruction(42, "R> @", Rgt, at),
+    superinstruction(43, "R> DROP", Rgt, DROP),
+    superinstruction(44, "OVER C@", OVER, Cat),
+)
+
+@primitive(45, "fuse", returns_next_ip=True)
+def fuse(vm):
+    """Replace the tokens compiled right before address a by a superinstruction
+    if they match one of the superinstructions in the table.
+
+    The table is a list of superinstructions execution tokens ending with 0.
+
+    ( a table -- )
+    """
+    table_address = vm.pop_from_data_stack()
+    address = vm.pop_from_data_stack()
+    candidates = []
+    execution_token = vm.read_cell_at_address(table_address)
+    while execution_token != 0:
+        candidates.append((
+            vm.get_primitive_by_address(vm.read_cell_at_address(execution_token)),
+            execution_token
+        ))
+        table_address += vm.cell_size
+        execution_token = vm.read_cell_at_address(table_address)
+    fuse_before(vm, vm, address, candidates)
+    return vm.interpreter_pointer
+
+def primitives_store():
+    return PrimitiveStore(
+        *by_the_book.primitives_store().primitives,
+        *SUPERINSTRUCTIONS,
+        fuse
+    )
@@ -1,14 +1,39 @@
 # -*- coding: utf-8 -*-
 
 import io
+import os
+import mmap
+import select
+import struct
+import functools
+import threading
+
+from . import superinstructions
+from .primitives import HALT, primitive, PrimitiveStore
 
 class NotAByte(Exception):
     def __init__(self, value):
         self.value = value
 
 class Memory(object):
+    """Bytes of the VM, stored in a bytearray.
+
+    Cells are read and written at once with the struct matching their size
+    instead of byte by byte. Writing a value that is not a byte raises the
+    ValueError of bytearray, use CheckedMemory to get NotAByte instead.
+    """
+    # Little endian struct of each supported cell size, with its mask.
+    CELL_STRUCTS = {
+        cell_size: (struct.Struct(f"<{code}"), (1 << (8*cell_size)) - 1)
+        for cell_size, code in ((1, "B"), (2, "H"), (4, "I"), (8, "Q"))
+    }
+
     def __init__(self, size):
-        self.bytes_array = [0]*size
+        self.bytes_array = bytearray(size)
+        # Maps watched addresses to the callbacks to trigger when they change.
+        self.write_barriers = dict()
+        # No address above this one is watched.
+        self.highest_watched_address = -1
 
     def __len__(self):
         return len(self.bytes_array)
@@ -17,48 +42,215 @@ class Memory(object):
         return self.bytes_array[index]
 
     def __setitem__(self, index, value):
-        if value < 0 or value > 255:
-            raise NotAByte(value)
         self.bytes_array[index] = value
+        if index in self.write_barriers:
+            for callback in self.write_barriers.pop(index):
+                callback(index)
+
+    def read_cell(self, address, cell_size):
+        """Read the little endian cell of cell_size bytes at address.
+        """
+        try:
+            return self.CELL_STRUCTS[cell_size][0].unpack_from(self.bytes_array, address)[0]
+        except struct.error:
+            raise IndexError(address)
+        except KeyError:
+            cell = self.bytes_array[address:address+cell_size]
+            if address < 0 or len(cell) != cell_size:
+                raise IndexError(address)
+            return int.from_bytes(cell, "little")
+
+    def write_cell(self, address, cell_size, cell_value):
+        """Write cell_value as a little endian cell of cell_size bytes at
+        address, keeping its cell_size lowest bytes.
+        """
+        try:
+            cell_struct, mask = self.CELL_STRUCTS[cell_size]
+            cell_struct.pack_into(self.bytes_array, address, cell_value & mask)
+        except struct.error:
+            raise IndexError(address)
+        except KeyError:
+            if address < 0 or address + cell_size > len(self.bytes_array):
+                raise IndexError(address)
+            self.bytes_array[address:address+cell_size] = \
+                (cell_value & ((1 << (8*cell_size)) - 1)).to_bytes(cell_size, "little")
+        if self.write_barriers:
+            for index in range(address, address + cell_size):
+                if index in self.write_barriers:
+                    for callback in self.write_barriers.pop(index):
+                        callback(index)
+
+    def write_bytes(self, address, data):
+        """Write the bytes of data from address at once. The write barriers
+        of the bytes written are triggered as if they were written one by
+        one.
+        """
+        end = address + len(data)
+        if address < 0 or end > len(self.bytes_array):
+            raise IndexError(address)
+        self.bytes_array[address:end] = data
+        if self.write_barriers and address <= self.highest_watched_address:
+            if len(self.write_barriers) < len(data):
+                indexes = sorted(index for index in self.write_barriers if address <= index < end)
+            else:
+                indexes = range(address, end)
+            for index in indexes:
+                if index in self.write_barriers:
+                    for callback in self.write_barriers.pop(index):
+                        callback(index)
+
+    def view(self, address, length):
+        """Returns a memoryview of the length bytes from address, reading
+        them without copying them.
+        """
+        if address < 0 or length < 0 or address + length > len(self.bytes_array):
+            raise IndexError(address)
+        return memoryview(self.bytes_array)[address:address+length]
+
+    def watch(self, address, callback):
+        """Call callback(address) the next time the byte at address is written.
+
+        Several callbacks may watch the same address, each one is called once.
+        """
+        callbacks = self.write_barriers.setdefault(address, [])
+        self.highest_watched_address = max(self.highest_watched_address, address)
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def unwatch_all(self, callback):
+        """Remove all the write barriers registered with callback.
+        """
+        for address, callbacks in list(self.write_barriers.items()):
+            if callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self.write_barriers[address]
 
     def save(self, file_path):
         with open(file_path, "wb") as file:
-            file.write(bytearray(self.bytes_array))
+            file.write(self.bytes_array)
 
     @classmethod
     def from_file(cls, file_path):
         memory = cls(0)
         with open(file_path, "rb") as file:
-            memory.bytes_array = list(bytearray(file.read()))
+            memory.bytes_array = bytearray(os.fstat(file.fileno()).st_size)
+            file.readinto(memory.bytes_array)
+        return memory
+
+    @classmethod
+    def map_file(cls, file_path):
+        """Load the file at file_path as a private copy on write mapping.
+
+        Pages of the file are only read when they are touched and writes
+        never reach the file, loading costs the same whatever its size.
+        """
+        memory = cls(0)
+        with open(file_path, "rb") as file:
+            if os.fstat(file.fileno()).st_size > 0:
+                memory.bytes_array = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
         return memory
 
+class CheckedMemory(Memory):
+    """Memory raising NotAByte when a value that is not a byte is written.
+    """
+    def __setitem__(self, index, value):
+        if value < 0 or value > 255:
+            raise NotAByte(value)
+        super().__setitem__(index, value)
+
 class MemoryManipulator(object):
     def __init__(self, cell_size):
         self.cell_size = cell_size
         self.memory = None
 
     def read_cell_at_address(self, address):
-        value = 0
-        # NOTE: I changed this because it should be encoded in little endian! Eforth makes assumption about that!
-        # for i in range(self.cell_size):
-        #     value = (value << 8) | self.memory[address+i]
+        # NOTE: cells are encoded in little endian! Eforth makes assumption about that!
+        return self.memory.read_cell(address, self.cell_size)
 
-        addr = address + (self.cell_size - 1)
-        for i in range(self.cell_size):
-            value = (value << 8) | self.memory[addr-i]
+    def write_cell_at_address(self, address, cell_value):
+        self.memory.write_cell(address, self.cell_size, cell_value)
 
-        return value
+class OutputChannel(object):
+    """Buffered output of a VM.
 
-    def write_cell_at_address(self, address, cell_value):
-        to_write = cell_value
-        # NOTE: I changed this because it should be encoded in little endian! Eforth makes assumption about that!
-        # for addr in range(address + self.cell_size - 1, address-1, -1):
-        #     self.memory[addr] = to_write & 0xFF
-        #     to_write = to_write >> 8
+    Bytes are kept in a bytearray and written to the stream at once, as raw
+    bytes to the binary buffer of the stream if it has one or decoded as
+    latin-1 otherwise. The buffer is flushed when it holds buffer_size
+    bytes, after a new line if flush_on_newline is set, flush_interval
+    seconds after the first byte buffered by a timer thread, before reading
+    input that is not available yet and when the VM stops.
+
+    Args:
+        stream (file): The stream to write to.
+        buffer_size (int): The number of bytes buffered before a flush.
+        flush_on_newline (bool): Should a new line flush the buffer?
+        flush_interval (float): The longest time in seconds output stays in
+                                the buffer, or None.
+    """
+    NEWLINE = 10
 
-        for addr in range(address, address + self.cell_size, 1):
-            self.memory[addr] = to_write & 0xFF
-            to_write = to_write >> 8
+    def __init__(self, stream, buffer_size=4096, flush_on_newline=False, flush_interval=None):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.flush_on_newline = flush_on_newline
+        self.flush_interval = flush_interval
+        self.buffer = bytearray()
+        # The timer thread flushes the buffer while the VM writes to it.
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def write(self, byte):
+        with self.lock:
+            self.buffer.append(byte)
+            if (len(self.buffer) >= self.buffer_size
+                    or (self.flush_on_newline and byte == self.NEWLINE)):
+                self.write_buffer()
+            elif self.flush_interval is not None and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self.write_buffer()
+
+    def write_buffer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.buffer:
+            return
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        binary_stream = getattr(self.stream, "buffer", None)
+        if binary_stream is not None:
+            # Text already written to the stream goes first.
+            self.stream.flush()
+            binary_stream.write(data)
+            binary_stream.flush()
+        else:
+            self.stream.write(data.decode("latin-1"))
+            self.stream.flush()
+
+    def before_input(self, input_stream):
+        """Flush the buffer if reading input_stream may wait for input, the
+        output asking for it must be seen first. The buffer is flushed when
+        select can not tell, as with the console on Windows.
+        """
+        if not self.buffer:
+            return
+        try:
+            file_descriptor = input_stream.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # In memory streams never wait.
+            return
+        try:
+            readable, _, _ = select.select([file_descriptor], [], [], 0)
+        except (OSError, ValueError):
+            readable = False
+        if not readable:
+            self.flush()
 
 class ForthInterpreter(MemoryManipulator):
     def __init__(
@@ -71,7 +263,9 @@ class ForthInterpreter(MemoryManipulator):
         input_stream=None,
         output_stream=None,
         logger=None,
-        compiler_metadata=None
+        compiler_metadata=None,
+        image_format=None,
+        output_channel=None
     ):
         self.cell_size = cell_size
         self.interpreter_pointer = 0
@@ -86,13 +280,22 @@ class ForthInterpreter(MemoryManipulator):
             self.input_stream = input_stream
         else:
             self.input_stream = io.StringIO("")
-        if output_stream:
-            self.output_stream = output_stream
-        else:
-            self.output_stream = io.StringIO("")
+        if output_channel is None:
+            output_channel = OutputChannel(output_stream or io.StringIO(""))
+        self.output_channel = output_channel
         self.logger = logger
         self.keep_going = False
         self.compiler_metadata = compiler_metadata
+        self.image_format = image_format
+
+    @property
+    def output_stream(self):
+        return self.output_channel.stream
+
+    @output_stream.setter
+    def output_stream(self, stream):
+        self.output_channel.flush()
+        self.output_channel.stream = stream
 
     def log_info(self, *args, **kwargs):
         if not self.logger:
@@ -154,6 +357,15 @@ class ForthInterpreter(MemoryManipulator):
             self.keep_going = False
             self._next()
 
+    def save_image(self, file_path):
+        """Save the memory in file_path, in the image file format of the VM
+        if it has one or as raw bytes otherwise.
+        """
+        if self.image_format is None:
+            self.memory.save(file_path)
+        else:
+            self.image_format.save(file_path, self)
+
     def get_primitive_by_address(self, *args, **kwargs):
         return self.primitives.get_primitive_by_address(*args, **kwargs)
 
@@ -260,6 +472,7 @@ class ForthInterpreter(MemoryManipulator):
 class ExecutionStatistics(object):
     def __init__(self):
         self.words_calls = dict()
+        self.sequences_calls = dict()
 
     def increment_calls_count(self, word_address):
         if word_address not in self.words_calls.keys():
@@ -278,6 +491,21 @@ class ExecutionStatistics(object):
             names_to_count[name] = calls_count
         return names_to_count
 
+    def increment_sequence_count(self, words_addresses):
+        self.sequences_calls[words_addresses] = self.sequences_calls.get(words_addresses, 0) + 1
+
+    def sequence_names_to_count(self, compiler_metadata):
+        names_to_count = dict()
+        for words_addresses, calls_count in self.sequences_calls.items():
+            names = []
+            for word_address in words_addresses:
+                try:
+                    names.append(compiler_metadata.word_address_belongs_to(word_address).name)
+                except StopIteration:
+                    names.append('?')
+            names_to_count[tuple(names)] = calls_count
+        return names_to_count
+
 class OptimizedInterpreter(ForthInterpreter):
     def start(self):
         """Start interpreting Forth image.
@@ -310,6 +538,70 @@ class OptimizedInterpreter(ForthInterpreter):
         self.return_stack_pointer -= self.cell_size
         self.write_cell_at_address(self.return_stack_pointer, cell_value)
 
+class ReturnDispatchInterpreter(OptimizedInterpreter):
+    """Interpreter using the return value of primitives as next IP.
+
+    Primitives are called through the flat tuple of plain functions of the
+    primitives store instead of primitive.execute() and vm.next(), the loop
+    stops when one of them returns HALT.
+
+    The function run by an execution token is cached by the address of its
+    code field, so that the code field is decoded once instead of on every
+    call. A write barrier on the bytes of cached code fields throws away
+    their entry when they are patched.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.code_fields = dict()
+        self.code_fields_memory = None
+
+    def invalidate_code_fields(self):
+        """Throw away all the cached code fields.
+        """
+        self.code_fields.clear()
+        if self.code_fields_memory is not None:
+            self.code_fields_memory.unwatch_all(self.code_field_written)
+        self.code_fields_memory = self.memory
+
+    def code_field_written(self, address):
+        """Write barrier removing from the cache the code fields containing
+        the byte at address.
+        """
+        for word_pointer in range(address - self.cell_size + 1, address + 1):
+            self.code_fields.pop(word_pointer, None)
+
+    def resolve_code_field(self, word_pointer):
+        """Decode the code field at word_pointer and cache the function it
+        runs.
+        """
+        function = self.primitives.dispatch_index[self.read_cell_at_address(word_pointer)]
+        self.code_fields[word_pointer] = function
+        for address in range(word_pointer, word_pointer + self.cell_size):
+            self.memory.watch(address, self.code_field_written)
+        return function
+
+    def start(self):
+        """Start interpreting Forth image.
+        """
+        if self.code_fields_memory is not self.memory:
+            self.invalidate_code_fields()
+        self.keep_going = True
+        read_cell_at_address = self.read_cell_at_address
+        code_fields = self.code_fields
+        resolve_code_field = self.resolve_code_field
+        cell_size = self.cell_size
+        interpreter_pointer = self.interpreter_pointer
+        while interpreter_pointer is not HALT:
+            word_pointer = read_cell_at_address(interpreter_pointer)
+            self.word_pointer = word_pointer
+            self.interpreter_pointer = interpreter_pointer + cell_size
+            try:
+                function = code_fields[word_pointer]
+            except KeyError:
+                function = resolve_code_field(word_pointer)
+            interpreter_pointer = function(self)
+        self.keep_going = False
+
 class StatisticsInterpreter(ForthInterpreter):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -320,3 +612,688 @@ class StatisticsInterpreter(ForthInterpreter):
             self.read_cell_at_address(self.interpreter_pointer)
         )
         return super()._next()
+
+class SequenceStatisticsInterpreter(StatisticsInterpreter):
+    """Interpreter counting the sequences of words that are executed one after
+    the other in the same thread, i.e. the n-grams of threaded code that are
+    candidates to be fused in superinstructions.
+
+    A sequence is interrupted by branches but not by calls: when a colon
+    definition returns, the sequence of its caller goes on.
+    """
+    def __init__(self, *args, sequence_length=3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sequence_length = sequence_length
+        self.current_sequence = []
+        self.fall_through_address = None
+        self.sequences_waiting_return = dict()
+
+    def _next(self):
+        address = self.interpreter_pointer
+        if address != self.fall_through_address:
+            self.current_sequence = self.sequences_waiting_return.pop(address, [])
+        self.current_sequence = self.current_sequence[1-self.sequence_length:] + [
+            self.read_cell_at_address(address)
+        ]
+        for length in range(2, len(self.current_sequence)+1):
+            self.execution_statistics.increment_sequence_count(
+                tuple(self.current_sequence[-length:])
+            )
+        super()._next()
+        if self.interpreter_pointer - address in (self.cell_size, 2*self.cell_size):
+            self.fall_through_address = self.interpreter_pointer
+        else:
+            self.fall_through_address = None
+            if self.interpreter_pointer == self.word_pointer + self.cell_size:
+                # A colon definition was called.
+                self.sequences_waiting_return[address+self.cell_size] = self.current_sequence
+
+class ClosureInterpreter(OptimizedInterpreter):
+    """Interpreter compiling threaded code into chains of Python closures.
+
+    The first time the interpreter pointer reaches an address, the straight
+    line sequence of tokens starting there is decoded once and turned into a
+    block of closures. Calls to colon definitions, branches, stores and
+    primitives that may change the interpreter pointer end a block. Blocks
+    are cached by address and all thrown away as soon as one of the bytes
+    they were decoded from is written.
+    """
+    # Primitives writing memory, they end a block so that the code they
+    # modify is decoded again before being run.
+    STORE_PRIMITIVES = frozenset(["!", "C!"])
+    # Primitives that neither read nor modify the interpreter pointer.
+    STRAIGHT_LINE_PRIMITIVES = superinstructions.STRAIGHT_LINE_PRIMITIVES - STORE_PRIMITIVES
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.blocks = dict()
+        self.blocks_memory = None
+
+    def invalidate_blocks(self, address=None):
+        """Throw away all the compiled blocks.
+        """
+        self.blocks.clear()
+        if self.blocks_memory is not None:
+            self.blocks_memory.unwatch_all(self.invalidate_blocks)
+        self.blocks_memory = self.memory
+
+    def decode_cell_at_address(self, address):
+        """Read the cell at address and invalidate the blocks when it changes.
+        """
+        value = self.read_cell_at_address(address)
+        for watched_address in range(address, address + self.cell_size):
+            self.memory.watch(watched_address, self.invalidate_blocks)
+        return value
+
+    def decode_block(self, address):
+        """Decode the straight line sequence of tokens starting at address.
+
+        Returns:
+            tuple: The operations of the block, ("literal", value) or
+                   ("primitive", primitive) pairs, and the token ending it,
+                   a (kind, interpreter pointer, execution token, primitive)
+                   tuple where kind is "token", "call" or "control".
+        """
+        doLIST_code = self.get_primitive_by_name("doLIST").code
+        operations = []
+        interpreter_pointer = address
+        while True:
+            try:
+                execution_token = self.decode_cell_at_address(interpreter_pointer)
+                primitive = self.get_primitive_by_address(
+                    self.decode_cell_at_address(execution_token)
+                )
+            except IndexError:
+                # Let the regular dispatch raise the error if this is ever run.
+                return operations, ("token", interpreter_pointer, None, None)
+            if isinstance(primitive, superinstructions.superinstruction):
+                # The cells of the fused sequence are left untouched, decode
+                # them one by one.
+                primitive = primitive.components[0]
+            if primitive.code == doLIST_code:
+                return operations, ("call", interpreter_pointer, execution_token, primitive)
+            if primitive.name == "doLIT":
+                operations.append((
+                    "literal",
+                    self.decode_cell_at_address(interpreter_pointer + self.cell_size)
+                ))
+                interpreter_pointer += 2 * self.cell_size
+            elif primitive.name in self.STRAIGHT_LINE_PRIMITIVES:
+                operations.append(("primitive", primitive))
+                interpreter_pointer += self.cell_size
+            else:
+                return operations, ("control", interpreter_pointer, execution_token, primitive)
+
+    def compile_block(self, address):
+        """Decode the tokens starting at address into a block and cache it.
+        """
+        operations, (kind, interpreter_pointer, execution_token, primitive) = \
+            self.decode_block(address)
+        closures = []
+        for operation, argument in operations:
+            if operation == "literal":
+                closures.append(functools.partial(self.push_on_data_stack, argument))
+            else:
+                # Straight line primitives do not move IP, whatever their
+                # calling convention is.
+                closures.append(functools.partial(argument.dispatch_function, self))
+        if kind == "token":
+            tail = self.compile_token(interpreter_pointer)
+        elif kind == "call":
+            tail = self.compile_call(interpreter_pointer, execution_token)
+        else:
+            tail = self.compile_control(interpreter_pointer, execution_token, primitive)
+
+        block = self.chain(closures, tail)
+        self.blocks[address] = block
+        return block
+
+    def chain(self, operations, tail):
+        if not operations:
+            return tail
+        operations = tuple(operations)
+        def block():
+            for operation in operations:
+                operation()
+            tail()
+        return block
+
+    def compile_token(self, interpreter_pointer):
+        """Compile a closure interpreting the token at interpreter_pointer the
+        same way OptimizedInterpreter does.
+        """
+        def token():
+            self.keep_going = False
+            self.word_pointer = self.read_cell_at_address(interpreter_pointer)
+            self.interpreter_pointer = interpreter_pointer + self.cell_size
+            self.get_primitive_by_address(
+                self.read_cell_at_address(self.word_pointer)
+            ).execute(self)
+        return token
+
+    def compile_call(self, interpreter_pointer, execution_token):
+        """Compile a closure running doLIST for the colon definition at
+        execution_token.
+        """
+        return_address = interpreter_pointer + self.cell_size
+        body_address = execution_token + self.cell_size
+        push_on_return_stack = self.push_on_return_stack
+        def call():
+            push_on_return_stack(return_address)
+            self.word_pointer = execution_token
+            self.interpreter_pointer = body_address
+        return call
+
+    def compile_control(self, interpreter_pointer, execution_token, primitive):
+        """Compile a closure for a primitive that ends a block.
+        """
+        next_address = interpreter_pointer + self.cell_size
+        if primitive.name == "EXIT":
+            pop_from_return_stack = self.pop_from_return_stack
+            def exit():
+                self.interpreter_pointer = pop_from_return_stack()
+            return exit
+
+        if primitive.name == "branch":
+            target = self.decode_cell_at_address(next_address)
+            def branch():
+                self.interpreter_pointer = target
+            return branch
+
+        if primitive.name == "?branch":
+            target = self.decode_cell_at_address(next_address)
+            not_taken = next_address + self.cell_size
+            pop_from_data_stack = self.pop_from_data_stack
+            def conditional_branch():
+                if pop_from_data_stack() == 0:
+                    self.interpreter_pointer = target
+                else:
+                    self.interpreter_pointer = not_taken
+            return conditional_branch
+
+        if primitive.name == "next":
+            target = self.decode_cell_at_address(next_address)
+            loop_exit = next_address + self.cell_size
+            pop_from_return_stack = self.pop_from_return_stack
+            push_on_return_stack = self.push_on_return_stack
+            def next_iteration():
+                index = pop_from_return_stack() - 1
+                if index < 0:
+                    self.interpreter_pointer = loop_exit
+                else:
+                    push_on_return_stack(index)
+                    self.interpreter_pointer = target
+            return next_iteration
+
+        if primitive.name in self.STORE_PRIMITIVES:
+            function = functools.partial(primitive.dispatch_function, self)
+            def store():
+                function()
+                self.interpreter_pointer = next_address
+            return store
+
+        def execute():
+            self.keep_going = False
+            self.word_pointer = execution_token
+            self.interpreter_pointer = next_address
+            primitive.execute(self)
+        return execute
+
+    def start(self):
+        """Start interpreting Forth image.
+        """
+        if self.blocks_memory is not self.memory:
+            self.invalidate_blocks()
+        self.keep_going = True
+        blocks = self.blocks
+        compile_block = self.compile_block
+        while self.keep_going:
+            block = blocks.get(self.interpreter_pointer)
+            if block is None:
+                block = compile_block(self.interpreter_pointer)
+            block()
+
+class CachedStack(object):
+    """Stack of cells kept in a Python list instead of memory.
+
+    The list mirrors the cells right below the bottom address, the last item
+    being the top of the stack. It is spilled to memory when the in-memory
+    view of the stack is needed. Cells written in memory after a spill are
+    copied back into the list.
+    """
+    def __init__(self, manipulator, guard_size):
+        self.manipulator = manipulator
+        self.guard_size = guard_size
+        self.cells = []
+        self.bottom = 0
+        self.spilling = False
+
+    @property
+    def pointer(self):
+        return self.bottom - len(self.cells) * self.manipulator.cell_size
+
+    def cell_address(self, index):
+        return self.bottom - (index + 1) * self.manipulator.cell_size
+
+    def move_pointer(self, pointer):
+        """Set the stack pointer, reloading the cells from memory when the
+        stack grows or moves elsewhere.
+        """
+        depth, misaligned = divmod(self.bottom - pointer, self.manipulator.cell_size)
+        if misaligned or depth < 0:
+            self.spill()
+            self.reload(pointer)
+        elif depth <= len(self.cells):
+            del self.cells[depth:]
+        else:
+            self.spill()
+            self.cells.extend(
+                self.manipulator.read_cell_at_address(self.cell_address(index))
+                for index in range(len(self.cells), depth)
+            )
+
+    def reload(self, pointer):
+        """Load the stack from memory with its bottom guard_size bytes above
+        pointer, so that small underflows read memory like the other
+        interpreters do.
+        """
+        memory_size = len(self.manipulator.memory)
+        guard_size = self.guard_size
+        while guard_size > 0 and pointer + guard_size > memory_size:
+            guard_size -= self.manipulator.cell_size
+        self.bottom = pointer + guard_size
+        depth = guard_size // self.manipulator.cell_size
+        self.cells[:] = [
+            self.manipulator.read_cell_at_address(self.cell_address(index))
+            for index in range(depth)
+        ]
+
+    def spill(self):
+        """Write the cells of the stack in memory.
+        """
+        memory = self.manipulator.memory
+        self.spilling = True
+        try:
+            for index, cell in enumerate(self.cells):
+                address = self.cell_address(index)
+                self.manipulator.write_cell_at_address(address, cell)
+                for byte_address in range(address, address + self.manipulator.cell_size):
+                    memory.watch(byte_address, self.cell_written)
+        finally:
+            self.spilling = False
+
+    def cell_written(self, address):
+        """Write barrier copying back in the list a cell written in memory.
+        """
+        if self.spilling:
+            return
+        index = (self.bottom - address - 1) // self.manipulator.cell_size
+        if 0 <= index < len(self.cells):
+            self.cells[index] = self.manipulator.read_cell_at_address(self.cell_address(index))
+            self.manipulator.memory.watch(address, self.cell_written)
+
+class stack_region_access(primitive):
+    """Primitive accessing memory at the address on top of the data stack,
+    that writes the cached stacks in memory first when the address is in
+    one of them.
+    """
+    def __init__(self, primitive):
+        super().__init__(primitive.code, primitive.name, primitive.returns_next_ip)
+        self.primitive = primitive
+        self.function = self.run
+
+    def run(self, vm):
+        vm.sync_stacks(vm.top_of_data_stack())
+        return self.primitive.function(vm)
+
+class CachedStacksInterpreter(ClosureInterpreter):
+    """Interpreter keeping the data and return stacks in Python lists.
+
+    Pushing and popping are plain list operations instead of cell_size
+    memory accesses each. The stacks are written back in memory when their
+    address is taken (SP@, RP@, SNAPSHOT) or when @, C@, ! or C! access them,
+    and reloaded from memory when SP! or RP! move them. Stack cells written
+    in memory afterwards, for instance through SP@ and !, are copied back in
+    the lists.
+
+    The last item of the data stack list is the cached top of stack, there
+    is no separate register. In Python a register turns every push and pop
+    into a list operation plus an attribute store, which costs more than it
+    saves unless every primitive is rewritten around it. Keeping the whole
+    stack in one list also lets sync_stacks, tops_of_data_stack and
+    top_of_data_stack read a single source of truth.
+    """
+    # Bytes kept above the stack bottoms, eForth leaves 16 of them free.
+    STACK_GUARD_SIZE = 16
+    # Primitives accessing memory at the address on top of the data stack.
+    MEMORY_ACCESS_PRIMITIVES = frozenset(["@", "C@", "!", "C!"])
+
+    def __init__(self, *args, **kwargs):
+        self.data_stack = CachedStack(self, self.STACK_GUARD_SIZE)
+        self.return_stack = CachedStack(self, self.STACK_GUARD_SIZE)
+        self.stacks_memory = None
+        # ForthInterpreter sets the stack pointers before creating memory.
+        self.memory = Memory(0)
+        super().__init__(*args, **kwargs)
+        self.primitives = PrimitiveStore(*[
+            stack_region_access(p) if p.name in self.MEMORY_ACCESS_PRIMITIVES else p
+            for p in self.primitives.primitives
+        ])
+        append = self.data_stack.cells.append
+        mask = self.cell_all_bit_at_one()
+        def push_on_data_stack(cell_value):
+            append(cell_value & mask)
+        self.push_on_data_stack = push_on_data_stack
+        self.pop_from_data_stack = self.data_stack.cells.pop
+        self.deallocate_data_stack = self.data_stack.cells.pop
+        # Only addresses and values coming from the data stack are pushed on
+        # the return stack, they do not need to be masked.
+        self.push_on_return_stack = self.return_stack.cells.append
+        self.pop_from_return_stack = self.return_stack.cells.pop
+        self.deallocate_return_stack = self.return_stack.cells.pop
+
+    @property
+    def data_stack_pointer(self):
+        self.data_stack.spill()
+        return self.data_stack.pointer
+
+    @data_stack_pointer.setter
+    def data_stack_pointer(self, pointer):
+        self.data_stack.move_pointer(pointer)
+
+    @property
+    def return_stack_pointer(self):
+        self.return_stack.spill()
+        return self.return_stack.pointer
+
+    @return_stack_pointer.setter
+    def return_stack_pointer(self, pointer):
+        self.return_stack.move_pointer(pointer)
+
+    def sync_stacks(self, address):
+        """Write in memory the stacks holding the cell at address.
+        """
+        for stack in (self.data_stack, self.return_stack):
+            if stack.pointer - self.cell_size < address < stack.bottom:
+                stack.spill()
+
+    def tops_of_data_stack(self, count=1):
+        return self.data_stack.cells[max(0, len(self.data_stack.cells)-count):]
+
+    def top_of_data_stack(self):
+        return self.data_stack.cells[-1]
+
+    def tops_of_return_stack(self, count=1):
+        return self.return_stack.cells[max(0, len(self.return_stack.cells)-count):]
+
+    def top_of_return_stack(self):
+        return self.return_stack.cells[-1]
+
+    def start(self):
+        """Start interpreting Forth image.
+        """
+        if self.stacks_memory is not self.memory:
+            for stack in (self.data_stack, self.return_stack):
+                pointer = stack.pointer
+                stack.spill()
+                stack.reload(pointer)
+            self.stacks_memory = self.memory
+        super().start()
+
+class TraceStatistics(object):
+    """Counters of the tracing JIT, to tune its thresholds.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.compiles = 0
+        self.bailouts = 0
+        self.aborted_recordings = 0
+
+    def __repr__(self):
+        return (f"TraceStatistics(hits={self.hits}, compiles={self.compiles}, "
+                f"bailouts={self.bailouts}, aborted_recordings={self.aborted_recordings})")
+
+class TracingInterpreter(CachedStacksInterpreter):
+    """Interpreter compiling hot loops into Python functions.
+
+    Backward branches (branch, ?branch and next jumping to a lower address)
+    are counted. When the loop starting at the target of one of them has
+    been run hot_loop_threshold times, the next iteration is recorded block
+    by block. The recorded path is turned into straight-line Python source
+    where every branch that could leave the path becomes a guard, and the
+    source is executed to build a function replacing the block at the head
+    of the loop. The function loops until a guard fails, it then sets the
+    interpreter pointer where the interpreter must go on and returns.
+
+    Traces are thrown away with the blocks when code space changes. A trace
+    that writes memory checks it did not happen before going on.
+    """
+    HOT_LOOP_THRESHOLD = 16
+    MAX_TRACE_LENGTH = 64
+    MAX_RECORDING_ATTEMPTS = 3
+
+    def __init__(self, *args,
+                 hot_loop_threshold=HOT_LOOP_THRESHOLD,
+                 max_trace_length=MAX_TRACE_LENGTH,
+                 **kwargs):
+        self.hot_loop_threshold = hot_loop_threshold
+        self.max_trace_length = max_trace_length
+        self.trace_statistics = TraceStatistics()
+        self.traces = dict()
+        self.traces_source = dict()
+        self.loops_counts = dict()
+        self.recording_attempts = dict()
+        self.recording = False
+        self.code_generation = 0
+        super().__init__(*args, **kwargs)
+
+    def invalidate_blocks(self, address=None):
+        """Throw away all the compiled blocks and traces.
+        """
+        super().invalidate_blocks(address)
+        self.traces.clear()
+        self.traces_source.clear()
+        self.loops_counts.clear()
+        self.recording_attempts.clear()
+        self.code_generation += 1
+
+    def compile_control(self, interpreter_pointer, execution_token, primitive):
+        """Compile a closure for a primitive that ends a block, counting the
+        backward branches.
+        """
+        tail = super().compile_control(interpreter_pointer, execution_token, primitive)
+        if primitive.name not in ("branch", "?branch", "next"):
+            return tail
+        target = self.read_cell_at_address(interpreter_pointer + self.cell_size)
+        if target > interpreter_pointer:
+            return tail
+        loops_counts = self.loops_counts
+        def backward_branch():
+            tail()
+            if self.interpreter_pointer == target:
+                count = loops_counts.get(target, 0) + 1
+                loops_counts[target] = count
+                if count >= self.hot_loop_threshold:
+                    self.hot_loop(target)
+        return backward_branch
+
+    def hot_loop(self, head):
+        """Record the next iteration of the loop starting at head.
+        """
+        if self.recording or head in self.traces:
+            return
+        if self.recording_attempts.get(head, 0) >= self.MAX_RECORDING_ATTEMPTS:
+            return
+        self.blocks[head] = functools.partial(self.record_trace, head)
+
+    def record_trace(self, head):
+        """Run the loop starting at head block by block until it comes back
+        to head, then compile the path it went through.
+        """
+        self.recording = True
+        generation = self.code_generation
+        path = []
+        interpreter_pointer = head
+        try:
+            while len(path) < self.max_trace_length:
+                # The block at head is the recorder, inner loops may already
+                # have been replaced by traces.
+                block = None
+                if interpreter_pointer != head:
+                    block = self.blocks.get(interpreter_pointer)
+                if block is None:
+                    block = self.compile_block(interpreter_pointer)
+                block()
+                path.append((interpreter_pointer, self.word_pointer, self.interpreter_pointer))
+                if not self.keep_going or generation != self.code_generation:
+                    break
+                interpreter_pointer = self.interpreter_pointer
+                if interpreter_pointer == head:
+                    trace = self.compile_trace(head, path)
+                    if trace is not None:
+                        self.traces[head] = trace
+                        self.blocks[head] = trace
+                        self.trace_statistics.compiles += 1
+                        return
+                    break
+        finally:
+            self.recording = False
+        self.trace_statistics.aborted_recordings += 1
+        self.recording_attempts[head] = self.recording_attempts.get(head, 0) + 1
+        self.loops_counts[head] = 0
+        if generation == self.code_generation:
+            self.compile_block(head)
+
+    def primitive_source(self, primitive, namespace):
+        """Returns the lines of Python source running primitive.
+        """
+        mask = self.cell_all_bit_at_one()
+        bits = self.cell_size * 8
+        templates = {
+            "DUP": ["ds.append(ds[-1])"],
+            "DROP": ["ds.pop()"],
+            "SWAP": ["ds[-1], ds[-2] = ds[-2], ds[-1]"],
+            "OVER": ["ds.append(ds[-2])"],
+            "@": ["address = ds.pop()", "sync(address)", "ds.append(read(address))"],
+            "C@": ["address = ds.pop()", "sync(address)", "ds.append(memory[address])"],
+            "R>": ["ds.append(rs.pop())"],
+            ">R": ["rs.append(ds.pop())"],
+            "R@": ["ds.append(rs[-1])"],
+            "AND": ["ds.append(ds.pop() & ds.pop())"],
+            "OR": ["ds.append(ds.pop() | ds.pop())"],
+            "XOR": ["ds.append(ds.pop() ^ ds.pop())"],
+            "0<": [f"ds.append({mask} if ds.pop() >> {bits-1} else 0)"],
+            "UM+": [
+                "total = ds.pop() + ds.pop()",
+                f"ds.append(total & {mask})",
+                f"ds.append({mask} if total >> {bits} else 0)"
+            ],
+        }
+        if primitive.name in templates:
+            return templates[primitive.name]
+        namespace[f"primitive_{primitive.code}"] = primitive.dispatch_function
+        return [f"primitive_{primitive.code}(vm)"]
+
+    def compile_trace(self, head, path):
+        """Generate and compile the Python source of the loop starting at
+        head from the recorded path, a list of (block address, word pointer,
+        next interpreter pointer) tuples.
+
+        Returns None if the path goes through tokens that cannot be traced.
+        """
+        namespace = {
+            "vm": self,
+            "ds": self.data_stack.cells,
+            "rs": self.return_stack.cells,
+            "read": self.read_cell_at_address,
+            "memory": self.memory,
+            "sync": self.sync_stacks,
+            "statistics": self.trace_statistics,
+        }
+        def leave(address):
+            return [
+                f"    vm.interpreter_pointer = {address}",
+                "    statistics.bailouts += 1",
+                "    return",
+            ]
+        lines = []
+        for address, word_pointer, successor in path:
+            if address != head and address in self.traces:
+                namespace[f"trace_{address}"] = self.traces[address]
+                lines += [f"trace_{address}()", f"if vm.interpreter_pointer != {successor}:", "    return"]
+                continue
+            operations, (kind, interpreter_pointer, execution_token, primitive) = \
+                self.decode_block(address)
+            for operation, argument in operations:
+                if operation == "literal":
+                    lines.append(f"ds.append({argument})")
+                else:
+                    lines += self.primitive_source(argument, namespace)
+            next_address = interpreter_pointer + self.cell_size
+            if kind == "token":
+                return None
+            if kind == "call":
+                lines.append(f"rs.append({next_address})")
+            elif primitive.name == "EXIT":
+                lines += ["address = rs.pop()", f"if address != {successor}:"] + leave("address")
+            elif primitive.name == "branch":
+                pass
+            elif primitive.name in ("?branch", "next"):
+                target = self.read_cell_at_address(next_address)
+                not_taken = next_address + self.cell_size
+                if primitive.name == "?branch":
+                    if target == not_taken:
+                        lines.append("ds.pop()")
+                    elif successor == target:
+                        lines += ["if ds.pop() != 0:"] + leave(not_taken)
+                    else:
+                        lines += ["if ds.pop() == 0:"] + leave(target)
+                else:
+                    lines.append("index = rs.pop() - 1")
+                    if successor == target:
+                        lines += ["if index < 0:"] + leave(not_taken) + ["rs.append(index)"]
+                    else:
+                        lines += ["if index >= 0:", "    rs.append(index)"] + leave(target)
+            elif primitive.name in self.STORE_PRIMITIVES:
+                lines += self.primitive_source(primitive, namespace)
+                lines += [f"if vm.code_generation != {self.code_generation}:"] + leave(next_address)
+            elif primitive.name == "EXECUTE":
+                try:
+                    callee = self.get_primitive_by_address(self.read_cell_at_address(word_pointer))
+                except IndexError:
+                    return None
+                lines += [
+                    "execution_token = ds.pop()",
+                    f"if execution_token != {word_pointer}:",
+                    "    vm.keep_going = False",
+                    "    vm.word_pointer = execution_token",
+                    f"    vm.interpreter_pointer = {next_address}",
+                    "    statistics.bailouts += 1",
+                    "    vm.step(read(execution_token))",
+                    "    return",
+                ]
+                if callee.name == "doLIST":
+                    lines.append(f"rs.append({next_address})")
+                elif callee.name in self.STRAIGHT_LINE_PRIMITIVES \
+                        and not isinstance(callee, superinstructions.superinstruction):
+                    lines += self.primitive_source(callee, namespace)
+                else:
+                    return None
+            else:
+                return None
+
+        source = "\n".join(
+            ["def trace():", "    statistics.hits += 1", "    while True:"] +
+            ["        " + line for line in lines]
+        )
+        exec(compile(source, f"<trace {head}>", "exec"), namespace)
+        self.traces_source[head] = source
+        return namespace["trace"]
+
+    def start(self):
+        """Start interpreting Forth image.
+        """
+        try:
+            super().start()
+        finally:
+            self.log_info("%s", self.trace_statistics)
@@ -0,0 +1,126 @@
+"""Content-addressed cache of built images.
+
+Images are keyed on a hash of the parameters of their build and of the
+sources of the modules building them, so that changing one of these
+modules is enough to rebuild them. They are kept in process and
+optionally in a directory as image files, the least recently used ones
+being evicted first from both.
+"""
+import collections
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from .image_file import ImageFile, NotAnImageFile, UnsupportedImageVersion, CorruptImageFile
+
+class ImageCache(object):
+    """Cache of image files.
+
+    Args:
+        modules (list): The modules building the images.
+        directory (str): Directory storing the image files, None to only
+                         keep them in process.
+        max_entries (int): Number of images kept in process.
+        max_files (int): Number of image files kept in directory.
+    """
+    def __init__(self, modules, directory=None, max_entries=8, max_files=16):
+        self.modules = modules
+        self.directory = Path(directory) if directory is not None else None
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.entries = collections.OrderedDict()
+        self._modules_digest = None
+
+    @property
+    def modules_digest(self):
+        if self._modules_digest is None:
+            digest = hashlib.sha256()
+            for module in self.modules:
+                digest.update(Path(module.__file__).read_bytes())
+            self._modules_digest = digest.hexdigest()
+        return self._modules_digest
+
+    def key(self, **parameters):
+        """Returns the key of the image built with parameters.
+        """
+        digest = hashlib.sha256(self.modules_digest.encode("ascii"))
+        digest.update(repr(sorted(parameters.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    def file_path(self, key):
+        return self.directory / f"{key}.image"
+
+    def get(self, key):
+        """Returns a copy of the image stored under key, None if there is
+        none.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key].copy()
+        if self.directory is None:
+            return None
+        file_path = self.file_path(key)
+        try:
+            image = ImageFile.from_file(file_path)
+            # The modification time of the files is their last use.
+            os.utime(file_path)
+        except (OSError, UnsupportedImageVersion):
+            return None
+        except (NotAnImageFile, CorruptImageFile):
+            # Rebuilt and stored again by the caller.
+            self.remove_file(file_path)
+            return None
+        self.remember(key, image)
+        return image.copy()
+
+    def put(self, key, image):
+        """Store a copy of image under key.
+        """
+        image = image.copy()
+        self.remember(key, image)
+        if self.directory is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Write in a temporary file first so that readers never see a
+            # partial image.
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+            os.close(file_descriptor)
+        except OSError:
+            return
+        try:
+            image.save(temporary_path)
+            os.replace(temporary_path, self.file_path(key))
+        except OSError:
+            self.remove_file(temporary_path)
+            return
+        self.evict_files()
+
+    def remove_file(self, file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+    def evict_files(self):
+        """Remove the least recently used image files beyond max_files.
+        """
+        try:
+            files = [(path.stat().st_mtime_ns, path) for path in self.directory.glob("*.image")]
+        except OSError:
+            return
+        files.sort()
+        for _, path in files[:max(0, len(files)-self.max_files)]:
+            self.remove_file(path)
+
+    def remember(self, key, image):
+        self.entries[key] = image
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget the images kept in process.
+        """
+        self.entries.clear()
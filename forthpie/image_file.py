@@ -0,0 +1,206 @@
+"""Self-describing image files.
+
+An image file starts with a fixed header (magic bytes, format version and
+length of the JSON description following it). The description holds the
+cell size, the layout constants of the image, the saved registers, the
+symbol table of the compiler and the list of memory sections. The bytes of
+the sections come after the description, in the same order, each one
+optionally compressed with zlib. Trailing zeros of a section are not
+stored.
+"""
+import json
+import struct
+import zlib
+
+from .forth import Memory
+from .compiler import CompilerMetadata, WordMetaData
+
+MAGIC = b"FPIE"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+
+class NotAnImageFile(Exception):
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+class UnsupportedImageVersion(Exception):
+    def __init__(self, version):
+        self.version = version
+
+class CorruptImageFile(Exception):
+    """An image file that is truncated or whose content can not be decoded.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+class ImageFile(object):
+    """Content of an image file.
+
+    Args:
+        memory (Memory): The memory of the VM.
+        cell_size (int): The size of a cell in bytes.
+        sections (list): (name, start address, end address) tuples
+                         covering the memory.
+        registers (dict): The saved "ip", "sp" and "rp" registers, or None
+                          if the image must be started from its cold boot.
+        layout (dict): The layout constants of the image, by name.
+        compiler_metadata (CompilerMetadata): The symbol table, or None.
+    """
+    def __init__(self, memory, cell_size, sections, registers=None, layout=None, compiler_metadata=None):
+        self.memory = memory
+        self.cell_size = cell_size
+        self.sections = sections
+        self.registers = registers
+        self.layout = layout if layout is not None else dict()
+        self.compiler_metadata = compiler_metadata
+
+    def copy(self):
+        """Returns a copy of this image file that does not share its memory
+        nor its symbol table.
+        """
+        memory = self.memory.__class__(0)
+        memory.bytes_array = bytearray(self.memory.bytes_array)
+        return self.__class__(
+            memory,
+            self.cell_size,
+            list(self.sections),
+            registers=dict(self.registers) if self.registers is not None else None,
+            layout=dict(self.layout),
+            compiler_metadata=compiler_metadata_from_description(
+                symbols_description(self.compiler_metadata)
+            )
+        )
+
+    def save(self, file_path, compress=True):
+        payloads = []
+        sections = []
+        for name, start, end in self.sections:
+            data = bytes(self.memory[start:end]).rstrip(b"\0")
+            compression = "none"
+            if compress and data:
+                data = zlib.compress(data)
+                compression = "zlib"
+            payloads.append(data)
+            sections.append({
+                "name": name,
+                "start": start,
+                "end": end,
+                "compression": compression,
+                "size": len(data)
+            })
+        description = json.dumps({
+            "cell_size": self.cell_size,
+            "memory_size": len(self.memory),
+            "layout": self.layout,
+            "registers": self.registers,
+            "symbols": symbols_description(self.compiler_metadata),
+            "sections": sections
+        }).encode("utf-8")
+        with open(file_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(description)))
+            file.write(description)
+            for data in payloads:
+                file.write(data)
+
+    @classmethod
+    def from_file(cls, file_path, memory_class=Memory):
+        """Read the image file at file_path.
+
+        Raises:
+            NotAnImageFile: When the file does not start with the magic bytes.
+            UnsupportedImageVersion: When the file has a newer format.
+            CorruptImageFile: When the file is truncated or can not be decoded.
+        """
+        with open(file_path, "rb") as file:
+            try:
+                magic, version, description_size = HEADER.unpack(file.read(HEADER.size))
+            except struct.error:
+                raise CorruptImageFile(file_path)
+            if magic != MAGIC:
+                raise NotAnImageFile(file_path)
+            if version > VERSION:
+                raise UnsupportedImageVersion(version)
+            try:
+                description = json.loads(file.read(description_size).decode("utf-8"))
+                memory = memory_class(description["memory_size"])
+                sections = []
+                for section in description["sections"]:
+                    data = file.read(section["size"])
+                    if len(data) != section["size"]:
+                        raise CorruptImageFile(file_path)
+                    if section["compression"] == "zlib":
+                        data = zlib.decompress(data)
+                    memory.bytes_array[section["start"]:section["start"]+len(data)] = data
+                    sections.append((section["name"], section["start"], section["end"]))
+                return cls(
+                    memory,
+                    description["cell_size"],
+                    sections,
+                    registers=description["registers"],
+                    layout=description["layout"],
+                    compiler_metadata=compiler_metadata_from_description(description["symbols"])
+                )
+            except (zlib.error, ValueError, KeyError, TypeError, IndexError) as error:
+                raise CorruptImageFile(file_path) from error
+
+def is_image_file(file_path):
+    """Tells whether the file at file_path is an image file, as opposed to a
+    raw dump of the memory.
+    """
+    with open(file_path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+def symbols_description(compiler_metadata):
+    if compiler_metadata is None:
+        return None
+    return {
+        "start_of_user_area": compiler_metadata.start_of_user_area,
+        "user_address": compiler_metadata.user_address,
+        "words": [
+            [word_meta.name, word_meta.start_address, word_meta.end_address]
+            for word_meta in compiler_metadata.words_metadata
+        ]
+    }
+
+def compiler_metadata_from_description(symbols):
+    if symbols is None:
+        return None
+    compiler_metadata = CompilerMetadata(symbols["start_of_user_area"])
+    compiler_metadata.user_address = symbols["user_address"]
+    for name, start_address, end_address in symbols["words"]:
+        compiler_metadata.add_word_meta(WordMetaData(name, start_address, end_address))
+    return compiler_metadata
+
+class ImageFormat(object):
+    """How a VM saves its memory in an image file.
+
+    Args:
+        layout (dict): The layout constants of the images, by name.
+        sections (callable): Called with the VM, returns the (name, start
+                             address, end address) tuples of the sections of
+                             its memory.
+        compress (bool): Should the sections be compressed?
+    """
+    def __init__(self, layout, sections, compress=True):
+        self.layout = layout
+        self.sections = sections
+        self.compress = compress
+
+    def save(self, file_path, vm):
+        self.image_file(vm).save(file_path, compress=self.compress)
+
+    def image_file(self, vm):
+        """Returns the image file of the current state of vm.
+        """
+        return ImageFile(
+            vm.memory,
+            vm.cell_size,
+            self.sections(vm),
+            registers={
+                "ip": vm.interpreter_pointer,
+                "sp": vm.data_stack_pointer,
+                "rp": vm.return_stack_pointer
+            },
+            layout=self.layout,
+            compiler_metadata=vm.compiler_metadata
+        )
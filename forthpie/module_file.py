@@ -0,0 +1,113 @@
+"""Relocatable compiled modules.
+
+A module file holds the code and name dictionary bytes a source added to a
+base image, with the relocations to apply to them when they are linked in
+another image. Like image files, they start with a fixed header (magic
+bytes, format version and length of the JSON description following it).
+The code bytes then the names bytes come after the description, each one
+optionally compressed with zlib.
+
+Relocations are (section, offset, kind) tuples: the cell at offset in the
+"code" or "names" bytes holds a value of the given kind. Kinds are "code"
+for an address in the code of the module, "names" for an address in its
+names and "last" for the last name of the base image. Patches are the cells
+of the base image the source changed, as (location, address, value, kind)
+tuples where location is "memory" for an absolute address or "user" for an
+offset in the user area, and kind is a relocation kind or None.
+"""
+import json
+import zlib
+
+from .image_file import HEADER
+
+MAGIC = b"FPFO"
+VERSION = 1
+
+class NotAModuleFile(Exception):
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+class UnsupportedModuleVersion(Exception):
+    def __init__(self, version):
+        self.version = version
+
+class NotRelocatable(Exception):
+    def __init__(self, address):
+        self.address = address
+
+class IncompatibleModule(Exception):
+    def __init__(self, reason):
+        self.reason = reason
+
+class ModuleFile(object):
+    """Content of a module file.
+
+    Args:
+        cell_size (int): The size of a cell in bytes.
+        base (dict): What the module needs from the image it is linked in:
+                     "code_pointer" and "name_pointer" of the base image,
+                     "names_digest" of its name dictionary.
+        code (bytes): The code compiled by the module.
+        names (bytes): The name dictionary entries of the module.
+        relocations (list): The (section, offset, kind) relocations.
+        patches (list): The (location, address, value, kind) patches.
+        symbols (list): The (name, start offset, end offset) of the words of
+                        the module known to the compiler.
+    """
+    def __init__(self, cell_size, base, code, names, relocations=(), patches=(), symbols=()):
+        self.cell_size = cell_size
+        self.base = base
+        self.code = code
+        self.names = names
+        self.relocations = list(relocations)
+        self.patches = list(patches)
+        self.symbols = list(symbols)
+
+    def save(self, file_path, compress=True):
+        payloads = []
+        sections = []
+        for name, data in (("code", self.code), ("names", self.names)):
+            compression = "none"
+            if compress and data:
+                data = zlib.compress(data)
+                compression = "zlib"
+            payloads.append(data)
+            sections.append({"name": name, "compression": compression, "size": len(data)})
+        description = json.dumps({
+            "cell_size": self.cell_size,
+            "base": self.base,
+            "relocations": self.relocations,
+            "patches": self.patches,
+            "symbols": self.symbols,
+            "sections": sections
+        }).encode("utf-8")
+        with open(file_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(description)))
+            file.write(description)
+            for data in payloads:
+                file.write(data)
+
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, "rb") as file:
+            magic, version, description_size = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC:
+                raise NotAModuleFile(file_path)
+            if version > VERSION:
+                raise UnsupportedModuleVersion(version)
+            description = json.loads(file.read(description_size).decode("utf-8"))
+            sections = dict()
+            for section in description["sections"]:
+                data = file.read(section["size"])
+                if section["compression"] == "zlib":
+                    data = zlib.decompress(data)
+                sections[section["name"]] = data
+        return cls(
+            description["cell_size"],
+            description["base"],
+            sections["code"],
+            sections["names"],
+            relocations=[tuple(r) for r in description["relocations"]],
+            patches=[tuple(p) for p in description["patches"]],
+            symbols=[tuple(s) for s in description["symbols"]]
+        )
@@ -1,7 +1,26 @@
+class Halt(object):
+    """Type of the sentinel returned instead of the next IP to stop the VM.
+    """
+    def __repr__(self):
+        return "HALT"
+
+HALT = Halt()
+
 class primitive(object):
-    def __init__(self, code, name):
+    """Decorator turning a function into a primitive.
+
+    Two calling conventions are supported:
+    - by default the function calls vm.next() to let the inner interpreter
+      go on (BYE does not);
+    - with returns_next_ip=True, the function returns the address of the
+      next token to run, HALT to stop the VM.
+    execute() follows the first convention and dispatch() the second one,
+    whatever the convention of the function is.
+    """
+    def __init__(self, code, name, returns_next_ip=False):
         self.code = code
         self.name = name
+        self.returns_next_ip = returns_next_ip
         self.function = None
 
     def __call__(self, function):
@@ -9,7 +28,31 @@ class primitive(object):
         return self
 
     def execute(self, vm):
-        return self.function(vm)
+        if not self.returns_next_ip:
+            return self.function(vm)
+        next_ip = self.function(vm)
+        if next_ip is not HALT:
+            vm.interpreter_pointer = next_ip
+            vm.next()
+
+    def dispatch(self, vm):
+        """Run the primitive and return the next IP, or HALT.
+        """
+        if self.returns_next_ip:
+            return self.function(vm)
+        vm.keep_going = False
+        self.function(vm)
+        if vm.keep_going:
+            return vm.interpreter_pointer
+        return HALT
+
+    @property
+    def dispatch_function(self):
+        """Plain function of the vm returning the next IP, or HALT.
+        """
+        if self.returns_next_ip:
+            return self.function
+        return self.dispatch
 
 class debug(primitive):
     def __init__(self, input_count=0, output_count=0):
@@ -33,6 +76,14 @@ class debug(primitive):
     def function(self):
         return self.primitive.function
 
+    @property
+    def returns_next_ip(self):
+        return self.primitive.returns_next_ip
+
+    @property
+    def dispatch_function(self):
+        return self.dispatch
+
     def execute(self, vm):
         print(f"DEBUG PRIMITIVE: {self.primitive.name}")
         print(f"Input=(top){vm.tops_of_data_stack(self.input_count)}(bottom)")
@@ -40,6 +91,13 @@ class debug(primitive):
         print(f"Output=(top){vm.tops_of_data_stack(self.output_count)}(bottom)")
         return result
 
+    def dispatch(self, vm):
+        print(f"DEBUG PRIMITIVE: {self.primitive.name}")
+        print(f"Input=(top){vm.tops_of_data_stack(self.input_count)}(bottom)")
+        result = self.primitive.dispatch(vm)
+        print(f"Output=(top){vm.tops_of_data_stack(self.output_count)}(bottom)")
+        return result
+
 class NoPrimitiveFound(Exception):
     def __init__(self, primitive_code_or_name):
         self.primitive_code_or_name = primitive_code_or_name
@@ -53,10 +111,17 @@ class NullPrimitive(primitive):
     def execute(self, vm):
         raise NoPrimitiveFound(self.code)
 
+    def dispatch(self, vm):
+        raise NoPrimitiveFound(self.code)
+
 class PrimitiveStore(object):
     def __init__(self, *args):
         self.primitives = args
         self.primitive_index = self.create_primitive_index()
+        # Functions returning the next IP, indexed by primitive code.
+        self.dispatch_index = tuple(
+            primitive.dispatch_function for primitive in self.primitive_index
+        )
 
     def create_primitive_index(self):
         primitives_index = [None] * (max(prim.code for prim in self.primitives)+1)
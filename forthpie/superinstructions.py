@@ -0,0 +1,246 @@
+import functools
+import weakref
+
+from .primitives import primitive
+
+# Primitives followed by an inline cell (a literal or a branch target).
+OPERAND_PRIMITIVES = frozenset(["doLIT", "branch", "?branch", "next"])
+# Primitives that neither read nor modify the interpreter pointer.
+STRAIGHT_LINE_PRIMITIVES = frozenset([
+    "?RX", "TX!", "!IO", "!", "@", "C!", "C@", "RP@", "RP!", "R>", "R@", ">R",
+    "DROP", "DUP", "SWAP", "OVER", "SP@", "SP!", "0<", "AND", "OR", "XOR",
+    "UM+", "UM/MOD"
+])
+# Primitives that may only end a superinstruction.
+CONTROL_PRIMITIVES = frozenset(["branch", "?branch", "next", "EXIT"])
+MAX_LEAF_WORD_LENGTH = 8
+
+class superinstruction(primitive):
+    """Primitive fusing a sequence of tokens compiled one after the other.
+
+    Only the first cell of the sequence is replaced by the superinstruction,
+    the following cells are kept as they are. The superinstruction skips them
+    when it runs so the code keeps the same layout: branches to the middle of
+    the sequence and inline operands patched later (e.g. by THEN) still work.
+
+    The first time a superinstruction runs at an address, it checks that the
+    cells following it still hold the sequence it fuses. Write barriers on
+    these cells, and on the bodies of the colon definitions it inlines, make
+    it check again once one of them is patched. When the sequence does not
+    match anymore, only the first component runs and the inner interpreter
+    goes on with the following cells as if nothing was fused.
+
+    A component is either a primitive or a tuple of primitives standing for a
+    colon definition whose body only contains these primitives (followed by
+    EXIT), for instance (UM+, DROP) for "+". Such definitions are inlined and
+    keep pushing and popping their return address like doLIST and EXIT do.
+    """
+    def __init__(self, code, name, *components):
+        super().__init__(code, name, returns_next_ip=True)
+        if not isinstance(components[0], primitive):
+            raise Exception("A superinstruction must start with a primitive.")
+        for component in components[:-1]:
+            if isinstance(component, primitive) and component.name in CONTROL_PRIMITIVES:
+                raise Exception(f"{component.name} can only end a superinstruction.")
+        self.components = components
+        self.function = self.run
+        # Addresses where the fused sequence was checked, by memory.
+        self.checked_addresses = weakref.WeakKeyDictionary()
+
+    @property
+    def cells_count(self):
+        """Number of cells taken by the fused sequence in threaded code.
+        """
+        return sum(
+            2 if isinstance(c, primitive) and c.name in OPERAND_PRIMITIVES else 1
+            for c in self.components
+        )
+
+    def run(self, vm):
+        address = vm.interpreter_pointer - vm.cell_size
+        checked_addresses = self.checked_addresses.get(vm.memory)
+        if checked_addresses is None or address not in checked_addresses:
+            if not self.check(vm, address):
+                return self.components[0].dispatch(vm)
+        for component in self.components[:-1]:
+            # Skip the cell of the next component, like the inner interpreter.
+            vm.interpreter_pointer = self.run_component(vm, component) + vm.cell_size
+        return self.run_component(vm, self.components[-1])
+
+    def run_component(self, vm, component):
+        if isinstance(component, primitive):
+            return component.dispatch(vm)
+        vm.push_on_return_stack(vm.interpreter_pointer)
+        for body_primitive in component:
+            body_primitive.dispatch(vm)
+        return vm.pop_from_return_stack()
+
+    def check(self, vm, address):
+        """Check that the sequence fused is compiled at address and watch the
+        cells it was decoded from.
+        """
+        if vm.read_cell_at_address(address) != vm.word_pointer:
+            # Run through EXECUTE, there is no fused sequence.
+            return False
+        if self.match(vm, vm, address) is None:
+            return False
+        checked_addresses = self.checked_addresses.setdefault(vm.memory, set())
+        checked_addresses.add(address)
+        forget = functools.partial(forget_address, checked_addresses, address)
+        for watched_address in self.decoded_addresses(vm, address):
+            vm.memory.watch(watched_address, forget)
+        return True
+
+    def decoded_addresses(self, manipulator, address):
+        """Yields the addresses of the bytes the sequence compiled at address
+        is decoded from, including the bodies of inlined colon definitions.
+        """
+        cell_size = manipulator.cell_size
+        for component in self.components:
+            execution_token = manipulator.read_cell_at_address(address)
+            yield from range(address, address + cell_size)
+            if isinstance(component, primitive):
+                # Code field.
+                yield from range(execution_token, execution_token + cell_size)
+                if component.name in OPERAND_PRIMITIVES:
+                    address += cell_size
+            else:
+                # Code field, body and EXIT.
+                yield from range(execution_token, execution_token + (len(component) + 2) * cell_size)
+            address += cell_size
+
+    def match(self, manipulator, primitives_provider, address):
+        """Returns the address following the sequence fused by this
+        superinstruction if it is compiled at address, None otherwise.
+        """
+        for component in self.components:
+            try:
+                execution_token = manipulator.read_cell_at_address(address)
+                if isinstance(component, primitive):
+                    first = first_primitive(manipulator, primitives_provider, execution_token)
+                    if first is None or first.code != component.code:
+                        return None
+                    if component.name in OPERAND_PRIMITIVES:
+                        address += manipulator.cell_size
+                else:
+                    body = leaf_word_body(manipulator, primitives_provider, execution_token)
+                    if body is None or [p.code for p in body] != [p.code for p in component]:
+                        return None
+            except IndexError:
+                return None
+            address += manipulator.cell_size
+        return address
+
+def forget_address(checked_addresses, address, written_address):
+    """Write barrier making a superinstruction check its sequence again.
+    """
+    checked_addresses.discard(address)
+
+def first_primitive(manipulator, primitives_provider, execution_token):
+    """Returns the primitive run first by the word at execution_token, seeing
+    through superinstructions. Returns None for invalid code fields.
+    """
+    try:
+        found = primitives_provider.get_primitive_by_address(
+            manipulator.read_cell_at_address(execution_token)
+        )
+    except IndexError:
+        return None
+    if isinstance(found, superinstruction):
+        return found.components[0]
+    return found
+
+def leaf_word_body(manipulator, primitives_provider, execution_token):
+    """Returns the primitives compiled in the colon definition at
+    execution_token if they are all straight-line primitives followed by EXIT,
+    None otherwise.
+    """
+    first = first_primitive(manipulator, primitives_provider, execution_token)
+    if first is None or first.name != "doLIST":
+        return None
+    body = []
+    address = execution_token + manipulator.cell_size
+    for i in range(MAX_LEAF_WORD_LENGTH):
+        token = first_primitive(
+            manipulator,
+            primitives_provider,
+            manipulator.read_cell_at_address(address)
+        )
+        if token is None:
+            return None
+        if token.name == "EXIT":
+            return tuple(body)
+        if token.name not in STRAIGHT_LINE_PRIMITIVES:
+            return None
+        body.append(token)
+        address += manipulator.cell_size
+    return None
+
+def reads_inline_cell(manipulator, primitives_provider, execution_token):
+    """Returns True if the word at execution_token may use the cell compiled
+    after it as data. This is the case of primitives taking an operand and of
+    colon definitions starting with R> such as COMPILE or do$.
+    """
+    first = first_primitive(manipulator, primitives_provider, execution_token)
+    if first is None:
+        return False
+    if first.name in OPERAND_PRIMITIVES:
+        return True
+    if first.name != "doLIST":
+        return False
+    try:
+        token = first_primitive(
+            manipulator,
+            primitives_provider,
+            manipulator.read_cell_at_address(execution_token + manipulator.cell_size)
+        )
+    except IndexError:
+        return False
+    return token is not None and token.name == "R>"
+
+def fuse_at(manipulator, primitives_provider, address, candidates):
+    """Replace the token compiled at address by the first superinstruction in
+    candidates fusing the sequence starting there.
+
+    Args:
+        candidates (list): (superinstruction, execution token) pairs, longer
+                           superinstructions should come first.
+
+    Returns:
+        superinstruction: The superinstruction compiled or None.
+    """
+    try:
+        current = primitives_provider.get_primitive_by_address(
+            manipulator.read_cell_at_address(
+                manipulator.read_cell_at_address(address)
+            )
+        )
+    except IndexError:
+        return None
+    if isinstance(current, superinstruction):
+        return None
+    for candidate, execution_token in candidates:
+        if candidate.match(manipulator, primitives_provider, address) is not None:
+            manipulator.write_cell_at_address(address, execution_token)
+            return candidate
+    return None
+
+def fuse_before(manipulator, primitives_provider, address, candidates):
+    """Fuse the sequence of tokens compiled right before address, if any.
+
+    Used while compiling at run time, when only the cells preceding HERE are
+    known. Sequences following a word that reads inline cells are left alone
+    since their first cell may be data.
+    """
+    for candidate, execution_token in candidates:
+        start = address - candidate.cells_count * manipulator.cell_size
+        if start < manipulator.cell_size:
+            continue
+        if candidate.match(manipulator, primitives_provider, start) != address:
+            continue
+        if reads_inline_cell(manipulator,
+                             primitives_provider,
+                             manipulator.read_cell_at_address(start - manipulator.cell_size)):
+            continue
+        return fuse_at(manipulator, primitives_provider, start, [(candidate, execution_token)])
+    return None
@@ -1,5 +1,7 @@
-VARIABLE BLK
+\ The block buffers are the last 4 KB of the memory, above the heap.
+$7000 4 BLOCK-BUFFERS 2!
 
-: BLOCK ( u - a-addr )
-    
-;
\ No newline at end of file
+: USE ( "name" - )
+    \ Use the file name as block file.
+    BL WORD COUNT OPEN-BLOCKS ABORT" cannot open the block file"
+;
@@ -1,3 +1,5 @@
+\ requires memory_allocator.f
+
 VARIABLE heap_start
 
 : heap_start@
@@ -10,6 +12,12 @@ VARIABLE heap_start
 
 $4001 heap_start!
 
+: heap_limit ( - addr )
+    \ End of the region of the bump allocator, the native heap of
+    \ memory_allocator.f starts there.
+    $5000
+;
+
 VARIABLE heap_direction
 
 : heap_direction@
@@ -48,6 +56,10 @@ reset_heap
     heap_top@ SWAP    \ heap-addr, n
     heap_direction@ * \ Change sign of n according to direction
     heap_top@ +       \ Compute the new address
+    DUP heap_start@ heap_limit 1 + WITHIN NOT IF
+        \ Out of the region of the bump allocator.
+        2DROP 0 0 EXIT
+    THEN
     heap_top!         \ Store new heap address.
     -1                \ true flag to say alloc was ok.
 ;
@@ -63,17 +75,32 @@ reset_heap
 ;
 
 \ -----------------------------------------------------------------------------
-\ Public interface for the allocator.
+\ Native allocator of the kernel, in the heap of memory_allocator.f
+\ -----------------------------------------------------------------------------
+
+: native_allocate ( n - addr f )
+    ALLOCATE 0 =
+;
+
+: native_free ( addr - f )
+    FREE 0 =
+;
+
+: native_resize ( addr1 u - addr2 f )
+    RESIZE 0 =
+;
+
+\ -----------------------------------------------------------------------------
+\ Public interface for the allocator, true flag on success.
 \ -----------------------------------------------------------------------------
 
 VARIABLE 'allocate
 VARIABLE 'free
 VARIABLE 'resize
 
-' bump_allocate 'allocate !
-
-' bump_free 'free !
-' bump_resize 'resize !
+' native_allocate 'allocate !
+' native_free 'free !
+' native_resize 'resize !
 
 : allocate
     'allocate @EXECUTE
@@ -5,9 +5,7 @@
     \ allocate the heap and stores it on the heap.
     \ Returns the address of the allocated string on the heap.
     [ CHAR " ] LITERAL PARSE
-    255 allocate
-    NOT IF
-        abort" Heap exhausted."
-    THEN
+    DUP 1 + allocate \ Room for the count byte.
+    NOT ABORT" Heap exhausted."
     PACK$
 ;
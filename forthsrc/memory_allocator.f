@@ -1,33 +1,7 @@
+\ The heap of the native allocator of the kernel: ALLOCATE, FREE and RESIZE
+\ with their ANS ior results, HEAP-LIVE, HEAP-PEAK and HEAP-FRAGMENTATION.
+\ It lies between the region of the bump allocator of heap.f and the block
+\ buffers of blocks.f. Load this file once: INIT-HEAP forgets every
+\ allocation of the heap.
 
-\ Block manipulation words.
-
-VARIABLE HEAPSTART
-
-$4001 HEAPSTART ! \ Modify to fit memory layout.
-
-: memblock-size ( addr - n ) @ ;
-
-: memblock-next ( addr - addr ) CELL+ @ ;
-
-: memblock-used ( addr - f ) CELL+ CELL+ @ ;
-
-: memblock-data ( addr - addr ) CELL+ CELL+ CELL+ ;
-
-: memblock-find ( n addr - addr f | f )
-    WHILE
-        DUP 0 =
-    BEGIN
-        2DUP memblock-size =
-        IF SWAP DROP TRUE EXIT
-        THEN
-    REPEAT
-    2DROP FALSE
-;
-
-\ Allocator public interface.
-
-: allocate (u - a-addr wior) ; \ TODO
-
-: free (a-addr - wior) ; \ TODO
-
-; resize (a-addr1 u - a-addr2 wior) ; \ TODO
\ No newline at end of file
+$5000 $2000 INIT-HEAP \ Modify to fit memory layout.
@@ -20,14 +20,6 @@
 
 : ?CSP ( -- ) SP@ CSP @ XOR ABORT" stack depth" ;
 
-: >NAME ( ca -- na, F )
-  CURRENT
-  BEGIN CELL+ @ ?DUP WHILE 2DUP
-    BEGIN @ DUP WHILE 2DUP NAME> XOR
-    WHILE 1 CELLS -
-    REPEAT      THEN NIP ?DUP
-  UNTIL NIP NIP EXIT THEN 0 NIP ;
-
 : .ID ( na -- )
   ?DUP IF COUNT LEXICON_MASK AND TYPE EXIT THEN ." {noName}" ;
 
@@ -0,0 +1,80 @@
+"""Benchmark of the block word set.
+
+Reads the blocks of a 512 KB block file sequentially and in random order,
+with and without UPDATE, through pools of block buffers of several sizes in
+the heap of the VM. The block numbers to access are written in the heap
+after the buffers, so that both orders run the same Forth code. Reports the
+time per block access, less the time of the same run without the loop, and
+the hits, misses and blocks written back of the
+block storage.
+
+Usage:
+    python scripts/benchmark_blocks.py
+"""
+import io
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from forthpie.forth import OptimizedInterpreter
+from forthpie.eforth import eforth16bits
+
+BLOCKS = 512
+ACCESSES = 4096
+POOL_SIZES = (1, 4, 8)
+BUFFERS_ADDRESS = eforth16bits.EM
+NUMBERS_ADDRESS = BUFFERS_ADDRESS + max(POOL_SIZES)*1024
+
+WORDS = f"""
+: accesses ( - ) {ACCESSES-1} FOR R@ DUP + {NUMBERS_ADDRESS} + @ BLOCK DROP NEXT ;
+: updates ( - ) {ACCESSES-1} FOR R@ DUP + {NUMBERS_ADDRESS} + @ BLOCK DROP UPDATE NEXT ;
+"""
+
+def run(block_file, pool_size, numbers, workload):
+    interpreter = OptimizedInterpreter(
+        cell_size=eforth16bits.CELL_SIZE,
+        primitives=eforth16bits.primitives_store,
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            WORDS
+            + f": use $\" {block_file}\" COUNT OPEN-BLOCKS DROP ; use\n"
+            + f"{BUFFERS_ADDRESS} {pool_size} BLOCK-BUFFERS 2!\n"
+            + f"{workload} FLUSH\nBYE\n"
+        ),
+        output_stream=io.StringIO()
+    )
+    interpreter.memory = eforth16bits.bootstrap_16bits_eforth().memory
+    for index, number in enumerate(numbers):
+        interpreter.write_cell_at_address(NUMBERS_ADDRESS+index*eforth16bits.CELL_SIZE, number)
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    start = time.perf_counter()
+    interpreter.start()
+    duration = time.perf_counter() - start
+    interpreter.block_storage.close()
+    return duration, interpreter.block_storage
+
+def access_time(block_file, pool_size, numbers, workload):
+    duration, storage = run(block_file, pool_size, numbers, workload)
+    baseline, _ = run(block_file, pool_size, numbers, "")
+    return (duration-baseline) / ACCESSES, storage
+
+def benchmark():
+    with tempfile.TemporaryDirectory() as directory:
+        block_file = Path(directory) / "blocks.fb"
+        block_file.write_bytes(b" " * BLOCKS * 1024)
+        print(f"{'workload':<20}{'buffers':>8}{'us/access':>11}{'hits':>7}{'misses':>8}{'writes':>8}")
+        orders = (
+            ("sequential", [index % BLOCKS for index in range(ACCESSES)]),
+            ("random", [random.randrange(BLOCKS) for _ in range(ACCESSES)])
+        )
+        for name, numbers in orders:
+            for workload in ("accesses", "updates"):
+                for pool_size in POOL_SIZES:
+                    duration, storage = access_time(block_file, pool_size, numbers, workload)
+                    print(f"{name + ' ' + workload:<20}{pool_size:>8}{duration*1e6:>11.1f}"
+                          f"{storage.hits:>7}{storage.misses:>8}{storage.writes:>8}")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,52 @@
+"""Benchmark the build of images from the Forth sources of the repository.
+
+Builds the layered image of each workload without cache, once compiling the
+sources ahead of time and once interpreting them with the VM, and reports
+the wall time and the number of parts of the sources left to the VM.
+
+Usage:
+    python scripts/benchmark_build.py
+"""
+import io
+import time
+from pathlib import Path
+
+from forthpie.eforth import eforth16bits
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+WORKLOADS = (
+    ("core", ["forthsrc/core.f"]),
+    ("core + tools", ["forthsrc/core.f", "forthsrc/tools.f"]),
+    ("heap", ["forthsrc/core.f", "forthsrc/unittests.f", "forthsrc/memory_allocator.f", "forthsrc/heap.f"]),
+)
+
+def build(files, ahead_of_time):
+    sources = [(ROOT_DIR / f).read_text() for f in files]
+    interpreted = []
+    run_layer = eforth16bits.run_layer
+    def counting_run_layer(*args, **kwargs):
+        interpreted.append(args[2])
+        return run_layer(*args, **kwargs)
+    eforth16bits.run_layer = counting_run_layer
+    try:
+        start = time.perf_counter()
+        eforth16bits.build_layered_image(
+            sources,
+            cache=None,
+            output_stream=io.StringIO(),
+            ahead_of_time=ahead_of_time
+        )
+        return time.perf_counter() - start, len(interpreted)
+    finally:
+        eforth16bits.run_layer = run_layer
+
+def benchmark():
+    print(f"{'workload':<20}{'ahead of time':>14}{'VM runs':>9}{'time (s)':>10}")
+    for name, files in WORKLOADS:
+        for ahead_of_time in (False, True):
+            duration, vm_runs = build(files, ahead_of_time)
+            print(f"{name:<20}{str(ahead_of_time):>14}{vm_runs:>9}{duration:>10.2f}")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,62 @@
+"""Microbenchmark of the dispatch of primitives.
+
+Runs a FOR NEXT loop made of primitives only, and the bootstrap image
+loading forthsrc/core.f, with the interpreter calling primitive.execute()
+and vm.next() and with the one using the next IP returned by primitives.
+Reports the number of instructions executed per second.
+
+Usage:
+    python scripts/benchmark_dispatch.py
+"""
+import io
+import time
+from pathlib import Path
+
+from forthpie.forth import OptimizedInterpreter, ReturnDispatchInterpreter, StatisticsInterpreter
+from forthpie.model import WR, L, LR
+from forthpie.eforth import eforth16bits
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+INTERPRETERS = (OptimizedInterpreter, ReturnDispatchInterpreter)
+
+def primitives_loop(compiler):
+    compiler.compile_word_body([
+        WR("doLIT"), 29999, WR(">R"),
+        L("LOOP"), WR("DUP"), WR("DROP"), WR("doLIT"), 1, WR("DROP"), WR("SP@"), WR("DROP"),
+        WR("next"), LR("LOOP"),
+        WR("BYE")
+    ])
+
+def interpreter_running(interpreter_class, workload):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_class(
+        cell_size=compiler.cell_size,
+        primitives=eforth16bits.primitives_store,
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO((ROOT_DIR / "forthsrc/core.f").read_text() + "\nBYE\n"),
+        output_stream=io.StringIO()
+    )
+    interpreter.memory = compiler.memory
+    if workload == "primitives loop":
+        interpreter.interpreter_pointer = compiler.code_address
+        primitives_loop(compiler)
+    else:
+        interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    return interpreter
+
+def benchmark():
+    print(f"{'workload':<18}{'interpreter':>28}{'instructions':>14}{'instructions/s':>16}")
+    for workload in ("primitives loop", "core.f"):
+        interpreter = interpreter_running(StatisticsInterpreter, workload)
+        interpreter.start()
+        instructions = sum(interpreter.execution_statistics.words_calls.values())
+        for interpreter_class in INTERPRETERS:
+            interpreter = interpreter_running(interpreter_class, workload)
+            start = time.perf_counter()
+            interpreter.start()
+            duration = time.perf_counter() - start
+            print(f"{workload:<18}{interpreter_class.__name__:>28}{instructions:>14}{instructions/duration:>16.0f}")
+
+if __name__ == "__main__":
+    benchmark()
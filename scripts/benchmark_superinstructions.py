@@ -0,0 +1,71 @@
+"""Benchmark the superinstructions of the 16 bits eForth.
+
+Bootstraps the image with and without superinstructions, then feeds it the
+Forth sources of the repository and reports the number of tokens dispatched
+by the inner interpreter and the wall time.
+
+Usage:
+    python scripts/benchmark_superinstructions.py [--ngrams]
+
+With --ngrams, the most frequent sequences of tokens are printed instead, they
+are the candidates for new superinstructions.
+"""
+import io
+import sys
+import time
+from pathlib import Path
+
+from forthpie.forth import OptimizedInterpreter, StatisticsInterpreter, SequenceStatisticsInterpreter
+from forthpie.eforth import eforth16bits
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+WORKLOADS = (
+    ("core", ["forthsrc/core.f"]),
+    ("unittests", ["forthsrc/core.f", "forthsrc/unittests.f", "forthtests/testunittests.f"]),
+    ("heap", ["forthsrc/core.f", "forthsrc/unittests.f", "forthsrc/memory_allocator.f", "forthsrc/heap.f", "forthtests/testheapbump.f"]),
+    ("kernel extension", ["forthsrc/core.f", "forthsrc/unittests.f", "forthsrc/tools.f", "forthtests/test_kernel_extension.f"]),
+)
+
+def workload_source(files):
+    return "".join((ROOT_DIR / f).read_text() + "\n" for f in files) + "BYE\n"
+
+def run_workload(interpreter_class, files, superinstructions):
+    compiler = eforth16bits.bootstrap_16bits_eforth(superinstructions)
+    interpreter = interpreter_class(
+        cell_size=compiler.cell_size,
+        primitives=eforth16bits.primitives_store,
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(workload_source(files)),
+        output_stream=io.StringIO(),
+        compiler_metadata=compiler.compiler_metadata
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    start = time.perf_counter()
+    interpreter.start()
+    return interpreter, time.perf_counter() - start, compiler
+
+def benchmark():
+    print(f"{'workload':<20}{'superinstructions':>18}{'dispatches':>12}{'time (s)':>10}")
+    for name, files in WORKLOADS:
+        for superinstructions in (False, True):
+            interpreter, _, _ = run_workload(StatisticsInterpreter, files, superinstructions)
+            dispatches = sum(interpreter.execution_statistics.words_calls.values())
+            _, duration, _ = run_workload(OptimizedInterpreter, files, superinstructions)
+            print(f"{name:<20}{str(superinstructions):>18}{dispatches:>12}{duration:>10.2f}")
+
+def print_ngrams(count=30):
+    for name, files in WORKLOADS:
+        interpreter, _, compiler = run_workload(SequenceStatisticsInterpreter, files, False)
+        sequences = interpreter.execution_statistics.sequence_names_to_count(compiler.compiler_metadata)
+        print(f"{name}:")
+        for sequence, calls_count in sorted(sequences.items(), key=lambda item: -item[1])[:count]:
+            print(f"\t{calls_count:>10} {' '.join(sequence)}")
+
+if __name__ == "__main__":
+    if "--ngrams" in sys.argv:
+        print_ngrams()
+    else:
+        benchmark()
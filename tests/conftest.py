@@ -0,0 +1,10 @@
+import pytest
+
+import forthpie.eforth.eforth16bits as eforth16bits
+
+@pytest.fixture(autouse=True)
+def bootstrap_cache_directory(tmp_path, monkeypatch):
+    """Keep the image files of the bootstrap cache in the temporary
+    directory of the test, even when FORTHPIE_CACHE_DIR is set.
+    """
+    monkeypatch.setattr(eforth16bits.BOOTSTRAP_CACHE, "directory", tmp_path / "cache")
@@ -3,6 +3,7 @@ import pytest
 from forthpie.forth import Memory
 from forthpie.model import WordReference
 from forthpie.eforth.primitives.by_the_book import primitives_store
+from forthpie.compiler import WordNotInDictionary, CompilerMetadata, WordMetaData
 from forthpie.eforth.compiler.by_the_book import Compiler
 
 @pytest.fixture
@@ -26,7 +27,7 @@ def test_compile_name_header(compiler):
     assert compiler.read_cell_at_address(compiler.name_address) == 0x180
     assert compiler.read_cell_at_address(compiler.name_address+compiler.cell_size) == 0x3BFF+2*compiler.cell_size
     assert compiler.memory[(compiler.name_address+2*compiler.cell_size)] == (len("testWord")|0b01000000)
-    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testWord")] == [ord(c) for c in "testWord"]
+    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testWord")] == b"testWord"
     assert (compiler.name_address+2*compiler.cell_size)+1+len("testWord")+1 == 0x3BFF
     assert compiler.memory[0x3BFF] == 0 # padding byte
 
@@ -39,7 +40,7 @@ def test_compile_colon_header(compiler):
     assert compiler.read_cell_at_address(compiler.name_address) == 0x180
     assert compiler.read_cell_at_address(compiler.name_address+compiler.cell_size) == 0x3BFF+2*compiler.cell_size
     assert compiler.memory[(compiler.name_address+2*compiler.cell_size)] == (len("testWord")|0b01000000)
-    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testWord")] == [ord(c) for c in "testWord"]
+    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testWord")] == b"testWord"
     assert (compiler.name_address+2*compiler.cell_size)+1+len("testWord")+1 == 0x3BFF
     assert compiler.memory[0x3BFF] == 0 # padding byte
 
@@ -59,7 +60,7 @@ def test_compile_user_header(compiler):
     assert compiler.read_cell_at_address(compiler.name_address) == 0x182
     assert compiler.read_cell_at_address(compiler.name_address+compiler.cell_size) == doUser_name_address+2*compiler.cell_size
     assert compiler.memory[(compiler.name_address+2*compiler.cell_size)] == (len("testUser")|0b01000000)
-    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testUser")] == [ord(c) for c in "testUser"]
+    assert compiler.memory[(compiler.name_address+2*compiler.cell_size)+1:(compiler.name_address+2*compiler.cell_size)+1+len("testUser")] == b"testUser"
     assert (compiler.name_address+2*compiler.cell_size)+1+len("testUser")+1 == doUser_name_address
     assert compiler.memory[0x3BFF] == 0 # padding byte
 
@@ -87,3 +88,26 @@ def test_name_token_iterator(compiler):
     expected_names = ["one", "another", "yet", "bar", "foo"]
     for name_token, expected_name in zip(compiler.name_tokens_iterator(), expected_names):
         assert compiler.read_word_name(name_token) == expected_name
+
+def test_name_token_of_missing_word(compiler):
+    compiler.compile_colon_header(compile_only=False, immediate=False, name="foo")
+
+    with pytest.raises(WordNotInDictionary):
+        compiler.name_token(WordReference("bar"))
+
+def test_word_address_belongs_to():
+    compiler_metadata = CompilerMetadata(0)
+    compiler_metadata.add_word_meta(WordMetaData("FOO", 2, 10))
+    compiler_metadata.add_word_meta(WordMetaData("BAZ", 20, 24))
+    # Added out of order, and its end is only known after.
+    compiler_metadata.add_word_meta(WordMetaData("BAR", 12))
+    compiler_metadata.last().end_address = 16
+
+    assert compiler_metadata.word_address_belongs_to(2).name == "FOO"
+    assert compiler_metadata.word_address_belongs_to(10).name == "FOO"
+    assert compiler_metadata.word_address_belongs_to(14).name == "BAR"
+    assert compiler_metadata.word_address_belongs_to(24).name == "BAZ"
+    assert compiler_metadata.last().name == "BAR"
+    for address in (0, 11, 18, 26):
+        with pytest.raises(StopIteration):
+            compiler_metadata.word_address_belongs_to(address)
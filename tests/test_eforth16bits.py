@@ -1,11 +1,21 @@
 import pytest
 import logging
+import io
+import time
+import random
 
-from forthpie.forth import ForthInterpreter
-from forthpie.eforth.primitives.by_the_book import primitives_store
-from forthpie.model import WordReference
+from forthpie.forth import ForthInterpreter, OptimizedInterpreter, ReturnDispatchInterpreter, ClosureInterpreter, SequenceStatisticsInterpreter, CachedStacksInterpreter, TracingInterpreter
+from forthpie.eforth.primitives.forthpie import primitives_store
+from forthpie.model import WordReference, L, LR
+from forthpie.compiler import WordNotInDictionary
 WR = WordReference
 import forthpie.eforth.eforth16bits as eforth16bits
+from forthpie.image_file import ImageFile
+from forthpie.image_cache import ImageCache
+from forthpie.module_file import IncompatibleModule
+from forthpie.eforth.primitives.memory_allocation import Heap
+from forthpie.eforth.images import by_the_book
+from forthpie.compiler import ImageCompiler
 
 @pytest.mark.parametrize("to_compile, expected_data_stack",
     [
@@ -406,4 +416,910 @@ def test_WORD(to_compile, expected_data_stack):
     # for i, stack_data in enumerate(expected_data_stack):
     #     assert interpreter.read_cell_at_address(interpreter.data_stack_pointer-len(expected_data_stack)*interpreter.cell_size+i*interpreter.cell_size) == stack_data
 
-    assert expected_data_stack == interpreter.tops_of_data_stack(len(expected_data_stack))
\ No newline at end of file
+    assert expected_data_stack == interpreter.tops_of_data_stack(len(expected_data_stack))
+
+def interpreter_running(interpreter_class, compiler, tokens, primitives=None, **kwargs):
+    """Returns an interpreter of interpreter_class ready to run tokens, compiled
+    at the end of the code dictionary of compiler.
+    """
+    interpreter = interpreter_class(compiler.cell_size, primitives or primitives_store(), logger=logging, **kwargs)
+    interpreter.data_stack_pointer = eforth16bits.SPP
+    interpreter.return_stack_pointer = eforth16bits.RPP
+    interpreter.interpreter_pointer = compiler.code_address
+    compiler.compile_word_body(tokens)
+    interpreter.memory = compiler.memory
+    return interpreter
+
+def test_ClosureInterpreter_store_in_code_space():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    body_address = compiler.code_address
+    interpreter = interpreter_running(ClosureInterpreter, compiler,
+        [WR("doLIT"), 42, WR("doLIT"), body_address + 6*compiler.cell_size, WR("!"),
+         WR("doLIT"), 0, WR("BYE")])
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(1) == [42]
+
+def test_ClosureInterpreter_blocks_invalidated_on_code_space_write():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    body_address = compiler.code_address
+    interpreter = interpreter_running(ClosureInterpreter, compiler,
+        [WR("doLIT"), 1, WR("doLIT"), 2, WR("+"), WR("BYE")])
+
+    interpreter.start()
+    assert interpreter.tops_of_data_stack(1) == [3]
+    assert body_address in interpreter.blocks
+
+    interpreter.write_cell_at_address(body_address + 3*compiler.cell_size, 5)
+    interpreter.write_cell_at_address(
+        body_address + 4*compiler.cell_size,
+        compiler.lookup_word(WR("-"))
+    )
+    assert interpreter.blocks == {}
+
+    interpreter.interpreter_pointer = body_address
+    interpreter.start()
+    assert interpreter.tops_of_data_stack(2) == [3, -4 & 0xFFFF]
+
+def test_superinstructions_fused_at_compile_time():
+    compiler = eforth16bits.bootstrap_16bits_eforth(superinstructions=True)
+    body_address = compiler.code_address
+    interpreter = interpreter_running(ClosureInterpreter, compiler,
+        [WR("doLIT"), 1, WR("doLIT"), 2, WR("+"), WR("BYE")],
+        primitives=primitives_store())
+
+    assert compiler.read_cell_at_address(body_address) == compiler.lookup_word(WR("doLIT"))
+    assert compiler.read_cell_at_address(body_address + 2*compiler.cell_size) == compiler.lookup_word(WR("doLIT +"))
+    assert compiler.read_cell_at_address(body_address + 4*compiler.cell_size) == compiler.lookup_word(WR("+"))
+
+    interpreter = ForthInterpreter(compiler.cell_size, primitives_store(), logger=logging)
+    interpreter.data_stack_pointer = eforth16bits.SPP
+    interpreter.return_stack_pointer = eforth16bits.RPP
+    interpreter.interpreter_pointer = body_address
+    interpreter.memory = compiler.memory
+    interpreter.start()
+    assert interpreter.tops_of_data_stack(1) == [3]
+
+def test_superinstructions_inline_cells_not_fused():
+    compiler = eforth16bits.bootstrap_16bits_eforth(superinstructions=True)
+    body_address = compiler.code_address
+    # The cell following doLIT is a literal even if it looks like DUP.
+    interpreter_running(ClosureInterpreter, compiler,
+        [WR("doLIT"), WR("DUP"), WR("@"), WR("BYE")],
+        primitives=primitives_store())
+
+    assert compiler.read_cell_at_address(body_address + compiler.cell_size) == compiler.lookup_word(WR("DUP"))
+
+def test_superinstructions_fused_at_run_time():
+    compiler = eforth16bits.bootstrap_16bits_eforth(superinstructions=True)
+    interpreter = ForthInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            "VARIABLE x 42 x ! : foo DUP @ SWAP DUP @ ; x foo ' foo CELL+ @ ' foo 3 CELLS + @ BYE\n"
+        )
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    value, _, fetched, dup_fetch, swap = interpreter.tops_of_data_stack(5)
+    assert value == fetched == 42
+    assert dup_fetch == compiler.lookup_word(WR("DUP @"))
+    assert swap == compiler.lookup_word(WR("SWAP"))
+
+@pytest.mark.parametrize("interpreter_class", [ForthInterpreter, OptimizedInterpreter, ReturnDispatchInterpreter, ClosureInterpreter])
+def test_superinstructions_see_patched_cells(interpreter_class):
+    compiler = eforth16bits.bootstrap_16bits_eforth(superinstructions=True)
+    output_stream = io.StringIO()
+    interpreter = interpreter_class(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            ": f 1 + ; 5 f . ' - ' f 3 CELLS + ! 5 f . BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith(" 6 4")
+
+def test_superinstructions_are_opt_in():
+    compiler, image = eforth16bits.generate_compiler_and_image()
+
+    assert compiler.superinstructions == ()
+    assert not {"DUP @", "fuse", "superinstructions"} & {word.name for word in image.words}
+
+def test_SequenceStatisticsInterpreter():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = SequenceStatisticsInterpreter(compiler.cell_size, primitives_store(), logger=logging)
+    interpreter.data_stack_pointer = eforth16bits.SPP
+    interpreter.return_stack_pointer = eforth16bits.RPP
+    interpreter.interpreter_pointer = compiler.code_address
+    compiler.compile_word_body([WR("doLIT"), 1, WR("DUP"), WR("DROP"), WR("BYE")])
+    interpreter.memory = compiler.memory
+    interpreter.start()
+
+    doLIT, DUP, DROP, BYE = (compiler.lookup_word(WR(name)) for name in ["doLIT", "DUP", "DROP", "BYE"])
+    assert interpreter.execution_statistics.sequences_calls == {
+        (doLIT, DUP): 1,
+        (DUP, DROP): 1,
+        (doLIT, DUP, DROP): 1,
+        (DROP, BYE): 1,
+        (DUP, DROP, BYE): 1,
+    }
+
+def test_CachedStacksInterpreter_read_stack_in_memory():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_running(CachedStacksInterpreter, compiler,
+        [WR("doLIT"), 1, WR("doLIT"), 2, WR("SP@"), WR("CELL+"), WR("@"), WR("BYE")])
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(3) == [1, 2, 1]
+    assert interpreter.data_stack_pointer == eforth16bits.SPP - 3*compiler.cell_size
+    assert interpreter.read_cell_at_address(interpreter.data_stack_pointer) == 1
+
+def test_CachedStacksInterpreter_write_stack_in_memory():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_running(CachedStacksInterpreter, compiler,
+        [WR("doLIT"), 1, WR("doLIT"), 2, WR("doLIT"), 7,
+         WR("SP@"), WR("CELL+"), WR("!"), WR("BYE")])
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(2) == [1, 7]
+    assert interpreter.top_of_data_stack() == 7
+    assert interpreter.read_cell_at_address(interpreter.data_stack_pointer) == 7
+
+def test_CachedStacksInterpreter_move_stack_pointers():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_running(CachedStacksInterpreter, compiler,
+        [WR("doLIT"), 1, WR("doLIT"), 2, WR("SP@"), WR("doLIT"), 3,
+         WR("SWAP"), WR("SP!"), WR("doLIT"), -1, WR("BYE")])
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(3) == [1, 2, 0xFFFF]
+
+@pytest.mark.parametrize("interpreter_class", [OptimizedInterpreter, CachedStacksInterpreter, TracingInterpreter])
+@pytest.mark.parametrize("source, expected_output", [
+    pytest.param(": t 44 55 SP0 @ CELL- @ SP0 @ CELL- CELL- @ ; t . . . .", " 55 44 55 44", id="@"),
+    pytest.param(": t 44 55 SP0 @ CELL- C@ ; t . . .", " 44 55 44", id="C@"),
+    pytest.param(": t 44 55 66 SP0 @ CELL- ! ; t . .", " 55 66", id="!"),
+    pytest.param(": t 44 55 66 SP0 @ CELL- C! ; t . .", " 55 66", id="C!"),
+])
+def test_memory_access_in_data_stack(interpreter_class, source, expected_output):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = interpreter_class(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(source + " BYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith(expected_output)
+
+def test_TracingInterpreter_FOR_NEXT_loop():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_running(TracingInterpreter, compiler,
+        [WR("doLIT"), 0, WR("doLIT"), 99, WR(">R"),
+         L("LOOP"), WR("doLIT"), 1, WR("+"), WR("next"), LR("LOOP"),
+         WR("BYE")],
+        hot_loop_threshold=2)
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(1) == [100]
+    assert interpreter.trace_statistics.compiles == 1
+    assert interpreter.trace_statistics.hits == 1
+    assert interpreter.trace_statistics.bailouts == 1
+
+def test_TracingInterpreter_BEGIN_WHILE_REPEAT_loop_with_call():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    interpreter = interpreter_running(TracingInterpreter, compiler,
+        [WR("doLIT"), 10,
+         L("LOOP"), WR("doLIT"), 1, WR("-"), WR("DUP"), WR("?branch"), LR("END"),
+         WR("branch"), LR("LOOP"),
+         L("END"), WR("BYE")],
+        hot_loop_threshold=2)
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(1) == [0]
+    assert interpreter.trace_statistics.compiles == 1
+    assert len(interpreter.traces) == 1
+
+def test_TracingInterpreter_traces_invalidated_on_code_space_write():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    body_address = compiler.code_address
+    interpreter = interpreter_running(TracingInterpreter, compiler,
+        [WR("doLIT"), 0, WR("doLIT"), 9, WR(">R"),
+         L("LOOP"), WR("doLIT"), 1, WR("+"), WR("next"), LR("LOOP"),
+         WR("BYE")],
+        hot_loop_threshold=2)
+    interpreter.start()
+    assert len(interpreter.traces) == 1
+
+    interpreter.write_cell_at_address(body_address + 6*compiler.cell_size, 2)
+    assert interpreter.traces == {}
+
+    interpreter.interpreter_pointer = body_address
+    interpreter.start()
+    assert interpreter.tops_of_data_stack(2) == [10, 20]
+
+def test_image_sections_of_bootstrapped_image():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+
+    sections = dict((name, (start, end)) for name, start, end in eforth16bits.image_sections(compiler))
+
+    assert sections["code"] == (eforth16bits.CODEE, compiler.code_address)
+    assert sections["names"] == (compiler.name_address, eforth16bits.NAMEE)
+
+def test_SNAPSHOT_saves_image_file(tmp_path):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    image_path = str(tmp_path / "snapshot.image").encode("ascii")
+    # The bootstrap image has no s", write the path in the heap instead.
+    for offset, byte in enumerate(image_path):
+        compiler.memory[eforth16bits.EM+offset] = byte
+    interpreter = ForthInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(f"1 2 {eforth16bits.EM} {len(image_path)} 0 SNAPSHOT\nBYE\n"),
+        compiler_metadata=compiler.compiler_metadata,
+        image_format=eforth16bits.IMAGE_FORMAT
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    image = ImageFile.from_file(image_path.decode("ascii"))
+    assert image.registers["sp"] == eforth16bits.SPP - 2*compiler.cell_size
+    assert image.compiler_metadata.word_address_belongs_to(compiler.lookup_word(WR("DUP"))).name == "DUP"
+
+    output_stream = io.StringIO()
+    interpreter = ForthInterpreter(
+        image.cell_size,
+        primitives_store(),
+        input_stream=io.StringIO(". . BYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = image.memory
+    interpreter.interpreter_pointer = image.registers["ip"]
+    interpreter.data_stack_pointer = image.registers["sp"]
+    interpreter.return_stack_pointer = image.registers["rp"]
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith(" 2 1")
+    assert compiler.memory[eforth16bits.COLDD+2*compiler.cell_size] == 0
+
+def test_build_layered_image_rebuilds_changed_layers_only(tmp_path, monkeypatch):
+    cache = ImageCache(eforth16bits.BOOTSTRAP_CACHE.modules, directory=tmp_path)
+    built_layers = []
+    compile_layer = eforth16bits.compile_layer
+    def counting_compile_layer(interpreter_class, image, source, *args):
+        built_layers.append(source)
+        return compile_layer(interpreter_class, image, source, *args)
+    monkeypatch.setattr(eforth16bits, "compile_layer", counting_compile_layer)
+
+    def quad_of_3(sources):
+        image = eforth16bits.build_layered_image(sources, cache=cache, output_stream=io.StringIO())
+        output_stream = io.StringIO()
+        interpreter = OptimizedInterpreter(
+            image.cell_size,
+            primitives_store(),
+            data_stack_pointer=eforth16bits.SPP,
+            return_stack_pointer=eforth16bits.RPP,
+            input_stream=io.StringIO("3 quad . BYE\n"),
+            output_stream=output_stream
+        )
+        interpreter.memory = image.memory
+        eforth16bits.restore_registers(interpreter, image.registers)
+        interpreter.start()
+        return output_stream.getvalue()
+
+    assert quad_of_3([": double 2 * ;", ": quad double double ;"]).endswith(" 12")
+    assert built_layers == [": double 2 * ;", ": quad double double ;"]
+
+    built_layers.clear()
+    assert quad_of_3([": double 2 * ;", ": quad double double 1 + ;"]).endswith(" 13")
+    assert built_layers == [": quad double double 1 + ;"]
+
+    built_layers.clear()
+    assert quad_of_3([": double 2 * ;", ": quad double double ;"]).endswith(" 12")
+    assert built_layers == []
+
+AHEAD_OF_TIME_SOURCE = """\\ Compiled ahead of time
+: sign ( n -- n ) DUP 0< IF DROP -1 ELSE 0 = IF 0 ELSE 1 THEN THEN ;
+: count-down ( n -- ) BEGIN DUP . 1 - DUP 0 = UNTIL DROP ;
+: sum ( n -- n ) 0 SWAP FOR AFT R@ + THEN NEXT ;
+: halve ( n -- n ) BEGIN 10 OVER < WHILE 2 / REPEAT ;
+: greet ." hello world" $" bye" COUNT TYPE ;
+: constants $FF -3 ;
+VARIABLE counter CREATE table
+: IMMEDIATE 128 LAST @ @ OR LAST @ ! ;
+: flag ; IMMEDIATE
+\\ Interpreted by the VM
+: ten [ 5 5 + ] LITERAL ;
+7 counter !
+: eleven ten 1 + ;
+"""
+
+def test_compile_layer_compiles_like_the_vm():
+    def build(ahead_of_time):
+        return eforth16bits.build_layered_image(
+            [AHEAD_OF_TIME_SOURCE],
+            cache=None,
+            output_stream=io.StringIO(),
+            ahead_of_time=ahead_of_time
+        )
+    compiled = build(True)
+    interpreted = build(False)
+
+    assert compiled.sections == interpreted.sections
+    for name, start, end in compiled.sections:
+        if name in ("code", "names"):
+            assert compiled.memory[start:end] == interpreted.memory[start:end]
+
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiled.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO("-5 sign . 3 count-down 4 sum . 50 halve . greet constants . . eleven . counter ? BYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiled.memory
+    eforth16bits.restore_registers(interpreter, compiled.registers)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith(" -1 3 2 1 6 6hello worldbye -3 255 11 7 ok\r\n BYE")
+
+def test_compile_layer_interprets_what_it_can_not_compile(monkeypatch):
+    interpreted = []
+    run_layer = eforth16bits.run_layer
+    def recording_run_layer(interpreter_class, image, source, output_stream=None):
+        interpreted.append(source)
+        return run_layer(interpreter_class, image, source, output_stream)
+    monkeypatch.setattr(eforth16bits, "run_layer", recording_run_layer)
+
+    eforth16bits.build_layered_image([AHEAD_OF_TIME_SOURCE], cache=None, output_stream=io.StringIO())
+
+    assert interpreted == [": ten [ 5 5 + ] LITERAL ;\n7 counter !"]
+
+def test_link_modules_relocates_them():
+    base = eforth16bits.image_file(eforth16bits.bootstrap_16bits_eforth())
+    def compile_module(source):
+        return eforth16bits.compile_module(OptimizedInterpreter, base, source, output_stream=io.StringIO())
+    counter = compile_module(
+        ": double 2 * ;\nVARIABLE counter 5 counter !\n"
+        ": clip DUP 10 < IF EXIT THEN DROP 10 ;\n: ten [ 5 5 + ] LITERAL ;\n"
+    )
+    hexadecimal = compile_module(": triple 3 * ; 16 BASE !")
+
+    image = eforth16bits.link_modules(base, [hexadecimal, counter])
+
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        image.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO("3 double . 3 triple . counter ? 20 clip . 5 clip . ten . BYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = image.memory
+    eforth16bits.restore_registers(interpreter, image.registers)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith(" 6 9 5 A 5 A")
+    # ten is compiled by the VM, the compiler knows the words before it.
+    assert image.compiler_metadata.last().name == "clip"
+
+def test_link_modules_checks_the_base_image():
+    base = eforth16bits.image_file(eforth16bits.bootstrap_16bits_eforth())
+    double = eforth16bits.compile_module(OptimizedInterpreter, base, ": double 2 * ;", output_stream=io.StringIO())
+    quad = eforth16bits.compile_module(
+        OptimizedInterpreter,
+        eforth16bits.link_modules(base, [double]),
+        ": quad double double ;",
+        output_stream=io.StringIO()
+    )
+
+    with pytest.raises(IncompatibleModule):
+        eforth16bits.link_modules(base, [quad])
+    eforth16bits.link_modules(base, [double, quad])
+
+@pytest.mark.parametrize("interpreter_class", [OptimizedInterpreter, ClosureInterpreter, CachedStacksInterpreter])
+def test_find_through_dictionary_index(interpreter_class):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = interpreter_class(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            ": foo 1 ; : bar foo ; : foo 2 ; foo . bar .\n"
+            "' bar >NAME COUNT TYPE ' bar CELL+ >NAME .\n"
+            # Rename the latest foo in place, the index sees the write.
+            "CHAR g ' foo >NAME 1 + C! goo . foo .\n"
+            "BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    output = output_stream.getvalue()
+    assert "foo . bar . reDef foo 2 1 ok" in output
+    assert ">NAME .bar 0 ok" in output
+    assert output.endswith("goo . foo . 2 1 ok\r\nBYE")
+
+def test_bootstrap_benchmark(monkeypatch, record_property):
+    walks = []
+    name_tokens_iterator = eforth16bits.Compiler.name_tokens_iterator
+    def counting_name_tokens_iterator(compiler):
+        walks.append(compiler.name_address)
+        return name_tokens_iterator(compiler)
+    monkeypatch.setattr(eforth16bits.Compiler, "name_tokens_iterator", counting_name_tokens_iterator)
+
+    start = time.perf_counter()
+    compiler = eforth16bits.bootstrap_16bits_eforth(cache=None)
+    duration = time.perf_counter() - start
+    record_property("bootstrap_seconds", duration)
+
+    # The name dictionary is walked once, the names are then resolved
+    # through the index the compiler updates.
+    assert len(walks) == 1
+
+def test_name_token_after_the_vm_changed_the_dictionary():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    dup = compiler.name_token(WR("DUP"))
+    image = eforth16bits.run_layer(OptimizedInterpreter, eforth16bits.image_file(compiler), ": DUP OVER ;", io.StringIO())
+    compiler = eforth16bits.compiler_of_image_file(image)
+
+    assert compiler.name_token(WR("DUP")) != dup
+    compiler.compile_colon("twice", [WR("DUP"), WR("+"), WR("EXIT")])
+    assert compiler.name_token(WR("twice")) == compiler.name_address
+    assert compiler.name_token(WR("DUP")) != dup
+    with pytest.raises(WordNotInDictionary):
+        compiler.name_token(WR("thrice"))
+
+@pytest.mark.parametrize("tap", ["", ": myTAP kTAP ; ' myTAP 'TAP !\n"])
+def test_accept_reads_lines(tap):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(tap + "1 2\b 3\x01+ .\n' DROP 'ECHO !\n\b5 .\nBYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith("1 2\b \b 3 + . 4 ok\r\n' DROP 'ECHO ! ok\r\n 5 ok\r\n")
+
+class CharacterCountingStream(io.StringIO):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.characters_read = 0
+
+    def read(self, size=-1):
+        self.characters_read += 1
+        return super().read(size)
+
+def test_accept_reads_lines_with_the_echo_of_HAND():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    input_stream = CharacterCountingStream("HAND\n1 2 + .\n' EMIT 'ECHO @ = .\nBYE\n")
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=input_stream,
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    assert output_stream.getvalue().endswith("HAND ok\r\n1 2 + . 3 ok\r\n' EMIT 'ECHO @ = . -1 ok\r\nBYE")
+    assert input_stream.characters_read == 0
+
+def test_included_interprets_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "square.f").write_text(": square DUP * ;\n\\ a comment\n3 square .\n: inner $\" inner.f\" COUNT INCLUDED ; inner\n")
+    (tmp_path / "inner.f").write_text("\t2 square . SOURCE-ID .\r\n")
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            ": include $\" square.f\" COUNT INCLUDED ; include 4 square . SOURCE-ID .\n"
+            ": missing $\" missing.f\" COUNT INCLUDED ; missing\n"
+            "BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    output = output_stream.getvalue()
+    assert "include 4 square . SOURCE-ID . 9 4 2 16 0 ok" in output
+    assert "missing  cannot open ?" in output
+    assert interpreter.file_table.files == {}
+
+def test_file_access_words(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            "VARIABLE fid CREATE buffer 20 ALLOT\n"
+            ": name $\" data.txt\" COUNT ; : text $\" hello\" COUNT ;\n"
+            "name W/O CREATE-FILE . fid ! text fid @ WRITE-FILE . fid @ CLOSE-FILE .\n"
+            "name R/O OPEN-FILE . fid !\n"
+            "buffer 3 fid @ READ-LINE . . . buffer 20 fid @ READ-LINE . . . buffer 3 TYPE\n"
+            "buffer 20 fid @ READ-FILE . . fid @ CLOSE-FILE . fid @ CLOSE-FILE .\n"
+            "BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    output = output_stream.getvalue()
+    assert (tmp_path / "data.txt").read_bytes() == b"hello"
+    assert "CLOSE-FILE . 0 0 0 ok" in output
+    assert "READ-LINE . . . buffer 3 TYPE 0 -1 3 0 -1 2lol ok" in output
+    assert "CLOSE-FILE . 0 0 0 -37 ok" in output
+
+def test_block_words(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "blocks.fb").write_bytes(b" "*1024 + b": five 5 ; five . 7 BLK @ .".ljust(1024))
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            "1 BLOCK\n"
+            "$4000 2 BLOCK-BUFFERS 2! 1 LOAD five . BLK @ .\n"
+            ": text $\" hello\" COUNT ; text 3 BUFFER SWAP CMOVE UPDATE\n"
+            "4 BLOCK DROP 5 BLOCK 2 TYPE 3 BLOCK 5 TYPE\n"
+            "text 6 BLOCK SWAP CMOVE UPDATE EMPTY-BUFFERS 6 BLOCK 5 TYPE\n"
+            "text 7 BUFFER SWAP CMOVE UPDATE FLUSH\n"
+            "BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    output = output_stream.getvalue()
+    assert "1 BLOCK  no block ?" in output
+    assert "BLK @ . 5 1 5 0 ok" in output
+    assert "5 BLOCK 2 TYPE 3 BLOCK 5 TYPE  hello ok" in output
+    assert "6 BLOCK 5 TYPE      ok" in output
+    blocks = (tmp_path / "blocks.fb").read_bytes()
+    assert len(blocks) == 8*1024
+    assert blocks[3*1024:3*1024+5] == b"hello"
+    assert blocks[6*1024:6*1024+5] == b"     "
+    assert blocks[7*1024:7*1024+5] == b"hello"
+    assert interpreter.block_storage.buffers == {}
+
+def run_block_words(tmp_path, source):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(source + "BYE\n"),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+    return output_stream.getvalue()
+
+def test_nested_LOAD_reads_its_block_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "blocks.fb").write_bytes(
+        b" "*1024 + b"2 LOAD 111 . 222 .".ljust(1024) + b"333 .".ljust(1024)
+    )
+
+    output = run_block_words(tmp_path, "$4000 1 BLOCK-BUFFERS 2! 1 LOAD 444 .\n")
+
+    assert "1 LOAD 444 . 333 111 222 444 ok" in output
+
+def test_updated_blocks_are_saved_before_the_buffers_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    run_block_words(tmp_path,
+        "$4000 2 BLOCK-BUFFERS 2! 65 1 BLOCK C! UPDATE\n"
+        "$5000 1 BLOCK-BUFFERS 2! 66 2 BLOCK C! UPDATE\n"
+        ": other $\" other.fb\" COUNT ; other OPEN-BLOCKS DROP 67 3 BLOCK C! UPDATE FLUSH\n"
+    )
+
+    blocks = (tmp_path / "blocks.fb").read_bytes()
+    assert blocks[1024:1025] == b"A"
+    assert blocks[2*1024:2*1024+1] == b"B"
+    assert (tmp_path / "other.fb").read_bytes()[3*1024:3*1024+1] == b"C"
+
+def test_memory_allocation_words():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    output_stream = io.StringIO()
+    interpreter = OptimizedInterpreter(
+        compiler.cell_size,
+        primitives_store(),
+        data_stack_pointer=eforth16bits.SPP,
+        return_stack_pointer=eforth16bits.RPP,
+        input_stream=io.StringIO(
+            "10 ALLOCATE . .\n"
+            "$4001 $1000 INIT-HEAP VARIABLE a VARIABLE b\n"
+            "10 ALLOCATE . a ! 20 ALLOCATE . b ! 30 ALLOCATE . DROP\n"
+            "a @ FREE . a @ FREE . HEAP-LIVE . HEAP-PEAK . HEAP-FRAGMENTATION .\n"
+            "b @ 22 RESIZE . b @ = . b @ 100 RESIZE . b @ = .\n"
+            "$7FFF ALLOCATE . DROP HEAP-LIVE .\n"
+            "$4000 10 INIT-HEAP\n"
+            "BYE\n"
+        ),
+        output_stream=output_stream
+    )
+    interpreter.memory = compiler.memory
+    interpreter.interpreter_pointer = interpreter.read_cell_at_address(eforth16bits.COLDD)
+    interpreter.start()
+
+    output = output_stream.getvalue()
+    assert "10 ALLOCATE . . -59 0 ok" in output
+    assert "30 ALLOCATE . DROP 0 0 0 ok" in output
+    assert "HEAP-FRAGMENTATION . 0 -60 56 68 1 ok" in output
+    assert "b @ = . 0 -1 0 0 ok" in output
+    assert "$7FFF ALLOCATE . DROP HEAP-LIVE . -59 136 ok" in output
+    assert "INIT-HEAP  heap too small ?" in output
+
+def test_heap_keeps_allocations_apart():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    heap = Heap.format(compiler, eforth16bits.EM+1, 0x1000)
+    size = heap.end - heap.first_block
+    allocations = dict()
+    generator = random.Random(1)
+    for step in range(2000):
+        if generator.random() < 0.5 or not allocations:
+            length = generator.choice([1, 3, 8, 20, 60, 200])
+            address = heap.allocate(length)
+            if address:
+                allocations[address] = (length, step % 256)
+        elif generator.random() < 0.6:
+            address = generator.choice(list(allocations))
+            assert heap.free(address)
+            del allocations[address]
+        else:
+            address = generator.choice(list(allocations))
+            length, value = allocations.pop(address)
+            new_length = generator.choice([1, 10, 100])
+            new_address = heap.resize(address, new_length)
+            if new_address == 0:
+                allocations[address] = (length, value)
+                continue
+            kept = min(length, new_length)
+            assert bytes(compiler.memory[new_address:new_address+kept]) == bytes([value])*kept
+            address, length = new_address, new_length
+            allocations[address] = (length, value)
+        for address, (length, value) in allocations.items():
+            compiler.memory.write_bytes(address, bytes([value])*length)
+        for address, (length, value) in allocations.items():
+            assert bytes(compiler.memory[address:address+length]) == bytes([value])*length
+
+    for address in allocations:
+        assert heap.free(address)
+    assert heap.statistics()[0] == 0
+    assert heap.allocate(size-compiler.cell_size) != 0
+
+def copied_byte_by_byte(data, source, destination, size, lowest_first):
+    data = bytearray(data)
+    indexes = range(size) if lowest_first else reversed(range(size))
+    for index in indexes:
+        data[destination+index] = data[source+index]
+    return bytes(data)
+
+@pytest.mark.parametrize("word, source, destination, size", [
+    ("CMOVE", 0, 10, 5),
+    ("CMOVE", 0, 3, 10),
+    ("CMOVE", 5, 2, 10),
+    ("CMOVE", 4, 4, 0),
+    ("CMOVE>", 0, 3, 10),
+    ("CMOVE>", 5, 2, 10),
+    ("CMOVE>", 2, 12, 4),
+    ("MOVE", 0, 3, 10),
+    ("MOVE", 5, 2, 10),
+])
+def test_bulk_copies(word, source, destination, size):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    data = bytes(range(1, 21))
+    compiler.memory.write_bytes(eforth16bits.EM, data)
+    interpreter = interpreter_running(OptimizedInterpreter, compiler,
+        [WR("doLIT"), eforth16bits.EM+source, WR("doLIT"), eforth16bits.EM+destination,
+         WR("doLIT"), size, WR(word), WR("BYE")])
+
+    interpreter.start()
+
+    if word == "MOVE":
+        expected = bytearray(data)
+        expected[destination:destination+size] = data[source:source+size]
+    else:
+        expected = copied_byte_by_byte(data, source, destination, size, word == "CMOVE")
+    assert bytes(interpreter.memory[eforth16bits.EM:eforth16bits.EM+20]) == bytes(expected)
+    assert interpreter.data_stack_pointer == eforth16bits.SPP
+
+def test_FILL_and_ERASE():
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    compiler.memory.write_bytes(eforth16bits.EM, bytes(range(1, 11)))
+    interpreter = interpreter_running(OptimizedInterpreter, compiler,
+        [WR("doLIT"), eforth16bits.EM+1, WR("doLIT"), 4, WR("doLIT"), 0x141, WR("FILL"),
+         WR("doLIT"), eforth16bits.EM+6, WR("doLIT"), 3, WR("ERASE"),
+         WR("BYE")])
+
+    interpreter.start()
+
+    assert bytes(interpreter.memory[eforth16bits.EM:eforth16bits.EM+10]) == b"\x01AAAA\x06\0\0\0\x0a"
+
+# Addresses of the string "hello world \t\0 " written at EM.
+S = [eforth16bits.EM+offset for offset in range(17)]
+
+@pytest.mark.parametrize("arguments, word, expected_data_stack", [
+    pytest.param([S[0], 5, S[0], 5], "COMPARE", [0], id="COMPARE same"),
+    pytest.param([S[0], 5, S[0], 4], "COMPARE", [1], id="COMPARE longer"),
+    pytest.param([S[0], 4, S[0], 5], "COMPARE", [0xFFFF], id="COMPARE shorter"),
+    pytest.param([S[0], 5, S[6], 5], "COMPARE", [0xFFFF], id="COMPARE before"),
+    pytest.param([S[6], 5, S[0], 5], "COMPARE", [1], id="COMPARE after"),
+    pytest.param([S[0], 11, S[6], 2], "SEARCH", [S[6], 5, 0xFFFF], id="SEARCH found"),
+    pytest.param([S[0], 11, S[6], 0], "SEARCH", [S[0], 11, 0xFFFF], id="SEARCH empty"),
+    pytest.param([S[0], 7, S[6], 2], "SEARCH", [S[0], 7, 0], id="SEARCH not found"),
+    pytest.param([S[0], 11, ord("o")], "SCAN", [S[4], 7], id="SCAN found"),
+    pytest.param([S[0], 4, ord("o")], "SCAN", [S[4], 0], id="SCAN not found"),
+    pytest.param([S[2], 9, ord("l")], "SKIP", [S[4], 7], id="SKIP"),
+    pytest.param([S[2], 2, ord("l")], "SKIP", [S[4], 0], id="SKIP all"),
+    pytest.param([S[0], 16], "-TRAILING", [S[0], 11], id="-TRAILING"),
+    pytest.param([S[11], 5], "-TRAILING", [S[11], 0], id="-TRAILING blanks"),
+    pytest.param([S[0], S[6], 2], "SAME?", [S[0], S[6], 0xFFFF], id="SAME? before"),
+    pytest.param([S[0], S[0], 2], "SAME?", [S[0], S[0], 0], id="SAME? same"),
+])
+def test_string_words(arguments, word, expected_data_stack):
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    compiler.memory.write_bytes(eforth16bits.EM, b"hello world \t\0 ")
+    tokens = []
+    for argument in arguments:
+        tokens.extend([WR("doLIT"), argument])
+    interpreter = interpreter_running(OptimizedInterpreter, compiler, tokens + [WR(word), WR("BYE")])
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(len(expected_data_stack)) == expected_data_stack
+
+def run_numeric_words(compiler, packed_string, source):
+    """Returns the data stack, the output and the held digits after running
+    source in decimal, with packed_string at EM.
+    """
+    compiler.memory.write_bytes(eforth16bits.EM, bytes([len(packed_string)]) + packed_string + b"-")
+    tokens = [WR("doLIT"), WR("TX!"), WR("'EMIT"), WR("!")]
+    for token in ("10 BASE ! " + source + " HLD @ PAD").split():
+        if token.lstrip("-").isdigit():
+            tokens.extend([WR("doLIT"), int(token)])
+        else:
+            tokens.append(WR(token))
+    output_stream = io.StringIO()
+    interpreter = interpreter_running(OptimizedInterpreter, compiler, tokens + [WR("BYE")],
+        output_stream=output_stream)
+    interpreter.start()
+    data_stack = interpreter.tops_of_data_stack((eforth16bits.SPP - interpreter.data_stack_pointer) // 2)
+    hld, pad = data_stack[-2:]
+    return data_stack, output_stream.getvalue(), bytes(interpreter.memory[hld:pad])
+
+@pytest.mark.parametrize("packed_string, source", [
+    (b"1234", "16384 NUMBER?"),
+    (b"-1234", "16384 NUMBER?"),
+    (b"$7fFF", "16384 NUMBER?"),
+    (b"$-1A", "16384 NUMBER?"),
+    (b"$-1a", "16384 NUMBER?"),
+    (b"70000", "16384 NUMBER?"),
+    (b"12x", "16384 NUMBER?"),
+    (b"zZ", "36 BASE ! 16384 NUMBER? BASE @"),
+    (b"-", "16384 NUMBER?"),
+    (b"$", "16384 NUMBER?"),
+    (b"", "16384 NUMBER?"),
+    (b"0", "16384 NUMBER?"),
+    (b"", "47 10 DIGIT? 58 10 DIGIT? 65 16 DIGIT? 71 16 DIGIT? 97 36 DIGIT?"),
+    (b"", "0 str"),
+    (b"", "-32768 str"),
+    (b"", "12345 . -12345 . 2 BASE ! -1 U. -5 ."),
+    (b"", "-42 8 .R 42 1 .R 16 BASE ! -16657 12 U.R"),
+    (b"", "<# 10 # # 46 HOLD #S #> TYPE"),
+])
+def test_numeric_conversion_like_the_book(packed_string, source):
+    native = run_numeric_words(eforth16bits.bootstrap_16bits_eforth(), packed_string, source)
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    image_compiler = ImageCompiler(compiler)
+    image_compiler.visit_WordsSet(by_the_book.by_the_book_numeric_output_single_precision_words())
+    image_compiler.visit_WordsSet(by_the_book.by_the_book_numeric_input_single_precision_words())
+    image_compiler.visit_WordsSet(by_the_book.by_the_book_basic_io_words())
+    assert compiler.lookup_word(WR("NUMBER?")) != eforth16bits.bootstrap_16bits_eforth().lookup_word(WR("NUMBER?"))
+
+    assert native == run_numeric_words(compiler, packed_string, source)
+
+def run_parsing_words(compiler, text, source):
+    """Returns the data stack and the memory from EM on after running source
+    with text in the input buffer at EM, HERE at EM+0x1000 and NP at
+    EM+0x2000.
+    """
+    compiler.memory.write_bytes(eforth16bits.EM, text)
+    tokens = []
+    setup = f"{len(text)} #TIB ! {eforth16bits.EM} #TIB CELL+ ! 0 >IN ! " \
+        f"{eforth16bits.EM+0x1000} CP ! {eforth16bits.EM+0x2000} NP ! "
+    for token in (setup + source + " >IN @").split():
+        if token.isdigit():
+            tokens.extend([WR("doLIT"), int(token)])
+        else:
+            tokens.append(WR(token))
+    interpreter = interpreter_running(OptimizedInterpreter, compiler, tokens + [WR("BYE")])
+    interpreter.start()
+    data_stack = interpreter.tops_of_data_stack((eforth16bits.SPP - interpreter.data_stack_pointer) // 2)
+    return data_stack, bytes(interpreter.memory[eforth16bits.EM:])
+
+@pytest.mark.parametrize("text, source", [
+    (b"  hello world", "TOKEN TOKEN TOKEN"),
+    (b"\t\0hello\x01world  ", "TOKEN COUNT TOKEN COUNT"),
+    (b"    ", "TOKEN"),
+    (b"", "TOKEN"),
+    (b"a-very-long-name-of-more-than-31-characters rest", "TOKEN TOKEN"),
+    (b"dup) and more", "41 WORD 41 WORD 41 WORD"),
+    (b")x", "41 PARSE 41 PARSE"),
+    (b"\xfftext more", "32 PARSE 32 PARSE 300 PARSE"),
+    (b"abc def", "16384 7 32 parse 16386 5 99 parse 16384 0 32 parse"),
+    (b"abcdefgh", "16385 3 16400 PACK$ 16384 8 16401 PACK$"),
+])
+def test_parsing_like_the_book(text, source):
+    native = run_parsing_words(eforth16bits.bootstrap_16bits_eforth(), text, source)
+    compiler = eforth16bits.bootstrap_16bits_eforth()
+    image_compiler = ImageCompiler(compiler)
+    image_compiler.visit_WordsSet(by_the_book.by_the_book_memory_access_words(compiler.cell_size))
+    image_compiler.visit_WordsSet(by_the_book.by_the_book_parsing_words())
+
+    assert native == run_parsing_words(compiler, text, source)
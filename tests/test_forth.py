@@ -1,7 +1,10 @@
 import pytest
 import io
+import os
+import select
 
 from forthpie.forth import *
+from forthpie.primitives import primitive, debug, PrimitiveStore, HALT
 from forthpie.eforth.primitives.by_the_book import primitives_store
 
 @pytest.fixture
@@ -73,7 +76,7 @@ def test_imrx_no_input(interpreter):
 
     interpreter.start()
 
-    assert interpreter.memory[50:54] == [0,0,0,0]
+    assert interpreter.memory[50:54] == bytes([0,0,0,0])
     assert interpreter.word_pointer == 94
     assert interpreter.interpreter_pointer == 78
     assert interpreter.data_stack_pointer == 46
@@ -109,8 +112,8 @@ def test_imrx_input(interpreter):
 
     interpreter.start()
     
-    assert interpreter.memory[46:50] == [97,0,0,0]
-    assert interpreter.memory[42:46] == [0xFF,0xFF,0xFF,0xFF]
+    assert interpreter.memory[46:50] == bytes([97,0,0,0])
+    assert interpreter.memory[42:46] == bytes([0xFF,0xFF,0xFF,0xFF])
     assert interpreter.word_pointer == 94
     assert interpreter.interpreter_pointer == 78
     assert interpreter.data_stack_pointer == 42
@@ -212,3 +215,284 @@ def test_doLIT(interpreter):
     assert interpreter.interpreter_pointer == 62
     assert interpreter.data_stack_pointer == 66
     assert interpreter.read_cell_at_address(66) == 0x01020304
+
+def test_memory_write_barrier():
+    memory = Memory(10)
+    written = []
+    memory.watch(3, written.append)
+
+    memory[2] = 1
+    memory[3] = 1
+    memory[3] = 2
+
+    assert written == [3]
+
+def test_memory_write_barriers_on_same_address():
+    memory = Memory(10)
+    written = []
+    other_written = []
+    memory.watch(3, written.append)
+    memory.watch(3, other_written.append)
+    memory.watch(3, written.append)
+
+    memory[3] = 1
+    memory[3] = 2
+
+    assert written == [3]
+    assert other_written == [3]
+
+def test_memory_unwatch_all():
+    memory = Memory(10)
+    written = []
+    memory.watch(3, written.append)
+    memory.watch(4, written.append)
+
+    memory.unwatch_all(written.append)
+    memory[3] = 1
+    memory[4] = 1
+
+    assert written == []
+
+def test_memory_write_cell_triggers_write_barriers():
+    memory = Memory(10)
+    written = []
+    memory.watch(3, written.append)
+    memory.watch(5, written.append)
+
+    memory.write_cell(2, 2, 0x10203)
+
+    assert memory[2:4] == bytes([3, 2])
+    assert memory.read_cell(2, 2) == 0x0203
+    assert written == [3]
+
+def test_memory_cells_out_of_memory():
+    memory = Memory(10)
+
+    with pytest.raises(IndexError):
+        memory.read_cell(9, 2)
+    with pytest.raises(IndexError):
+        memory.write_cell(9, 4, 1)
+
+def test_checked_memory_rejects_values_not_bytes():
+    memory = CheckedMemory(10)
+
+    with pytest.raises(NotAByte):
+        memory[3] = 256
+    with pytest.raises(ValueError):
+        Memory(10)[3] = 256
+
+def test_memory_save_and_from_file(tmp_path):
+    memory = Memory(10)
+    memory.write_cell(4, 4, 0x01020304)
+    memory.save(tmp_path / "image")
+
+    loaded = CheckedMemory.from_file(tmp_path / "image")
+
+    assert isinstance(loaded, CheckedMemory)
+    assert len(loaded) == 10
+    assert loaded.read_cell(4, 4) == 0x01020304
+
+def test_memory_map_file(tmp_path):
+    memory = Memory(10)
+    memory.write_cell(4, 4, 0x01020304)
+    memory.save(tmp_path / "image")
+
+    mapped = Memory.map_file(tmp_path / "image")
+    mapped[4] = 5
+    mapped.write_cell(0, 2, 0x0102)
+
+    assert len(mapped) == 10
+    assert mapped.read_cell(4, 4) == 0x01020305
+    assert mapped.read_cell(0, 2) == 0x0102
+    assert Memory.from_file(tmp_path / "image").read_cell(4, 4) == 0x01020304
+
+@primitive(0, "BYE")
+def legacy_bye(vm):
+    pass
+
+@primitive(1, "ONE")
+def legacy_one(vm):
+    vm.push_on_data_stack(1)
+    vm.next()
+
+@primitive(2, "TWO", returns_next_ip=True)
+def two(vm):
+    vm.push_on_data_stack(2)
+    return vm.interpreter_pointer
+
+def mixed_conventions_program(interpreter_class):
+    interpreter = interpreter_class(
+        4,
+        PrimitiveStore(legacy_bye, legacy_one, debug(0, 1)(two)),
+        data_stack_pointer=120,
+        memory_size=120
+    )
+    interpreter.interpreter_pointer = 50
+    # Threaded code: ONE TWO BYE
+    for address, execution_token in [(50, 90), (54, 94), (58, 98)]:
+        interpreter.write_cell_at_address(address, execution_token)
+    # Code fields of ONE, TWO and BYE
+    for address, code in [(90, 1), (94, 2), (98, 0)]:
+        interpreter.write_cell_at_address(address, code)
+    return interpreter
+
+@pytest.mark.parametrize("interpreter_class", [ForthInterpreter, OptimizedInterpreter, ReturnDispatchInterpreter])
+def test_primitives_calling_conventions(interpreter_class):
+    interpreter = mixed_conventions_program(interpreter_class)
+
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(2) == [1, 2]
+    assert interpreter.interpreter_pointer == 62
+
+def test_code_field_cache_sees_patched_code_fields():
+    interpreter = mixed_conventions_program(ReturnDispatchInterpreter)
+    interpreter.start()
+    assert sorted(interpreter.code_fields) == [90, 94, 98]
+
+    # Patch the code field of ONE to run TWO.
+    interpreter.write_cell_at_address(90, 2)
+    interpreter.interpreter_pointer = 50
+    interpreter.start()
+
+    assert interpreter.tops_of_data_stack(2) == [2, 2]
+
+def test_primitive_dispatch():
+    interpreter = mixed_conventions_program(ForthInterpreter)
+    interpreter.interpreter_pointer = 54
+
+    assert legacy_one.dispatch(interpreter) == 54
+    assert two.dispatch(interpreter) == 54
+    assert legacy_bye.dispatch(interpreter) is HALT
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+def test_output_channel_buffers_until_flushed():
+    stream = CountingStream()
+    channel = OutputChannel(stream, buffer_size=8)
+
+    for byte in b"hello":
+        channel.write(byte)
+    assert stream.getvalue() == ""
+    for byte in b" world":
+        channel.write(byte)
+    assert stream.getvalue() == "hello wo"
+    channel.flush()
+
+    assert stream.getvalue() == "hello world"
+    assert stream.writes == 2
+
+def test_output_channel_flushes_on_newline():
+    stream = io.StringIO()
+    channel = OutputChannel(stream, flush_on_newline=True)
+
+    for byte in b"ok\nBYE":
+        channel.write(byte)
+
+    assert stream.getvalue() == "ok\n"
+
+def test_output_channel_writes_raw_bytes_to_binary_buffer():
+    stream = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+    channel = OutputChannel(stream)
+
+    stream.write("é")
+    channel.write(0xE9)
+    channel.flush()
+
+    assert stream.buffer.getvalue() == "é".encode("utf-8") + b"\xe9"
+
+def test_output_channel_flushes_before_waiting_for_input():
+    read_fd, write_fd = os.pipe()
+    stream = io.StringIO()
+    channel = OutputChannel(stream)
+    with open(read_fd) as input_stream, open(write_fd, "w") as output:
+        output.write("x")
+        output.flush()
+        channel.write(ord("a"))
+        channel.before_input(input_stream)
+        assert stream.getvalue() == ""
+        input_stream.read(1)
+        channel.before_input(input_stream)
+        assert stream.getvalue() == "a"
+
+def test_output_channel_flushes_when_select_fails(monkeypatch):
+    def failing_select(*args):
+        raise OSError("select only works on sockets")
+
+    read_fd, write_fd = os.pipe()
+    os.close(write_fd)
+    stream = io.StringIO()
+    channel = OutputChannel(stream)
+    monkeypatch.setattr(select, "select", failing_select)
+    with open(read_fd) as input_stream:
+        channel.write(ord("a"))
+        channel.before_input(input_stream)
+
+    assert stream.getvalue() == "a"
+
+def test_output_channel_flushes_on_timer():
+    stream = io.StringIO()
+    channel = OutputChannel(stream, flush_interval=0.01)
+
+    channel.write(ord("a"))
+    assert stream.getvalue() == ""
+    channel.timer.join(5)
+
+    assert stream.getvalue() == "a"
+    assert channel.timer is None
+
+def test_output_channel_flush_cancels_timer():
+    stream = CountingStream()
+    channel = OutputChannel(stream, flush_interval=60)
+
+    channel.write(ord("a"))
+    timer = channel.timer
+    channel.flush()
+
+    assert timer.finished.is_set()
+    assert channel.timer is None
+    assert stream.getvalue() == "a"
+    assert stream.writes == 1
+
+def test_tx_store_output_is_flushed_by_bye(interpreter):
+    interpreter.output_stream = CountingStream()
+    for character in "ok":
+        interpreter.push_on_data_stack(ord(character))
+        interpreter.get_primitive_by_name("TX!").dispatch(interpreter)
+    assert interpreter.output_stream.getvalue() == ""
+
+    interpreter.get_primitive_by_name("BYE").dispatch(interpreter)
+
+    assert interpreter.output_stream.getvalue() == "ok"
+    assert interpreter.output_stream.writes == 1
+
+def test_memory_write_bytes_triggers_write_barriers():
+    memory = Memory(16)
+    written = []
+    memory.watch(5, written.append)
+    memory.watch(12, written.append)
+
+    memory.write_bytes(4, b"abc")
+
+    assert bytes(memory[4:7]) == b"abc"
+    assert written == [5]
+    with pytest.raises(IndexError):
+        memory.write_bytes(15, b"ab")
+
+def test_memory_view_reads_without_copy():
+    memory = Memory(16)
+    memory.write_bytes(4, b"abc")
+
+    with memory.view(4, 3) as view:
+        assert view == b"abc"
+        memory[5] = ord("x")
+        assert view.tobytes() == b"axc"
+    with pytest.raises(IndexError):
+        memory.view(15, 2)
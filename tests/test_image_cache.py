@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from forthpie import model
+from forthpie.forth import Memory
+from forthpie.compiler import CompilerMetadata, WordMetaData
+from forthpie.image_file import ImageFile
+from forthpie.image_cache import ImageCache
+import forthpie.eforth.eforth16bits as eforth16bits
+
+def an_image(value):
+    memory = Memory(16)
+    memory.write_cell(0, 2, value)
+    compiler_metadata = CompilerMetadata(8)
+    compiler_metadata.add_word_meta(WordMetaData("FOO", 2, 10))
+    return ImageFile(memory, 2, [("code", 0, 16)], compiler_metadata=compiler_metadata)
+
+def test_image_cache_returns_copies():
+    cache = ImageCache([model])
+    key = cache.key(superinstructions=False)
+    image = an_image(42)
+    cache.put(key, image)
+    image.memory.write_cell(0, 2, 1)
+
+    cached = cache.get(key)
+    cached.memory.write_cell(0, 2, 2)
+    cached.compiler_metadata.add_word_meta(WordMetaData("BAR", 12, 14))
+
+    assert cache.get(key).memory.read_cell(0, 2) == 42
+    assert len(cache.get(key).compiler_metadata.words_metadata) == 1
+
+def test_image_cache_keys():
+    cache = ImageCache([model])
+
+    assert cache.key(superinstructions=False) == ImageCache([model]).key(superinstructions=False)
+    assert cache.key(superinstructions=False) != cache.key(superinstructions=True)
+    assert cache.key(superinstructions=False) != ImageCache([model, eforth16bits]).key(superinstructions=False)
+    assert cache.get(cache.key(superinstructions=False)) is None
+
+def test_image_cache_evicts_least_recently_used():
+    cache = ImageCache([model], max_entries=2)
+    for value in range(3):
+        cache.put(cache.key(value=value), an_image(value))
+
+    assert cache.get(cache.key(value=0)) is None
+    assert cache.get(cache.key(value=1)).memory.read_cell(0, 2) == 1
+    cache.put(cache.key(value=3), an_image(3))
+    assert cache.get(cache.key(value=2)) is None
+    assert cache.get(cache.key(value=1)) is not None
+
+def test_image_cache_on_disk(tmp_path):
+    cache = ImageCache([model], directory=tmp_path)
+    cache.put(cache.key(value=42), an_image(42))
+
+    cached = ImageCache([model], directory=tmp_path).get(cache.key(value=42))
+
+    assert cached.memory.read_cell(0, 2) == 42
+    assert cached.compiler_metadata.word_address_belongs_to(6).name == "FOO"
+
+def test_image_cache_evicts_least_recently_used_files(tmp_path):
+    cache = ImageCache([model], directory=tmp_path, max_entries=0, max_files=2)
+    for value in range(3):
+        cache.put(cache.key(value=value), an_image(value))
+
+    assert cache.get(cache.key(value=0)) is None
+    assert cache.get(cache.key(value=1)) is not None
+    cache.put(cache.key(value=3), an_image(3))
+    assert cache.get(cache.key(value=2)) is None
+    assert cache.get(cache.key(value=1)) is not None
+    assert len(list(tmp_path.glob("*.image"))) == 2
+
+@pytest.mark.parametrize("truncated_to", [0, 5, 20, -3])
+def test_image_cache_drops_corrupt_files(tmp_path, truncated_to):
+    cache = ImageCache([model], directory=tmp_path, max_entries=0)
+    key = cache.key(value=42)
+    cache.put(key, an_image(42))
+    file_path = cache.file_path(key)
+    file_path.write_bytes(file_path.read_bytes()[:truncated_to])
+
+    assert cache.get(key) is None
+    assert not file_path.exists()
+    cache.put(key, an_image(42))
+    assert cache.get(key).memory.read_cell(0, 2) == 42
+
+def test_bootstrap_cache_is_in_process_by_default():
+    environment = {name: value for name, value in os.environ.items() if name != "FORTHPIE_CACHE_DIR"}
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import forthpie.eforth.eforth16bits as e; print(e.BOOTSTRAP_CACHE.directory)"],
+        env=environment, capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "None"
+
+@pytest.mark.parametrize("superinstructions", [False, True])
+def test_cached_bootstrap_is_the_compiled_one(tmp_path, superinstructions):
+    cache = ImageCache(eforth16bits.BOOTSTRAP_CACHE.modules, directory=tmp_path)
+    compiled = eforth16bits.bootstrap_16bits_eforth(superinstructions, cache=None)
+
+    eforth16bits.bootstrap_16bits_eforth(superinstructions, cache=cache)
+    cached = eforth16bits.bootstrap_16bits_eforth(superinstructions, cache=cache)
+
+    assert cached.memory[:] == compiled.memory[:]
+    assert cached.code_address == compiled.code_address
+    assert cached.name_address == compiled.name_address
+    assert cached.user_address == compiled.user_address
+    assert cached.lookup_word(model.WR("DUP")) == compiled.lookup_word(model.WR("DUP"))
+    assert cached.compiler_metadata.last().name == compiled.compiler_metadata.last().name
@@ -0,0 +1,55 @@
+import pytest
+
+from forthpie.forth import Memory, CheckedMemory
+from forthpie.compiler import CompilerMetadata, WordMetaData
+from forthpie.image_file import ImageFile, NotAnImageFile, is_image_file
+
+@pytest.fixture
+def image():
+    memory = Memory(64)
+    memory.write_cell(0, 2, 0x1234)
+    memory.write_cell(40, 2, 0xABCD)
+    compiler_metadata = CompilerMetadata(8)
+    compiler_metadata.user_address = 12
+    compiler_metadata.add_word_meta(WordMetaData("FOO", 2, 10))
+    yield ImageFile(
+        memory,
+        2,
+        [("code", 0, 32), ("heap", 32, 64)],
+        registers={"ip": 4, "sp": 30, "rp": 60},
+        layout={"EM": 64},
+        compiler_metadata=compiler_metadata
+    )
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_image_file_round_trip(tmp_path, image, compress):
+    image.save(tmp_path / "image", compress=compress)
+
+    loaded = ImageFile.from_file(tmp_path / "image")
+
+    assert loaded.memory[:] == image.memory[:]
+    assert loaded.cell_size == 2
+    assert loaded.sections == [("code", 0, 32), ("heap", 32, 64)]
+    assert loaded.registers == {"ip": 4, "sp": 30, "rp": 60}
+    assert loaded.layout == {"EM": 64}
+    assert loaded.compiler_metadata.user_address == 12
+    assert loaded.compiler_metadata.word_address_belongs_to(6).name == "FOO"
+
+def test_image_file_memory_class(tmp_path, image):
+    image.save(tmp_path / "image")
+
+    assert isinstance(ImageFile.from_file(tmp_path / "image", CheckedMemory).memory, CheckedMemory)
+
+def test_image_file_trailing_zeros_are_not_stored(tmp_path, image):
+    image.save(tmp_path / "image", compress=False)
+    image.memory.write_cell(62, 2, 1)
+    image.save(tmp_path / "bigger_image", compress=False)
+
+    assert (tmp_path / "bigger_image").stat().st_size - (tmp_path / "image").stat().st_size == (62 + 1) - (40 + 2)
+
+def test_raw_memory_is_not_an_image_file(tmp_path, image):
+    image.memory.save(tmp_path / "raw")
+
+    assert not is_image_file(tmp_path / "raw")
+    with pytest.raises(NotAnImageFile):
+        ImageFile.from_file(tmp_path / "raw")
@@ -0,0 +1,35 @@
+import pytest
+
+from forthpie.module_file import ModuleFile, NotAModuleFile
+
+@pytest.fixture
+def module():
+    yield ModuleFile(
+        2,
+        {"code_pointer": 0x180, "name_pointer": 0x3B00, "names_digest": "00"},
+        bytes([5, 0, 0x82, 0x01]),
+        bytes([0x80, 0x01, 0x04, 0x3B, 3, ord("F"), ord("O"), ord("O")]),
+        relocations=[("code", 2, "code"), ("names", 0, "code"), ("names", 2, "last")],
+        patches=[("memory", 0x27C, 0x3AFC, "names"), ("user", 24, 16, None)],
+        symbols=[("FOO", 0, 2)]
+    )
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_module_file_round_trip(tmp_path, module, compress):
+    module.save(tmp_path / "module.fo", compress=compress)
+
+    loaded = ModuleFile.from_file(tmp_path / "module.fo")
+
+    assert loaded.cell_size == 2
+    assert loaded.base == module.base
+    assert loaded.code == module.code
+    assert loaded.names == module.names
+    assert loaded.relocations == module.relocations
+    assert loaded.patches == module.patches
+    assert loaded.symbols == module.symbols
+
+def test_image_is_not_a_module_file(tmp_path):
+    (tmp_path / "image").write_bytes(b"FPIE" + bytes(16))
+
+    with pytest.raises(NotAModuleFile):
+        ModuleFile.from_file(tmp_path / "image")